@@ -1,19 +1,35 @@
 import os
 import json
+import base64
 import sqlite3
 import hashlib
-import io
 import logging
-import pandas as pd
-from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, send_file, send_from_directory
+import threading
+import time
+import uuid
+import atexit
+import multiprocessing
+import tempfile
+import itertools
+from datetime import datetime, timedelta, timezone
+from urllib.parse import quote
+from flask import Flask, Response, request, jsonify, send_file, send_from_directory
 from werkzeug.utils import secure_filename
+from werkzeug.http import is_resource_modified
 from paddleocr import PaddleOCR
-from pdf2image import convert_from_path
-import re
-from PIL import Image
-from functools import wraps
 from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from jobs import JobQueue, QueueFullError
+from scheduler import PeriodicTask
+from db import ConnectionPool
+from repository import SqliteInvoiceRepository, INVOICE_SORT_COLUMNS, EXPORT_COLUMNS, bad_plan_steps
+from exporter import EXPORT_MIMETYPES, csv_chunks, write_xlsx
+from export_cache import ExportCache
+from pdf_utils import extract_text_lines, render_page, to_ocr_array
+from ocr_cache import OcrCache
+from ocr_pool import OcrPool, scored_lines
+from invoice_templates import MAX_REGIONS, match_template, crop_regions, region_lines
+from field_extractor import invoice_extractor
 
 # 配置日志
 logging.basicConfig(
@@ -31,9 +47,108 @@ app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['ALLOWED_EXTENSIONS'] = {'pdf'}
 app.config['PRELOAD_OCR'] = os.environ.get('PRELOAD_OCR', 'false').lower() == 'true'
+# 异步识别：上传请求只保存文件并入队，由后台线程完成 OCR
+app.config['ASYNC_UPLOAD'] = os.environ.get('ASYNC_UPLOAD', 'false').lower() == 'true'
+app.config['OCR_JOB_WORKERS'] = int(os.environ.get('OCR_JOB_WORKERS', 2))
+app.config['OCR_JOB_QUEUE_SIZE'] = int(os.environ.get('OCR_JOB_QUEUE_SIZE', 100))
+app.config['OCR_RETRY_AFTER'] = int(os.environ.get('OCR_RETRY_AFTER', 10))
+# 电子发票优先读取 PDF 文本层，失败再走 OCR
+app.config['TEXT_LAYER_FIRST'] = os.environ.get('TEXT_LAYER_FIRST', 'true').lower() == 'true'
+# 批量上传：并发栅格化线程数、每批 OCR 图片数
+app.config['BATCH_RASTER_WORKERS'] = int(os.environ.get('BATCH_RASTER_WORKERS', os.cpu_count() or 4))
+app.config['OCR_BATCH_SIZE'] = int(os.environ.get('OCR_BATCH_SIZE', 8))
+# 识别结果缓存：按文件哈希保存，超过条数、总大小（MB，0 表示不限制）或有效期自动清理
+app.config['OCR_CACHE_ENABLED'] = os.environ.get('OCR_CACHE_ENABLED', 'true').lower() == 'true'
+app.config['OCR_CACHE_MAX_ENTRIES'] = int(os.environ.get('OCR_CACHE_MAX_ENTRIES', 10000))
+app.config['OCR_CACHE_MAX_MB'] = int(os.environ.get('OCR_CACHE_MAX_MB', 256))
+app.config['OCR_CACHE_MAX_AGE_DAYS'] = int(os.environ.get('OCR_CACHE_MAX_AGE_DAYS', 90))
+# 多进程 OCR：每个进程启动时预加载模型；设为 0 时退回 Web 进程内的单实例识别。
+# 每个进程的推理线程数为 OCR_CPU_THREADS，默认进程数取 CPU 核数 / OCR_CPU_THREADS，避免线程总数超过核数
+app.config['OCR_CPU_THREADS'] = max(1, int(os.environ.get('OCR_CPU_THREADS', 1)))
+app.config['OCR_WORKER_PROCESSES'] = int(os.environ.get(
+    'OCR_WORKER_PROCESSES', max(1, (os.cpu_count() or 1) // app.config['OCR_CPU_THREADS'])))
+app.config['OCR_POOL_QUEUE_SIZE'] = int(os.environ.get('OCR_POOL_QUEUE_SIZE', 64))
+app.config['OCR_WORKER_MAX_JOBS'] = int(os.environ.get('OCR_WORKER_MAX_JOBS', 500))
+app.config['OCR_WORKER_MAX_RSS_MB'] = int(os.environ.get('OCR_WORKER_MAX_RSS_MB', 4096))
+app.config['OCR_TIMEOUT'] = int(os.environ.get('OCR_TIMEOUT', 120))
+# 按发票版式模板只识别关键区域，模板不匹配或字段缺失时退回整页识别
+app.config['OCR_ROI_ENABLED'] = os.environ.get('OCR_ROI_ENABLED', 'true').lower() == 'true'
+# 栅格化参数；自适应模式先用 RASTER_LOW_DPI 渲染，字段缺失或置信度低于
+# RASTER_MIN_CONFIDENCE 时再用 RASTER_DPI 重新渲染识别
+app.config['RASTER_DPI'] = int(os.environ.get('RASTER_DPI', 200))
+app.config['RASTER_GRAYSCALE'] = os.environ.get('RASTER_GRAYSCALE', 'false').lower() == 'true'
+app.config['RASTER_THREAD_COUNT'] = int(os.environ.get('RASTER_THREAD_COUNT', 1))
+app.config['RASTER_ADAPTIVE'] = os.environ.get('RASTER_ADAPTIVE', 'false').lower() == 'true'
+app.config['RASTER_LOW_DPI'] = int(os.environ.get('RASTER_LOW_DPI', 120))
+app.config['RASTER_MIN_CONFIDENCE'] = float(os.environ.get('RASTER_MIN_CONFIDENCE', 0.85))
+# SQLite：连接池复用连接，WAL 模式下读写互不阻塞
+app.config['DATABASE'] = os.environ.get('DATABASE', 'invoices.db')
+app.config['SQLITE_POOL_SIZE'] = int(os.environ.get('SQLITE_POOL_SIZE', 8))
+app.config['SQLITE_JOURNAL_MODE'] = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+app.config['SQLITE_SYNCHRONOUS'] = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+app.config['SQLITE_CACHE_SIZE_KB'] = int(os.environ.get('SQLITE_CACHE_SIZE_KB', 65536))
+app.config['SQLITE_MMAP_SIZE'] = int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+app.config['SQLITE_TEMP_STORE'] = os.environ.get('SQLITE_TEMP_STORE', 'MEMORY')
+app.config['SQLITE_BUSY_TIMEOUT_MS'] = int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))
+# 搜索关键词使用 FTS5 全文索引（trigram 分词）
+app.config['SEARCH_FTS_ENABLED'] = os.environ.get('SEARCH_FTS_ENABLED', 'true').lower() == 'true'
+# 关键词命中超过该条数时不再按 bm25 排序全部命中，改用 LIKE 按上传时间倒序取前 100 条
+app.config['SEARCH_FTS_RANK_LIMIT'] = int(os.environ.get('SEARCH_FTS_RANK_LIMIT', 5000))
+# 回收站保留天数；后台每隔 RETENTION_INTERVAL 秒分批清理过期发票及其文件（0 表示不启动定时清理）
+app.config['RECYCLE_RETENTION_DAYS'] = int(os.environ.get('RECYCLE_RETENTION_DAYS', 30))
+app.config['RETENTION_INTERVAL'] = int(os.environ.get('RETENTION_INTERVAL', 3600))
+app.config['RETENTION_INITIAL_DELAY'] = int(os.environ.get('RETENTION_INITIAL_DELAY', 60))
+app.config['RETENTION_BATCH_SIZE'] = int(os.environ.get('RETENTION_BATCH_SIZE', 500))
+# 发票列表按游标分页，每页默认条数和上限
+app.config['INVOICE_PAGE_SIZE'] = int(os.environ.get('INVOICE_PAGE_SIZE', 50))
+app.config['INVOICE_PAGE_SIZE_MAX'] = int(os.environ.get('INVOICE_PAGE_SIZE_MAX', 200))
+# 导出时每次从数据库读取的行数
+app.config['EXPORT_BATCH_SIZE'] = int(os.environ.get('EXPORT_BATCH_SIZE', 1000))
+# 导出文件缓存目录及总大小上限（MB），超过时按最近使用时间淘汰；0 表示不缓存
+app.config['EXPORT_CACHE_DIR'] = os.environ.get('EXPORT_CACHE_DIR', 'export_cache')
+app.config['EXPORT_CACHE_MAX_MB'] = int(os.environ.get('EXPORT_CACHE_MAX_MB', 512))
+# 后台导出任务：工作线程数、队列长度；生成的文件保存在 EXPORT_JOB_DIR，任务结束 EXPORT_JOB_TTL 秒后过期，
+# 每隔 EXPORT_JOB_CLEAN_INTERVAL 秒删除过期文件
+app.config['EXPORT_JOB_WORKERS'] = int(os.environ.get('EXPORT_JOB_WORKERS', 1))
+app.config['EXPORT_JOB_QUEUE_SIZE'] = int(os.environ.get('EXPORT_JOB_QUEUE_SIZE', 20))
+app.config['EXPORT_JOB_DIR'] = os.environ.get('EXPORT_JOB_DIR', 'export_jobs')
+app.config['EXPORT_JOB_TTL'] = int(os.environ.get('EXPORT_JOB_TTL', 3600))
+app.config['EXPORT_JOB_CLEAN_INTERVAL'] = int(os.environ.get('EXPORT_JOB_CLEAN_INTERVAL', 600))
+# 上传文件一次读取即完成哈希和落盘，每次读取的块大小
+app.config['UPLOAD_CHUNK_SIZE'] = int(os.environ.get('UPLOAD_CHUNK_SIZE', 1024 * 1024))
+
+# 识别结果中必须具备的字段，缺失时文本层结果视为不可用
+REQUIRED_FIELDS = ('invoice_number', 'invoice_date', 'total_amount')
+# 字段提取规则版本，修改 parse_invoice_text 的规则时递增，使缓存结果重新解析
+EXTRACTOR_VERSION = 1
+
+OCR_KWARGS = {'use_textline_orientation': True, 'lang': 'ch'}
+
+# spawn 出的 OCR 子进程也会导入本模块；建表、预加载和后台定时任务只在主进程中执行
+IS_MAIN_PROCESS = multiprocessing.current_process().name == 'MainProcess'
 
 # Initialize PaddleOCR
 ocr = None
+# PaddleOCR 实例不支持并发调用，初始化和推理都需要加锁
+ocr_lock = threading.Lock()
+
+ocr_pool = None
+if app.config['OCR_WORKER_PROCESSES'] > 0:
+    ocr_pool = OcrPool(app.config['OCR_WORKER_PROCESSES'],
+                       max_queue=app.config['OCR_POOL_QUEUE_SIZE'],
+                       max_jobs=app.config['OCR_WORKER_MAX_JOBS'],
+                       max_rss_mb=app.config['OCR_WORKER_MAX_RSS_MB'],
+                       cpu_threads=app.config['OCR_CPU_THREADS'],
+                       ocr_kwargs=OCR_KWARGS)
+    atexit.register(ocr_pool.shutdown)
+
+ocr_jobs = JobQueue('ocr', workers=app.config['OCR_JOB_WORKERS'],
+                    maxsize=app.config['OCR_JOB_QUEUE_SIZE'])
+# 彻底删除发票后，PDF 文件在事务提交后由后台线程删除
+file_jobs = JobQueue('files', workers=1, maxsize=100)
+# 大批量导出在后台线程中生成文件，请求线程只负责提交和查询
+export_jobs = JobQueue('export', workers=app.config['EXPORT_JOB_WORKERS'],
+                       maxsize=app.config['EXPORT_JOB_QUEUE_SIZE'], ttl=app.config['EXPORT_JOB_TTL'])
 
 def allowed_file(filename):
     """检查文件扩展名是否允许"""
@@ -46,235 +161,389 @@ def validate_invoice_type(invoice_type):
     return invoice_type in valid_types if valid_types else True
 
 def init_ocr():
-    """初始化 OCR 引擎"""
+    """初始化 OCR 引擎；多进程模式下启动进程池，由各进程预加载模型"""
     global ocr
-    if ocr is None:
-        logger.info('正在初始化 PaddleOCR...')
-        ocr = PaddleOCR(use_textline_orientation=True, lang='ch')
-        logger.info('PaddleOCR 初始化完成')
+    if ocr_pool:
+        ocr_pool.start()
+        return ocr_pool
+    with ocr_lock:
+        if ocr is None:
+            logger.info('正在初始化 PaddleOCR...')
+            ocr = PaddleOCR(**OCR_KWARGS)
+            logger.info('PaddleOCR 初始化完成')
     return ocr
 
 # Ensure upload directory exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['EXPORT_JOB_DIR'], exist_ok=True)
+
+db_pool = ConnectionPool(app.config['DATABASE'],
+                         pool_size=app.config['SQLITE_POOL_SIZE'],
+                         journal_mode=app.config['SQLITE_JOURNAL_MODE'],
+                         synchronous=app.config['SQLITE_SYNCHRONOUS'],
+                         cache_size_kb=app.config['SQLITE_CACHE_SIZE_KB'],
+                         mmap_size=app.config['SQLITE_MMAP_SIZE'],
+                         temp_store=app.config['SQLITE_TEMP_STORE'],
+                         busy_timeout_ms=app.config['SQLITE_BUSY_TIMEOUT_MS'])
 
 # Database context manager
-@contextmanager
-def get_db_connection():
-    """数据库连接上下文管理器，确保连接正确关闭"""
-    conn = sqlite3.connect('invoices.db')
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-    finally:
-        conn.close()
+def get_db_connection(readonly=False):
+    """从连接池取出连接，用完自动归还；GET 接口传 readonly=True 使用只读连接"""
+    return db_pool.connection(readonly=readonly)
+
+invoice_repo = SqliteInvoiceRepository(get_db_connection, fts=app.config['SEARCH_FTS_ENABLED'],
+                                       fts_rank_limit=app.config['SEARCH_FTS_RANK_LIMIT'])
 
 # Database initialization
 def init_db():
-    conn = sqlite3.connect('invoices.db')
-    cursor = conn.cursor()
-    
-    # 创建主表
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS invoices (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT NOT NULL,
-            buyer_name TEXT NOT NULL,
-            invoice_number TEXT,
-            invoice_date TEXT,
-            total_amount TEXT,
-            invoice_content TEXT,
-            seller_name TEXT,
-            bank_name TEXT,
-            bank_account TEXT,
-            pdf_path TEXT,
-            file_hash TEXT,
-            created_at TEXT,
-            updated_at TEXT
-        )
-    ''')
-    
-    # 创建回收站表 (修复：添加 updated_at)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS recycle_bin (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            type TEXT NOT NULL,
-            buyer_name TEXT NOT NULL,
-            invoice_number TEXT,
-            invoice_date TEXT,
-            total_amount TEXT,
-            invoice_content TEXT,
-            seller_name TEXT,
-            bank_name TEXT,
-            bank_account TEXT,
-            pdf_path TEXT,
-            file_hash TEXT,
-            created_at TEXT,
-            updated_at TEXT,
-            deleted_at TEXT
-        )
-    ''')
-    
-    # 自动修复补丁 - 添加可能缺失的列
-    try: cursor.execute('ALTER TABLE invoices ADD COLUMN file_hash TEXT')
-    except sqlite3.OperationalError: pass
-    try: cursor.execute('ALTER TABLE invoices ADD COLUMN created_at TEXT')
-    except sqlite3.OperationalError: pass
-    try: cursor.execute('ALTER TABLE invoices ADD COLUMN updated_at TEXT')
-    except sqlite3.OperationalError: pass
-    
-    try: cursor.execute('ALTER TABLE recycle_bin ADD COLUMN file_hash TEXT')
-    except sqlite3.OperationalError: pass
-    try: cursor.execute('ALTER TABLE recycle_bin ADD COLUMN created_at TEXT')
-    except sqlite3.OperationalError: pass
-    # 核心修复：给回收站补上 updated_at
-    try: cursor.execute('ALTER TABLE recycle_bin ADD COLUMN updated_at TEXT')
-    except sqlite3.OperationalError: pass
-    
-    # 创建索引以提高查询性能
-    try: cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_type ON invoices(type)')
-    except sqlite3.OperationalError: pass
-    try: cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_invoice_number ON invoices(invoice_number)')
-    except sqlite3.OperationalError: pass
-    try: cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_file_hash ON invoices(file_hash)')
-    except sqlite3.OperationalError: pass
-    try: cursor.execute('CREATE INDEX IF NOT EXISTS idx_recycle_bin_type ON recycle_bin(type)')
-    except sqlite3.OperationalError: pass
-    
-    conn.commit()
-    conn.close()
+    db_pool.init_database()
+    invoice_repo.init_schema()
+    with get_db_connection() as conn:
+        cursor = conn.cursor()
+        
+        # 识别结果缓存
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS ocr_cache (
+                file_hash TEXT PRIMARY KEY,
+                lines TEXT NOT NULL,
+                invoice_data TEXT NOT NULL,
+                extract_method TEXT,
+                extractor_version INTEGER,
+                created_at REAL,
+                last_used_at REAL
+            )
+        ''')
+        try: cursor.execute('CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache(last_used_at)')
+        except sqlite3.OperationalError: pass
+        conn.commit()
     logger.info('数据库初始化完成')
 
-init_db()
+def ingest_upload(file):
+    """一次读取上传流：同时计算 MD5 并写入上传目录下的临时文件
+
+    返回 (临时文件路径, 哈希, 字节数)。临时文件与正式文件在同一目录，
+    确认入库时用 commit_upload 原子改名，重复或失败时用 discard_upload 删除。
+    """
+    tmp_path = os.path.join(app.config['UPLOAD_FOLDER'], f'.{uuid.uuid4().hex}.part')
+    md5 = hashlib.md5()
+    size = 0
+    chunk_size = app.config['UPLOAD_CHUNK_SIZE']
+    try:
+        with open(tmp_path, 'wb') as f:
+            while True:
+                chunk = file.stream.read(chunk_size)
+                if not chunk:
+                    break
+                md5.update(chunk)
+                f.write(chunk)
+                size += len(chunk)
+    except Exception:
+        discard_upload(tmp_path)
+        raise
+    return tmp_path, md5.hexdigest(), size
+
+def commit_upload(tmp_path, original_name):
+    """将临时文件改名为正式文件，返回 (文件名, 路径)
+
+    同一秒内可能提交多个同名文件（批量上传、强制重新上传），文件名中加入随机后缀，
+    避免 os.replace 覆盖另一条发票的 PDF。
+    """
+    filename = secure_filename(original_name)
+    timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
+    filename = f"{timestamp}_{uuid.uuid4().hex[:12]}_{filename}"
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    os.replace(tmp_path, filepath)
+    return filename, filepath
+
+def discard_upload(path):
+    if path and os.path.exists(path):
+        os.remove(path)
+
+def cleanup_partial_uploads(max_age=3600):
+    """清理进程异常退出时遗留的临时文件"""
+    cutoff = time.time() - max_age
+    for name in os.listdir(app.config['UPLOAD_FOLDER']):
+        path = os.path.join(app.config['UPLOAD_FOLDER'], name)
+        if name.endswith('.part') and os.path.getmtime(path) < cutoff:
+            discard_upload(path)
+
+if IS_MAIN_PROCESS:
+    init_db()
+    cleanup_partial_uploads()
 
 # 根据配置预加载 OCR
-if app.config['PRELOAD_OCR']:
+if app.config['PRELOAD_OCR'] and IS_MAIN_PROCESS:
     init_ocr()
 
-def get_file_hash(file_stream):
-    """计算文件的 MD5 哈希值"""
-    md5_hash = hashlib.md5()
-    for byte_block in iter(lambda: file_stream.read(4096), b""):
-        md5_hash.update(byte_block)
-    file_stream.seek(0)
-    return md5_hash.hexdigest()
+def ocr_images(images, block=False):
+    """批量 OCR，返回每张图片的 [(文本, 置信度)]
 
-def extract_invoice_info(image_path):
-    """Extract invoice information using OCR"""
-    ocr_engine = init_ocr()
+    多进程模式下图片分发到各个 OCR 进程并行识别，每轮最多提交进程池容量张，
+    等这一轮识别完再提交下一轮，图片数超过容量时不会在空闲的进程池上排队失败；
+    单进程模式下一次持有引擎连续识别（PaddleOCR 的检测阶段不接受图片列表，
+    行识别在引擎内部按 rec_batch_num 分批）。
+    """
+    if ocr_pool:
+        results = []
+        for start in range(0, len(images), ocr_pool.capacity):
+            futures = [ocr_pool.submit(image, block=block, timeout=app.config['OCR_TIMEOUT'])
+                       for image in images[start:start + ocr_pool.capacity]]
+            results.extend(future.result(timeout=app.config['OCR_TIMEOUT']) for future in futures)
+        return results
     
-    result = ocr_engine.ocr(image_path, cls=True)
+    ocr_engine = init_ocr()
     
-    all_text = []
-    if result and result[0]:
-        for line in result[0]:
-            all_text.append(line[1][0])
+    with ocr_lock:
+        results = [ocr_engine.ocr(image, cls=True) for image in images]
     
-    full_text = ' '.join(all_text)
+    return [scored_lines(result) for result in results]
+
+def _mean_confidence(scores):
+    return sum(scores) / len(scores) if scores else 0.0
+
+def ocr_pages(images, block=False):
+    """识别整页图片，返回 [(invoice_data, lines, extract_method, confidence)]
+
+    启用 ROI 时先按版式模板只识别关键区域（extract_method 为 ocr_roi），
+    模板不匹配或必填字段缺失的页面再整页识别（ocr）。confidence 为各文本行
+    置信度的平均值。
+    """
+    results = [None] * len(images)
     
-    invoice_data = {
-        'invoice_number': '', 'invoice_date': '', 'total_amount': '', 
-        'invoice_content': '', 'seller_name': '', 'bank_name': '', 'bank_account': ''
-    }
+    if app.config['OCR_ROI_ENABLED']:
+        crops = []  # (页面序号, 区域, 裁剪图)
+        for index, image in enumerate(images):
+            template = match_template(image.shape[1], image.shape[0])
+            if template:
+                crops.extend((index, region, crop) for region, crop in crop_regions(image, template))
+        
+        page_lines, page_scores = {}, {}
+        if crops:
+            for (index, region, _), scored in zip(crops, ocr_images([crop for _, _, crop in crops], block=block)):
+                page_lines.setdefault(index, []).extend(region_lines(region, [text for text, _ in scored]))
+                page_scores.setdefault(index, []).extend(score for _, score in scored)
+        for index, lines in page_lines.items():
+            invoice_data = parse_invoice_text(lines)
+            if has_required_fields(invoice_data):
+                results[index] = (invoice_data, lines, 'ocr_roi', _mean_confidence(page_scores[index]))
+            else:
+                logger.info('ROI 识别缺少必填字段，改为整页识别')
     
-    # --- 1. 发票号码 (8-20位) ---
-    invoice_num_match = re.search(r'发票号码.*?(\d{8,20})', full_text)
-    if invoice_num_match:
-        invoice_data['invoice_number'] = invoice_num_match.group(1)
+    full_page = [index for index, result in enumerate(results) if result is None]
+    if full_page:
+        for index, scored in zip(full_page, ocr_images([images[index] for index in full_page], block=block)):
+            lines = [text for text, _ in scored]
+            results[index] = (parse_invoice_text(lines), lines, 'ocr',
+                              _mean_confidence([score for _, score in scored]))
     
-    # --- 2. 开票日期 ---
-    date_patterns = [
-        r'(\d{4}年\d{1,2}月\d{1,2}日)', r'(\d{8})',
-        r'开票日期.*?(\d{4}年\d{1,2}月\d{1,2}日)', r'开票日期.*?(\d{8})'
-    ]
-    for pattern in date_patterns:
-        date_match = re.search(pattern, full_text)
-        if date_match:
-            date_str = date_match.group(1).replace('年', '').replace('月', '').replace('日', '')
-            if len(date_str) == 7:
-                parts = re.findall(r'\d+', date_match.group(1))
-                if len(parts) == 3:
-                    date_str = f"{parts[0]}{parts[1].zfill(2)}{parts[2].zfill(2)}"
-            invoice_data['invoice_date'] = date_str
-            break
+    return results
+
+def raster_dpis():
+    """渲染分辨率序列：自适应模式先低分辨率，结果不可靠时再用标准分辨率"""
+    if app.config['RASTER_ADAPTIVE'] and app.config['RASTER_LOW_DPI'] < app.config['RASTER_DPI']:
+        return [app.config['RASTER_LOW_DPI'], app.config['RASTER_DPI']]
+    return [app.config['RASTER_DPI']]
+
+def is_reliable(page_result):
+    invoice_data, _, _, confidence = page_result
+    return has_required_fields(invoice_data) and confidence >= app.config['RASTER_MIN_CONFIDENCE']
+
+def ocr_adaptive(pdf_sources, images, block=False, timer=None):
+    """识别按首个分辨率渲染好的页面，不可靠的页面提高分辨率重新渲染识别
+
+    返回 [(invoice_data, lines, extract_method)]。
+    """
+    timer = timer or StageTimer()
+    dpis = raster_dpis()
     
-    # --- 3. 总金额 ---
-    amount_patterns = [
-        r'价税合计.*?¥\s*([\d,]+\.?\d*)', r'价税合计.*?([\d,]+\.?\d*)',
-        r'合计.*?¥\s*([\d,]+\.?\d*)', r'总金额.*?¥\s*([\d,]+\.?\d*)'
-    ]
-    for pattern in amount_patterns:
-        amount_match = re.search(pattern, full_text)
-        if amount_match:
-            invoice_data['total_amount'] = amount_match.group(1).replace(',', '')
-            break
+    with timer.stage('ocr'):
+        results = ocr_pages(images, block=block)
     
-    # --- 4. 发票内容 (修复：只取*号中间的内容及紧跟的文字) ---
-    # 逻辑：寻找 *xxx*yyyy 格式，或者 "名称" 后面紧跟的非表头文字
-    content_patterns = [
-        r'(\*[\u4e00-\u9fa5]+\*[^\s\d¥*]+)', # 优先匹配 *分类*商品名，例如 *生物化学制品*试剂
-        r'(\*[\u4e00-\u9fa5]+\*)',         # 如果没有商品名，至少匹配 *生物化学制品*
-        r'货物或应税劳务名称.*?[:：]?\s*([^\d¥\s]+)(?=\s)', 
-        r'项目名称.*?[:：]?\s*([^\d¥\s]+)(?=\s)'
-    ]
-    for pattern in content_patterns:
-        content_match = re.search(pattern, full_text)
-        if content_match:
-            content = content_match.group(1).strip()
-            # 再次检查，如果抓到了“规格”、“单位”等表头，说明抓错了，跳过
-            if "规格" not in content and "单价" not in content and "单位" not in content and "数量" not in content:
-                invoice_data['invoice_content'] = content
-                break
-    
-    # --- 5. 销售方名称 (修复：更严格的截止词) ---
-    # 逻辑：先定位到“销售方”，然后找“名称”，然后抓取公司名，遇到“买方”、“统一”、“纳税人”等立刻停止
-    seller_patterns = [
-        # 尝试匹配：销售方...名称：xxx公司
-        r'销售方.*?名称[:：]?\s*([\u4e00-\u9fa5]+(?:公司|中心|厂|店|行))',
-        # 尝试匹配：销售方...名称：xxx (直到遇到干扰词)
-        r'销售方.*?名称[:：]?\s*([^\s]+)(?=\s+(?:买方|名称|纳税人|统一|地址|电话|注|开户|银行)|$)'
-    ]
-    for pattern in seller_patterns:
-        seller_match = re.search(pattern, full_text)
-        if seller_match:
-            name = seller_match.group(1).strip()
-            # 清洗前面的干扰词 (比如 OCR 把 "信" 字也识别进来了)
-            name = re.sub(r'^[^\u4e00-\u9fa5]+', '', name) # 去掉开头非汉字字符
-            if len(name) > 4: # 公司名通常大于4个字
-                invoice_data['seller_name'] = name
-                break
-            
-    # --- 6. 银行信息 (修复：遇到分号或“账号”立即停止) ---
-    bank_patterns = [
-        # 匹配 开户行... 之后的文字，直到遇到 ; ； 账号 银行账号 或行尾
-        r'开户(?:银行|行)[:：]?\s*([^\s;；]+)(?=\s*[;；]|\s+(?:银行)?账号|$)',
-    ]
-    for pattern in bank_patterns:
-        bank_match = re.search(pattern, full_text)
-        if bank_match:
-            bank = bank_match.group(1).strip()
-            # 清理可能残留的尾部标点
-            bank = re.sub(r'[;；:：]+$', '', bank)
-            invoice_data['bank_name'] = bank
-            break
-            
-    # --- 7. 银行账号 ---
-    account_patterns = [r'(?:银行)?账号[:：]?\s*(\d{10,30})']
-    for pattern in account_patterns:
-        account_match = re.search(pattern, full_text)
-        if account_match:
-            invoice_data['bank_account'] = account_match.group(1).strip()
+    for dpi in dpis[1:]:
+        retry = [index for index, result in enumerate(results) if not is_reliable(result)]
+        if not retry:
             break
+        logger.info(f'{len(retry)} 个页面识别结果不可靠，以 {dpi} DPI 重新识别')
+        with timer.stage('render'):
+            with ThreadPoolExecutor(max_workers=min(len(retry), app.config['BATCH_RASTER_WORKERS'])) as executor:
+                retry_images = list(executor.map(lambda index: rasterize_pdf(pdf_sources[index], dpi), retry))
+        with timer.stage('ocr'):
+            for index, result in zip(retry, ocr_pages(retry_images, block=block)):
+                results[index] = result
     
-    return invoice_data
+    return [(invoice_data, lines, extract_method) for invoice_data, lines, extract_method, _ in results]
+
+def has_required_fields(invoice_data):
+    """发票号码、开票日期、金额是否都已识别"""
+    return all(invoice_data[key] for key in REQUIRED_FIELDS)
+
+def parse_invoice_text(all_text):
+    """从文本行（OCR 或 PDF 文本层）中提取发票字段，规则见 field_extractor.py"""
+    return invoice_extractor.extract(' '.join(all_text))
+
+ocr_cache = OcrCache(get_db_connection, parse_invoice_text, EXTRACTOR_VERSION,
+                     max_entries=app.config['OCR_CACHE_MAX_ENTRIES'],
+                     max_bytes=app.config['OCR_CACHE_MAX_MB'] * 1024 * 1024,
+                     max_age_days=app.config['OCR_CACHE_MAX_AGE_DAYS'])
+
+export_cache = None
+if app.config['EXPORT_CACHE_MAX_MB'] > 0:
+    export_cache = ExportCache(app.config['EXPORT_CACHE_DIR'], app.config['EXPORT_CACHE_MAX_MB'] * 1024 * 1024)
 
 @app.route('/')
 def index():
     return send_file('static/index.html')
 
+class StageTimer:
+    """记录上传各阶段耗时（毫秒）"""
+    
+    def __init__(self):
+        self.timings = {}
+    
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = (time.perf_counter() - start) * 1000
+            self.timings[name] = round(self.timings.get(name, 0) + elapsed, 1)
+
+def extract_from_text_layer(pdf_source):
+    """尝试从 PDF 文本层提取发票信息
+
+    返回 (invoice_data, lines)；没有文本层或必填字段不全时 invoice_data 为 None。
+    """
+    if not app.config['TEXT_LAYER_FIRST']:
+        return None, None
+    
+    lines = [line['text'] for line in extract_text_lines(pdf_source)]
+    if lines:
+        invoice_data = parse_invoice_text(lines)
+        if has_required_fields(invoice_data):
+            return invoice_data, lines
+        logger.info('文本层缺少必填字段，改用 OCR')
+    return None, None
+
+def rasterize_pdf(pdf_source, dpi=None):
+    """在内存中渲染 PDF 第一页，返回可直接送入 OCR 的 ndarray"""
+    image = render_page(pdf_source, dpi=dpi or raster_dpis()[0],
+                        grayscale=app.config['RASTER_GRAYSCALE'],
+                        thread_count=app.config['RASTER_THREAD_COUNT'])
+    return to_ocr_array(image)
+
+def get_cached_result(file_hash):
+    if not (file_hash and app.config['OCR_CACHE_ENABLED']):
+        return None
+    return ocr_cache.get(file_hash)
+
+def cache_result(file_hash, lines, invoice_data, extract_method):
+    if not (file_hash and app.config['OCR_CACHE_ENABLED']):
+        return
+    try:
+        ocr_cache.put(file_hash, lines, invoice_data, extract_method)
+    except sqlite3.Error as e:
+        # 缓存写入失败不影响上传
+        logger.warning(f'写入识别缓存失败: {str(e)}')
+
+def ocr_pdf(pdf_source, timer=None, file_hash=None, block=False):
+    """识别 PDF 第一页的发票信息，返回 (invoice_data, extract_method)
+
+    pdf_source 可以是 PDF 字节或路径。传入 file_hash 时先查识别缓存；
+    电子发票优先读取 PDF 文本层；没有文本层或缺少必填字段时再走
+    栅格化 + OCR，图片不落盘。
+    """
+    timer = timer or StageTimer()
+    
+    with timer.stage('cache'):
+        cached = get_cached_result(file_hash)
+    if cached:
+        return cached['invoice_data'], cached['extract_method']
+    
+    with timer.stage('text_layer'):
+        invoice_data, lines = extract_from_text_layer(pdf_source)
+    if invoice_data:
+        cache_result(file_hash, lines, invoice_data, 'text_layer')
+        return invoice_data, 'text_layer'
+    
+    with timer.stage('render'):
+        image = rasterize_pdf(pdf_source)
+    invoice_data, lines, extract_method = ocr_adaptive([pdf_source], [image], block=block, timer=timer)[0]
+    cache_result(file_hash, lines, invoice_data, extract_method)
+    return invoice_data, extract_method
+
+def prepare_pdf(pdf_source):
+    """批量上传的并发阶段：先读文本层，读不到再栅格化
+
+    返回 (invoice_data, lines, None) 或 (None, None, image)。
+    """
+    invoice_data, lines = extract_from_text_layer(pdf_source)
+    if invoice_data:
+        return invoice_data, lines, None
+    return None, None, rasterize_pdf(pdf_source)
+
+def queue_full_response(message='识别队列已满，请稍后重试'):
+    """任务队列已满：返回 429 并提示客户端稍后重试"""
+    response = jsonify({'error': message})
+    response.headers['Retry-After'] = str(app.config['OCR_RETRY_AFTER'])
+    return response, 429
+
+def duplicate_file_response():
+    return {
+        'warning': 'duplicate_file',
+        'message': '该发票文件已经上传过，是否继续上传？'
+    }
+
+def duplicate_number_response(invoice_number):
+    return {
+        'warning': 'duplicate_number',
+        'message': f"发票号码 {invoice_number} 已经存在，是否继续上传？"
+    }
+
+def process_upload_job(job, tmp_path, original_name, file_hash, invoice_type, buyer_name, force_upload):
+    """后台 OCR 任务：识别 -> 号码查重 -> 保存文件并入库"""
+    timer = StageTimer()
+    filepath = None
+    try:
+        invoice_data, extract_method = ocr_pdf(tmp_path, timer, file_hash, block=True)
+        
+        with invoice_repo.connection() as conn:
+            if not force_upload:
+                # 排队期间可能已有相同文件入库，入库前再次查重
+                duplicate = None
+                if invoice_repo.has_file_hash(file_hash, conn):
+                    duplicate = duplicate_file_response()
+                elif invoice_repo.has_invoice_number(invoice_data['invoice_number'], conn):
+                    duplicate = duplicate_number_response(invoice_data['invoice_number'])
+                if duplicate:
+                    discard_upload(tmp_path)
+                    job.status = 'duplicate'
+                    return dict(duplicate, invoice_data=invoice_data, extract_method=extract_method,
+                                timings=timer.timings)
+            
+            with timer.stage('db'):
+                filename, filepath = commit_upload(tmp_path, original_name)
+                invoice_id = invoice_repo.insert(invoice_type, buyer_name, invoice_data, filename,
+                                                 file_hash, extract_method, conn=conn)
+                conn.commit()
+        
+        return {'success': True, 'message': '发票上传成功', 'id': invoice_id,
+                'invoice_data': invoice_data, 'extract_method': extract_method, 'timings': timer.timings}
+    
+    except Exception:
+        discard_upload(tmp_path)
+        discard_upload(filepath)
+        raise
+
+@app.route('/api/upload/limits', methods=['GET'])
+def get_upload_limits():
+    """上传请求的大小上限，前端据此把批量上传拆分成多个请求"""
+    return jsonify({'success': True, 'data': {'max_request_bytes': app.config['MAX_CONTENT_LENGTH']}})
+
 @app.route('/api/upload', methods=['POST'])
 def upload_invoice():
+    tmp_path = None
     filepath = None
-    img_path = None
     
     try:
         if 'file' not in request.files:
@@ -284,6 +553,7 @@ def upload_invoice():
         invoice_type = request.form.get('type')
         buyer_name = request.form.get('buyer_name', '').strip()
         force_upload = request.form.get('force') == 'true'
+        async_mode = request.form.get('async', 'true' if app.config['ASYNC_UPLOAD'] else 'false') == 'true'
         
         if file.filename == '':
             return jsonify({'error': '没有选择文件'}), 400
@@ -291,326 +561,699 @@ def upload_invoice():
         if not (file and file.filename.lower().endswith('.pdf')):
             return jsonify({'error': '请上传PDF文件'}), 400
         
-        file_hash = get_file_hash(file.stream)
+        timer = StageTimer()
+        with timer.stage('ingest'):
+            tmp_path, file_hash, size = ingest_upload(file)
+        if not size:
+            discard_upload(tmp_path)
+            return jsonify({'error': '文件为空'}), 400
         
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            if not force_upload:
-                cursor.execute('SELECT id FROM invoices WHERE file_hash = ?', (file_hash,))
-                if cursor.fetchone():
-                    return jsonify({
-                        'warning': 'duplicate_file',
-                        'message': '该发票文件已经上传过，是否继续上传？'
-                    }), 409
-
-            filename = secure_filename(file.filename)
-            timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
-            filename = f"{timestamp}_{filename}"
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+        with invoice_repo.connection() as conn:
+            if not force_upload and invoice_repo.has_file_hash(file_hash, conn):
+                discard_upload(tmp_path)
+                return jsonify(duplicate_file_response()), 409
             
-            images = convert_from_path(filepath, first_page=1, last_page=1)
-            if not images:
-                raise ValueError('PDF 转换图片失败')
+            if async_mode:
+                # 临时文件交给后台任务，由任务决定保留还是删除
+                job = ocr_jobs.submit('upload', process_upload_job, tmp_path, file.filename, file_hash,
+                                      invoice_type, buyer_name, force_upload)
+                return jsonify({
+                    'success': True,
+                    'message': '发票已提交识别',
+                    'job_id': job.id,
+                    'status': job.status
+                }), 202
             
-            img_path = filepath.replace('.pdf', '.jpg')
-            images[0].save(img_path, 'JPEG')
+            invoice_data, extract_method = ocr_pdf(tmp_path, timer, file_hash)
             
-            invoice_data = extract_invoice_info(img_path)
-            os.remove(img_path)
-            img_path = None
+            if not force_upload and invoice_repo.has_invoice_number(invoice_data['invoice_number'], conn):
+                discard_upload(tmp_path)
+                return jsonify(duplicate_number_response(invoice_data['invoice_number'])), 409
             
-            if not force_upload and invoice_data['invoice_number']:
-                cursor.execute('SELECT id FROM invoices WHERE invoice_number = ?', (invoice_data['invoice_number'],))
-                if cursor.fetchone():
-                    os.remove(filepath)
-                    filepath = None
-                    return jsonify({
-                        'warning': 'duplicate_number',
-                        'message': f"发票号码 {invoice_data['invoice_number']} 已经存在，是否继续上传？"
-                    }), 409
-            
-            china_time = (datetime.utcnow() + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S')
-
-            cursor.execute('''
-                INSERT INTO invoices (type, buyer_name, invoice_number, invoice_date, 
-                                    total_amount, invoice_content, seller_name, 
-                                    bank_name, bank_account, pdf_path, file_hash, created_at, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (invoice_type, buyer_name, invoice_data['invoice_number'],
-                  invoice_data['invoice_date'], invoice_data['total_amount'],
-                  invoice_data['invoice_content'], invoice_data['seller_name'],
-                  invoice_data['bank_name'], invoice_data['bank_account'], 
-                  filename, file_hash, china_time, china_time))
-            conn.commit()
+            # 只有最终归档的 PDF 才改名为正式文件
+            with timer.stage('save'):
+                filename, filepath = commit_upload(tmp_path, file.filename)
+            with timer.stage('db'):
+                invoice_repo.insert(invoice_type, buyer_name, invoice_data, filename, file_hash, extract_method,
+                                    conn=conn)
+                conn.commit()
             
+            logger.info(f'上传耗时({extract_method}): {timer.timings}')
             return jsonify({
                 'success': True,
                 'message': '发票上传成功',
-                'data': invoice_data
+                'data': invoice_data,
+                'extract_method': extract_method,
+                'timings': timer.timings
             })
     
+    except QueueFullError:
+        discard_upload(tmp_path)
+        return queue_full_response()
+    
     except Exception as e:
-        # 清理已保存的文件
-        if filepath and os.path.exists(filepath):
-            os.remove(filepath)
-        if img_path and os.path.exists(img_path):
-            os.remove(img_path)
+        # 清理临时文件和已保存的文件
+        discard_upload(tmp_path)
+        discard_upload(filepath)
         logger.error(f'上传失败: {str(e)}')
         return jsonify({'error': f'上传失败: {str(e)}'}), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """查询后台识别任务状态"""
+    job = ocr_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    data = job.to_dict()
+    result = data.pop('result') or {}
+    data['invoice_data'] = result.get('invoice_data')
+    data['extract_method'] = result.get('extract_method')
+    data['timings'] = result.get('timings')
+    if job.status == 'duplicate':
+        data['warning'] = result.get('warning')
+        data['message'] = result.get('message')
+    elif job.status == 'done':
+        data['invoice_id'] = result.get('id')
+    
+    return jsonify({'success': True, 'data': data})
+
+@app.route('/api/ocr-cache', methods=['GET'])
+def get_ocr_cache_stats():
+    """识别缓存统计：条目数、占用大小、命中 / 未命中次数"""
+    try:
+        return jsonify({'success': True, 'data': ocr_cache.stats()})
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+
+@app.route('/api/export-cache', methods=['GET'])
+def get_export_cache_stats():
+    """导出缓存统计：文件数、占用大小、命中 / 未命中次数"""
+    if not export_cache:
+        return jsonify({'success': True, 'data': {'max_bytes': 0}})
+    try:
+        return jsonify({'success': True, 'data': export_cache.stats()})
+    except Exception as e:
+        return jsonify({'error': f'查询失败: {str(e)}'}), 500
+
+@app.route('/api/ocr-pool', methods=['GET'])
+def get_ocr_pool_stats():
+    """OCR 进程池状态"""
+    if not ocr_pool:
+        return jsonify({'success': True, 'data': {'processes': 0}})
+    return jsonify({'success': True, 'data': ocr_pool.stats()})
+
+@app.route('/api/upload/batch', methods=['POST'])
+def upload_invoice_batch():
+    """批量上传：并发栅格化，分批 OCR，一次事务入库
+
+    返回结构与前端 showBatchReport 一致：
+    {'success': [{name, data}], 'duplicate': [{name, msg}], 'error': [{name, msg}]}
+    每一项都带有 index，对应请求中文件的顺序。
+    """
+    files = request.files.getlist('files')
+    invoice_type = request.form.get('type')
+    buyer_name = request.form.get('buyer_name', '').strip()
+    force_upload = request.form.get('force') == 'true'
+    
+    if not files:
+        return jsonify({'error': '没有上传文件'}), 400
+    
+    results = {'success': [], 'duplicate': [], 'error': []}
+    pending = []  # 通过文件查重、等待识别的文件
+    tmp_paths = []
+    saved_paths = []
+    seen_hashes = set()
+    timer = StageTimer()
+    
+    try:
+        with invoice_repo.connection() as conn:
+            # 1. 校验，一次读取完成哈希和临时落盘，做文件查重
+            with timer.stage('ingest'):
+                for index, file in enumerate(files):
+                    name = file.filename
+                    if not name or not name.lower().endswith('.pdf'):
+                        results['error'].append({'index': index, 'name': name, 'msg': '请上传PDF文件'})
+                        continue
+                    
+                    tmp_path, file_hash, size = ingest_upload(file)
+                    if not size:
+                        discard_upload(tmp_path)
+                        results['error'].append({'index': index, 'name': name, 'msg': '文件为空'})
+                        continue
+                    if not force_upload and (file_hash in seen_hashes or invoice_repo.has_file_hash(file_hash, conn)):
+                        discard_upload(tmp_path)
+                        duplicate = duplicate_file_response()
+                        results['duplicate'].append(dict(duplicate, index=index, name=name, msg=duplicate['message']))
+                        continue
+                    seen_hashes.add(file_hash)
+                    tmp_paths.append(tmp_path)
+                    pending.append({'index': index, 'name': name, 'tmp_path': tmp_path, 'file_hash': file_hash})
+            
+            # 2. 命中识别缓存的文件直接使用缓存结果
+            with timer.stage('cache'):
+                for item in pending:
+                    cached = get_cached_result(item['file_hash'])
+                    if cached:
+                        item['invoice_data'] = cached['invoice_data']
+                        item['extract_method'] = cached['extract_method']
+                        item['image'] = None
+                        item['cached'] = True
+            
+            # 3. 并发读取文本层 / 栅格化（poppler 子进程，不受 GIL 限制）
+            with timer.stage('prepare'):
+                to_prepare = [item for item in pending if not item.get('cached')]
+                workers = min(app.config['BATCH_RASTER_WORKERS'], max(1, len(to_prepare)))
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = [executor.submit(prepare_pdf, item['tmp_path']) for item in to_prepare]
+                    for item, future in zip(to_prepare, futures):
+                        try:
+                            item['invoice_data'], lines, item['image'] = future.result()
+                            if item['invoice_data']:
+                                item['extract_method'] = 'text_layer'
+                                cache_result(item['file_hash'], lines, item['invoice_data'], 'text_layer')
+                            else:
+                                item['extract_method'] = 'ocr'
+                        except Exception as e:
+                            item['error'] = str(e)
+            
+            # 4. 需要 OCR 的图片分批识别。多进程模式下每批提交的图片（启用 ROI 时每页最多
+            #    MAX_REGIONS 张裁剪图）至少能让所有进程同时工作，且不超过进程池容量
+            with timer.stage('ocr'):
+                to_ocr = [item for item in pending if not item.get('error') and item['image'] is not None]
+                batch_size = app.config['OCR_BATCH_SIZE']
+                if ocr_pool:
+                    images_per_page = MAX_REGIONS if app.config['OCR_ROI_ENABLED'] else 1
+                    batch_size = max(batch_size, -(-ocr_pool.processes // images_per_page))
+                    batch_size = min(batch_size, max(1, ocr_pool.capacity // images_per_page))
+                for start in range(0, len(to_ocr), batch_size):
+                    chunk = to_ocr[start:start + batch_size]
+                    try:
+                        pages = ocr_adaptive([item['tmp_path'] for item in chunk],
+                                             [item['image'] for item in chunk])
+                        for item, (invoice_data, lines, extract_method) in zip(chunk, pages):
+                            item['invoice_data'] = invoice_data
+                            item['extract_method'] = extract_method
+                            cache_result(item['file_hash'], lines, invoice_data, extract_method)
+                    except QueueFullError:
+                        raise
+                    except Exception as e:
+                        for item in chunk:
+                            item['error'] = str(e)
+                    for item in chunk:
+                        item['image'] = None  # 尽早释放图片内存
+            
+            # 5. 号码查重，保留 PDF 并入库（同一连接可以看到本批次已插入的记录）
+            with timer.stage('save_db'):
+                for item in pending:
+                    if item.get('error'):
+                        results['error'].append({'index': item['index'], 'name': item['name'], 'msg': item['error']})
+                        continue
+                    
+                    invoice_data = item['invoice_data']
+                    if not force_upload and invoice_repo.has_invoice_number(invoice_data['invoice_number'], conn):
+                        duplicate = duplicate_number_response(invoice_data['invoice_number'])
+                        results['duplicate'].append(dict(duplicate, index=item['index'], name=item['name'],
+                                                         msg=duplicate['message']))
+                        continue
+                    
+                    filename, filepath = commit_upload(item['tmp_path'], item['name'])
+                    saved_paths.append(filepath)
+                    invoice_repo.insert(invoice_type, buyer_name, invoice_data, filename,
+                                        item['file_hash'], item['extract_method'], conn=conn)
+                    results['success'].append({'index': item['index'], 'name': item['name'],
+                                               'data': invoice_data, 'extract_method': item['extract_method']})
+                
+                conn.commit()
+    
+    except Exception as e:
+        for filepath in saved_paths:
+            discard_upload(filepath)
+        if isinstance(e, QueueFullError):
+            return queue_full_response()
+        logger.error(f'批量上传失败: {str(e)}')
+        return jsonify({'error': f'批量上传失败: {str(e)}'}), 500
+    
+    finally:
+        # 重复、识别失败的文件没有改名为正式文件，删除临时文件
+        for tmp_path in tmp_paths:
+            discard_upload(tmp_path)
+    
+    logger.info(f"批量上传: 成功 {len(results['success'])}, 重复 {len(results['duplicate'])}, "
+                f"失败 {len(results['error'])}, 耗时 {timer.timings}")
+    return jsonify({'success': True, 'results': results, 'timings': timer.timings})
+
+def encode_page_cursor(sort_by, order, value, last_id):
+    raw = json.dumps([sort_by, order, value, last_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_page_cursor(cursor, sort_by, order):
+    """解析游标，返回 (排序列的值, id)；游标损坏或与本次的排序方式不一致时抛出 ValueError"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_sort, cursor_order, value, last_id = json.loads(raw)
+    except (ValueError, TypeError) as e:
+        raise ValueError('无效的分页游标') from e
+    if ((cursor_sort, cursor_order) != (sort_by, order) or type(last_id) is not int
+            or not (value is None or type(value) in (int, str))):
+        raise ValueError('无效的分页游标')
+    return value, last_id
+
 @app.route('/api/invoices/<invoice_type>', methods=['GET'])
 def get_invoices(invoice_type):
+    """按游标分页的发票列表
+
+    参数：sort_by / order 排序，limit 每页条数，cursor 为上一页返回的 next_cursor；
+    with_total=true 时附带该类型的总条数和总金额（第一页请求一次即可）。
+    """
     try:
         sort_by = request.args.get('sort_by', 'created_at')
         order = request.args.get('order', 'DESC')
         
-        # 白名单验证排序字段，防止 SQL 注入
-        valid_sorts = {
-            'invoice_date': 'invoice_date',
-            'created_at': 'created_at',
-            'invoice_number': 'invoice_number',
-            'buyer_name': 'buyer_name',
-            'total_amount': 'CAST(total_amount AS REAL)'
-        }
-        sort_field = valid_sorts.get(sort_by, 'created_at')
         sort_order = 'ASC' if order.upper() == 'ASC' else 'DESC'
+        if sort_by not in INVOICE_SORT_COLUMNS:
+            sort_by, sort_order = 'created_at', 'DESC'
+        limit = request.args.get('limit', app.config['INVOICE_PAGE_SIZE'], type=int)
+        limit = max(1, min(limit, app.config['INVOICE_PAGE_SIZE_MAX']))
         
-        # 使用预定义的安全 SQL 模板
-        queries = {
-            ('invoice_date', 'ASC'): 'SELECT id, type, buyer_name, invoice_number, invoice_date, total_amount, invoice_content, seller_name, bank_name, bank_account, pdf_path, created_at FROM invoices WHERE type = ? ORDER BY invoice_date ASC',
-            ('invoice_date', 'DESC'): 'SELECT id, type, buyer_name, invoice_number, invoice_date, total_amount, invoice_content, seller_name, bank_name, bank_account, pdf_path, created_at FROM invoices WHERE type = ? ORDER BY invoice_date DESC',
-            ('created_at', 'ASC'): 'SELECT id, type, buyer_name, invoice_number, invoice_date, total_amount, invoice_content, seller_name, bank_name, bank_account, pdf_path, created_at FROM invoices WHERE type = ? ORDER BY created_at ASC',
-            ('created_at', 'DESC'): 'SELECT id, type, buyer_name, invoice_number, invoice_date, total_amount, invoice_content, seller_name, bank_name, bank_account, pdf_path, created_at FROM invoices WHERE type = ? ORDER BY created_at DESC',
-            ('invoice_number', 'ASC'): 'SELECT id, type, buyer_name, invoice_number, invoice_date, total_amount, invoice_content, seller_name, bank_name, bank_account, pdf_path, created_at FROM invoices WHERE type = ? ORDER BY invoice_number ASC',
-            ('invoice_number', 'DESC'): 'SELECT id, type, buyer_name, invoice_number, invoice_date, total_amount, invoice_content, seller_name, bank_name, bank_account, pdf_path, created_at FROM invoices WHERE type = ? ORDER BY invoice_number DESC',
-            ('buyer_name', 'ASC'): 'SELECT id, type, buyer_name, invoice_number, invoice_date, total_amount, invoice_content, seller_name, bank_name, bank_account, pdf_path, created_at FROM invoices WHERE type = ? ORDER BY buyer_name ASC',
-            ('buyer_name', 'DESC'): 'SELECT id, type, buyer_name, invoice_number, invoice_date, total_amount, invoice_content, seller_name, bank_name, bank_account, pdf_path, created_at FROM invoices WHERE type = ? ORDER BY buyer_name DESC',
-            ('total_amount', 'ASC'): 'SELECT id, type, buyer_name, invoice_number, invoice_date, total_amount, invoice_content, seller_name, bank_name, bank_account, pdf_path, created_at FROM invoices WHERE type = ? ORDER BY CAST(total_amount AS REAL) ASC',
-            ('total_amount', 'DESC'): 'SELECT id, type, buyer_name, invoice_number, invoice_date, total_amount, invoice_content, seller_name, bank_name, bank_account, pdf_path, created_at FROM invoices WHERE type = ? ORDER BY CAST(total_amount AS REAL) DESC',
-        }
-        
-        query = queries.get((sort_by if sort_by in valid_sorts else 'created_at', sort_order),
-                           queries[('created_at', 'DESC')])
+        after = None
+        cursor_param = request.args.get('cursor')
+        if cursor_param:
+            try:
+                after = decode_page_cursor(cursor_param, sort_by, sort_order)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
         
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, (invoice_type,))
-            rows = cursor.fetchall()
-            invoices = [dict(row) for row in rows]
+        invoices, next_after = invoice_repo.list_page(invoice_type, sort_by, sort_order, limit, after)
+        next_cursor = encode_page_cursor(sort_by, sort_order, *next_after) if next_after else None
+        result = {'success': True, 'data': invoices, 'next_cursor': next_cursor}
+        if request.args.get('with_total', 'false').lower() == 'true':
+            result.update(invoice_repo.type_totals(invoice_type))
         
-        return jsonify({'success': True, 'data': invoices})
+        return jsonify(result)
     
     except Exception as e:
         return jsonify({'error': f'查询失败: {str(e)}'}), 500
 
-@app.route('/api/export/<invoice_type>', methods=['GET'])
+def attachment_disposition(filename):
+    """下载文件的 Content-Disposition，中文文件名按 RFC 5987 编码"""
+    return f"attachment; filename*=UTF-8''{quote(filename)}"
+
+def export_filters(values, invoice_type):
+    """从请求参数（表单或 JSON）中取出导出筛选条件，见 SqliteInvoiceRepository.build_export_query
+
+    ids 可以是逗号分隔的字符串或整数列表，格式错误时抛出 ValueError。
+    """
+    filters = {key: str(values.get(key) or '').strip()
+               for key in ('keyword', 'start_date', 'end_date', 'min_amount', 'max_amount')}
+    filters['type'] = invoice_type
+    ids = values.get('ids') or []
+    if isinstance(ids, str):
+        ids = [part.strip() for part in ids.split(',') if part.strip()]
+    if ids:
+        filters['ids'] = sorted(set(request_ids({'ids': ids})))
+    return filters
+
+def utc_datetime(text):
+    """数据库中的 UTC 时间字符串转为带时区的 datetime（用于 Last-Modified），空值返回 None"""
+    return datetime.fromisoformat(text).replace(tzinfo=timezone.utc) if text else None
+
+def send_export(output, export_format, filename, etag, last_modified):
+    """发送已生成的导出文件（打开的文件对象），带 ETag / Last-Modified，条件请求命中时回复 304"""
+    return send_file(
+        output,
+        mimetype=EXPORT_MIMETYPES[export_format],
+        as_attachment=True,
+        download_name=filename,
+        etag=etag,
+        last_modified=last_modified
+    )
+
+@app.route('/api/export/<invoice_type>', methods=['GET', 'POST'])
 def export_invoices(invoice_type):
+    """导出发票，format=xlsx（默认）或 csv
+
+    可带与 /api/search 相同的筛选参数（keyword、start_date、end_date、min_amount、max_amount），
+    以及 ids（逗号分隔，只导出勾选的发票；勾选较多时用表单 POST 提交），筛选在 SQL 中完成。
+    都从数据库游标逐批读取，内存占用与导出条数无关：csv 边读边发送（UTF-8 带 BOM），
+    xlsx 以只写模式写入文件后发送。生成的文件按 (类型, 筛选条件, 格式, 数据版本) 缓存在磁盘上，
+    响应带 ETag / Last-Modified，数据没有变化时条件请求直接回复 304。
+    """
     try:
-        with get_db_connection() as conn:
-            df = pd.read_sql_query("SELECT * FROM invoices WHERE type = ?", conn, params=(invoice_type,))
+        export_format = request.values.get('format', 'xlsx').lower()
+        if export_format not in ('xlsx', 'csv'):
+            return jsonify({'error': f'不支持的导出格式: {export_format}'}), 400
         
-        if df.empty:
-             return jsonify({'error': '没有数据可导出'}), 400
-
-        rename_map = {
-            'type': '类型', 'buyer_name': '购买人', 'invoice_number': '发票号码',
-            'invoice_date': '开票日期', 'total_amount': '总金额', 'invoice_content': '内容',
-            'seller_name': '销售方', 'bank_name': '开户行', 'bank_account': '账号',
-            'file_hash': '文件哈希', 'created_at': '上传时间'
-        }
-        df = df.rename(columns=rename_map)
+        try:
+            filters = export_filters(request.values, invoice_type)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        cols_to_drop = ['id', 'pdf_path', '文件哈希']
-        df = df.drop(columns=[c for c in cols_to_drop if c in df.columns])
-
-        output = io.BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            df.to_excel(writer, index=False, sheet_name='Invoices')
-        output.seek(0)
+        filename = f"{invoice_type}_invoices_{datetime.now().strftime('%Y%m%d')}.{export_format}"
+        # 先读数据版本再导出：导出期间的写入只会让文件比版本新，不会把旧数据缓存在新版本下。
+        # ETag 由筛选条件、格式和数据版本决定，数据没有变化时不必生成文件即可回复 304
+        version = invoice_repo.data_version(invoice_type)
+        etag = ExportCache.key(filters, export_format, version)
+        last_modified = utc_datetime(version[1])
+        if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+            response = Response(status=304)
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            return response
+        if export_cache:
+            cached = export_cache.get(etag)
+            if cached:
+                return send_export(cached, export_format, filename, etag, last_modified)
+        
+        try:
+            batches = invoice_repo.iter_export(filters, app.config['EXPORT_BATCH_SIZE'])
+            first_batch = next(batches, None)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if first_batch is None:
+            return jsonify({'error': '没有数据可导出'}), 400
+        batches = itertools.chain([first_batch], batches)
+        
+        if export_format == 'csv':
+            chunks = csv_chunks(EXPORT_COLUMNS, batches)
+            if export_cache:
+                chunks = export_cache.tee(etag, chunks)
+            response = Response(chunks, mimetype=EXPORT_MIMETYPES['csv'],
+                                headers={'Content-Disposition': attachment_disposition(filename)})
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            return response
         
-        filename = f"{invoice_type}_invoices_{datetime.now().strftime('%Y%m%d')}.xlsx"
-        return send_file(
-            output,
-            mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            as_attachment=True,
-            download_name=filename
-        )
+        if export_cache:
+            output = export_cache.write(etag, lambda path: write_xlsx(path, EXPORT_COLUMNS, batches))
+        else:
+            # 只写模式的工作簿先写入匿名临时文件，发送完毕关闭时由系统删除
+            output = tempfile.TemporaryFile(prefix='export_', suffix='.xlsx')
+            try:
+                write_xlsx(output, EXPORT_COLUMNS, batches)
+                output.seek(0)
+            except Exception:
+                output.close()
+                raise
+        return send_export(output, export_format, filename, etag, last_modified)
 
     except Exception as e:
         return jsonify({'error': f'导出失败: {str(e)}'}), 500
 
+def export_job_path(job_id, export_format):
+    return os.path.join(app.config['EXPORT_JOB_DIR'], f'{job_id}.{export_format}')
+
+def run_export_job(job, filters, export_format):
+    """后台导出任务：逐批写入 EXPORT_JOB_DIR 下的文件，进度为已写入行数 / 命中总数
+
+    与 /api/export 共用导出缓存：相同 (类型, 筛选条件, 格式, 数据版本) 的文件已缓存时直接取用，
+    否则生成后同时放入缓存。
+    """
+    # 与 /api/export 相同，先读数据版本再导出
+    version = invoice_repo.data_version(filters['type'])
+    cache_key = ExportCache.key(filters, export_format, version)
+    total = invoice_repo.export_count(filters)
+    job.set_progress(0, total)
+    if not total:
+        raise ValueError('没有数据可导出')
+    
+    path = export_job_path(job.id, export_format)
+    result = {
+        'format': export_format,
+        'filename': f"{filters['type']}_invoices_{datetime.now().strftime('%Y%m%d')}.{export_format}",
+    }
+    if export_cache and export_cache.copy_to(cache_key, path):
+        job.set_progress(total, total)
+        result.update(rows=total, size=os.path.getsize(path), cached=True)
+        return result
+    
+    def tracked_batches():
+        done = 0
+        for rows in invoice_repo.iter_export(filters, app.config['EXPORT_BATCH_SIZE']):
+            yield rows
+            done += len(rows)
+            job.set_progress(done, total)
+    
+    # 先写入 .part 文件，完成后改名，下载接口不会读到半个文件
+    part = f'{path}.part'
+    try:
+        if export_format == 'csv':
+            with open(part, 'wb') as output:
+                for chunk in csv_chunks(EXPORT_COLUMNS, tracked_batches()):
+                    output.write(chunk)
+        else:
+            write_xlsx(part, EXPORT_COLUMNS, tracked_batches())
+        os.replace(part, path)
+    except Exception:
+        discard_upload(part)
+        raise
+    if export_cache:
+        try:
+            export_cache.add(cache_key, path)
+        except OSError as e:
+            # 缓存写入失败不影响任务结果
+            logger.warning(f'写入导出缓存失败: {str(e)}')
+    result.update(rows=job.progress['done'], size=os.path.getsize(path), cached=False)
+    return result
+
+def export_job_expired(job):
+    return job.finished_at is not None and time.time() - job.finished_at > app.config['EXPORT_JOB_TTL']
+
+@app.route('/api/export-jobs', methods=['POST'])
+def create_export_job():
+    """提交后台导出任务，参数与 /api/export 相同，另需 type；返回 202 和任务 id
+
+    用于耗时可能超过反向代理超时的大批量导出：请求立即返回，任务在后台线程中生成文件，
+    通过 GET /api/export-jobs/<job_id> 查询进度，完成后从 download_url 下载。
+    """
+    values = request.get_json(silent=True) or request.values
+    invoice_type = str(values.get('type') or '')
+    if not invoice_type:
+        return jsonify({'error': '缺少发票类型'}), 400
+    export_format = str(values.get('format') or 'xlsx').lower()
+    if export_format not in ('xlsx', 'csv'):
+        return jsonify({'error': f'不支持的导出格式: {export_format}'}), 400
+    try:
+        filters = export_filters(values, invoice_type)
+        # 提前校验日期 / 金额格式，不把注定失败的任务放入队列
+        invoice_repo.build_export_query(filters)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        job = export_jobs.submit('export', run_export_job, filters, export_format)
+    except QueueFullError:
+        return queue_full_response('导出队列已满，请稍后重试')
+    return jsonify({
+        'success': True,
+        'message': '导出任务已提交',
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/api/export-jobs/{job.id}'
+    }), 202
+
+@app.route('/api/export-jobs/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    """查询后台导出任务：状态、进度（已写入行数 / 总数），完成后给出下载地址和过期时间"""
+    job = export_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+    
+    data = job.to_dict()
+    result = data.pop('result') or {}
+    data.update(result)
+    if job.status == 'done':
+        data['expires_at'] = job.finished_at + app.config['EXPORT_JOB_TTL']
+        data['expired'] = export_job_expired(job)
+        if not data['expired']:
+            data['download_url'] = f'/api/export-jobs/{job.id}/download'
+    return jsonify({'success': True, 'data': data})
+
+@app.route('/api/export-jobs/<job_id>/download', methods=['GET'])
+def download_export_job(job_id):
+    """下载后台导出任务生成的文件；任务未完成或失败返回 409，文件已过期返回 410"""
+    job = export_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': '任务不存在'}), 404
+    if job.status == 'failed':
+        return jsonify({'error': f'导出失败: {job.error}', 'status': job.status}), 409
+    if job.status != 'done':
+        return jsonify({'error': '导出尚未完成', 'status': job.status}), 409
+    
+    path = export_job_path(job.id, job.result['format'])
+    if export_job_expired(job) or not os.path.exists(path):
+        discard_upload(path)
+        return jsonify({'error': '导出文件已过期，请重新导出'}), 410
+    return send_file(
+        os.path.abspath(path),
+        mimetype=EXPORT_MIMETYPES[job.result['format']],
+        as_attachment=True,
+        download_name=job.result['filename']
+    )
+
+def purge_expired_exports():
+    """删除 EXPORT_JOB_DIR 中超过有效期的导出文件（含进程重启后不再有任务记录的文件）"""
+    cutoff = time.time() - app.config['EXPORT_JOB_TTL']
+    removed = 0
+    for entry in os.scandir(app.config['EXPORT_JOB_DIR']):
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+                removed += 1
+        except FileNotFoundError:
+            pass
+    if removed:
+        logger.info(f'导出文件过期清理: 删除 {removed} 个文件')
+    return {'removed': removed}
+
+export_expiry_task = PeriodicTask('export-expiry', purge_expired_exports, app.config['EXPORT_JOB_CLEAN_INTERVAL'])
+
+def request_ids(data):
+    """取出请求体中的 ids，返回整数列表；ids 不是整数列表时抛出 ValueError"""
+    invoice_ids = (data or {}).get('ids', [])
+    if not isinstance(invoice_ids, list):
+        raise ValueError('ids 必须是整数列表')
+    ids = []
+    for invoice_id in invoice_ids:
+        if isinstance(invoice_id, str) and invoice_id.isdigit():
+            invoice_id = int(invoice_id)
+        if type(invoice_id) is not int:
+            raise ValueError('ids 必须是整数列表')
+        ids.append(invoice_id)
+    return ids
+
+def remove_upload_files(job, filenames):
+    """删除 uploads/ 下的 PDF 文件，返回实际删除的个数"""
+    removed = 0
+    for done, filename in enumerate(filenames, 1):
+        try:
+            os.remove(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+            removed += 1
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f'删除文件失败 {filename}: {str(e)}')
+        if job:
+            job.set_progress(done, len(filenames))
+    return {'removed': removed}
+
+def schedule_file_removal(filenames):
+    """在数据库事务提交后调用，由后台线程删除文件；队列已满时在当前线程删除"""
+    filenames = [filename for filename in filenames if filename]
+    if not filenames:
+        return
+    try:
+        file_jobs.submit('remove_files', remove_upload_files, filenames)
+    except QueueFullError:
+        remove_upload_files(None, filenames)
+
 @app.route('/api/invoices/delete', methods=['POST'])
 def delete_invoices():
     try:
-        data = request.json
-        invoice_ids = data.get('ids', [])
+        try:
+            ids = request_ids(request.json)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if not invoice_ids:
+        if not ids:
             return jsonify({'error': '没有选择要删除的发票'}), 400
         
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            for invoice_id in invoice_ids:
-                invoice = cursor.execute('SELECT * FROM invoices WHERE id = ?', (invoice_id,)).fetchone()
-                
-                if invoice:
-                    row_dict = dict(invoice)
-                    if 'id' in row_dict: del row_dict['id']
-                    
-                    keys = list(row_dict.keys())
-                    values = list(row_dict.values())
-                    
-                    keys.append('deleted_at')
-                    china_time = (datetime.utcnow() + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S')
-                    values.append(china_time)
-                    
-                    placeholders = ', '.join(['?'] * len(keys))
-                    columns = ', '.join(keys)
-                    
-                    cursor.execute(f'INSERT INTO recycle_bin ({columns}) VALUES ({placeholders})', values)
-                    cursor.execute('DELETE FROM invoices WHERE id = ?', (invoice_id,))
-            
-            conn.commit()
-        
-        return jsonify({'success': True, 'message': '删除成功'})
+        count = invoice_repo.soft_delete(ids)
+        return jsonify({'success': True, 'message': f'已删除 {count} 张发票', 'count': count})
     
     except Exception as e:
         return jsonify({'error': f'删除失败: {str(e)}'}), 500
 
+def purge_expired_invoices():
+    """彻底删除回收站中超过保留天数的发票及其 PDF 文件
+
+    每批（RETENTION_BATCH_SIZE 条）一个短的写事务，批与批之间释放写锁，不会长时间阻塞上传入库；
+    文件在该批提交之后删除。
+    """
+    cutoff = (datetime.utcnow() + timedelta(hours=8) - timedelta(days=app.config['RECYCLE_RETENTION_DAYS'])
+              ).strftime('%Y-%m-%d %H:%M:%S')
+    batch_size = app.config['RETENTION_BATCH_SIZE']
+    purged = files_removed = batches = 0
+    while True:
+        rows = invoice_repo.purge_expired_batch(cutoff, batch_size)
+        if not rows:
+            break
+        purged += len(rows)
+        batches += 1
+        files_removed += remove_upload_files(None, [row['pdf_path'] for row in rows if row['pdf_path']])['removed']
+        if len(rows) < batch_size:
+            break
+    if purged:
+        logger.info(f'回收站过期清理: 删除 {purged} 张发票、{files_removed} 个文件')
+    return {'cutoff': cutoff, 'purged': purged, 'files_removed': files_removed, 'batches': batches}
+
+retention_task = PeriodicTask('recycle-retention', purge_expired_invoices, app.config['RETENTION_INTERVAL'],
+                              initial_delay=app.config['RETENTION_INITIAL_DELAY'])
+
 @app.route('/api/recycle-bin/<invoice_type>', methods=['GET'])
 def get_recycle_bin(invoice_type):
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            thirty_days_ago = (datetime.utcnow() + timedelta(hours=8) - timedelta(days=30)).strftime('%Y-%m-%d %H:%M:%S')
-            cursor.execute('DELETE FROM recycle_bin WHERE deleted_at < ?', (thirty_days_ago,))
-            
-            cursor.execute('''
-                SELECT *
-                FROM recycle_bin
-                WHERE type = ?
-                ORDER BY deleted_at DESC
-            ''', (invoice_type,))
-            
-            rows = cursor.fetchall()
-            invoices = [dict(row) for row in rows]
-            conn.commit()
-        
-        return jsonify({'success': True, 'data': invoices})
+        return jsonify({'success': True, 'data': invoice_repo.recycle_bin(invoice_type)})
     
     except Exception as e:
         return jsonify({'error': f'查询失败: {str(e)}'}), 500
 
+@app.route('/api/retention', methods=['GET'])
+def get_retention_stats():
+    """回收站定时清理的状态和最近一次运行的结果"""
+    data = retention_task.stats()
+    data['retention_days'] = app.config['RECYCLE_RETENTION_DAYS']
+    data['batch_size'] = app.config['RETENTION_BATCH_SIZE']
+    return jsonify({'success': True, 'data': data})
+
 @app.route('/api/recycle-bin/restore', methods=['POST'])
 def restore_invoices():
-    """从回收站恢复发票"""
+    """从回收站恢复发票，恢复后 id 不变"""
     try:
-        data = request.json
-        invoice_ids = data.get('ids', [])
+        try:
+            ids = request_ids(request.json)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if not invoice_ids:
+        if not ids:
             return jsonify({'error': '没有选择要恢复的发票'}), 400
         
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            for invoice_id in invoice_ids:
-                invoice = cursor.execute('SELECT * FROM recycle_bin WHERE id = ?', (invoice_id,)).fetchone()
-                
-                if invoice:
-                    row_dict = dict(invoice)
-                    # 移除回收站特有的字段
-                    if 'id' in row_dict: del row_dict['id']
-                    if 'deleted_at' in row_dict: del row_dict['deleted_at']
-                    
-                    keys = list(row_dict.keys())
-                    values = list(row_dict.values())
-                    
-                    placeholders = ', '.join(['?'] * len(keys))
-                    columns = ', '.join(keys)
-                    
-                    cursor.execute(f'INSERT INTO invoices ({columns}) VALUES ({placeholders})', values)
-                    cursor.execute('DELETE FROM recycle_bin WHERE id = ?', (invoice_id,))
-            
-            conn.commit()
-        
-        return jsonify({'success': True, 'message': '恢复成功'})
+        count = invoice_repo.restore(ids)
+        return jsonify({'success': True, 'message': f'已恢复 {count} 张发票', 'count': count})
     
     except Exception as e:
         return jsonify({'error': f'恢复失败: {str(e)}'}), 500
 
 @app.route('/api/recycle-bin/permanent-delete', methods=['POST'])
 def permanent_delete_invoices():
-    """永久删除回收站中的发票"""
+    """永久删除回收站中的发票，PDF 文件在提交后由后台删除"""
     try:
-        data = request.json
-        invoice_ids = data.get('ids', [])
+        try:
+            ids = request_ids(request.json)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
-        if not invoice_ids:
+        if not ids:
             return jsonify({'error': '没有选择要删除的发票'}), 400
         
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            for invoice_id in invoice_ids:
-                # 获取 PDF 路径以便删除文件
-                invoice = cursor.execute('SELECT pdf_path FROM recycle_bin WHERE id = ?', (invoice_id,)).fetchone()
-                
-                if invoice and invoice['pdf_path']:
-                    pdf_file = os.path.join(app.config['UPLOAD_FOLDER'], invoice['pdf_path'])
-                    if os.path.exists(pdf_file):
-                        os.remove(pdf_file)
-                
-                cursor.execute('DELETE FROM recycle_bin WHERE id = ?', (invoice_id,))
-            
-            conn.commit()
+        count, pdf_paths = invoice_repo.purge(ids)
+        schedule_file_removal(pdf_paths)
         
-        return jsonify({'success': True, 'message': '永久删除成功'})
+        return jsonify({'success': True, 'message': f'已永久删除 {count} 张发票', 'count': count})
     
     except Exception as e:
         return jsonify({'error': f'删除失败: {str(e)}'}), 500
 
 @app.route('/api/recycle-bin/empty', methods=['POST'])
 def empty_recycle_bin():
-    """清空回收站"""
+    """清空回收站（可按类型），PDF 文件在提交后由后台删除"""
     try:
         invoice_type = request.json.get('type') if request.json else None
         
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            if invoice_type:
-                # 获取所有需要删除的 PDF 文件
-                cursor.execute('SELECT pdf_path FROM recycle_bin WHERE type = ?', (invoice_type,))
-                rows = cursor.fetchall()
-                
-                for row in rows:
-                    if row['pdf_path']:
-                        pdf_file = os.path.join(app.config['UPLOAD_FOLDER'], row['pdf_path'])
-                        if os.path.exists(pdf_file):
-                            os.remove(pdf_file)
-                
-                cursor.execute('DELETE FROM recycle_bin WHERE type = ?', (invoice_type,))
-            else:
-                # 清空所有
-                cursor.execute('SELECT pdf_path FROM recycle_bin')
-                rows = cursor.fetchall()
-                
-                for row in rows:
-                    if row['pdf_path']:
-                        pdf_file = os.path.join(app.config['UPLOAD_FOLDER'], row['pdf_path'])
-                        if os.path.exists(pdf_file):
-                            os.remove(pdf_file)
-                
-                cursor.execute('DELETE FROM recycle_bin')
-            
-            conn.commit()
+        count, pdf_paths = invoice_repo.empty_recycle_bin(invoice_type)
+        schedule_file_removal(pdf_paths)
         
-        return jsonify({'success': True, 'message': '回收站已清空'})
+        return jsonify({'success': True, 'message': '回收站已清空', 'count': count})
     
     except Exception as e:
         return jsonify({'error': f'清空失败: {str(e)}'}), 500
@@ -635,25 +1278,10 @@ def update_invoice(invoice_id):
         if not update_data:
             return jsonify({'error': '没有有效的更新字段'}), 400
         
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 检查发票是否存在
-            cursor.execute('SELECT id FROM invoices WHERE id = ?', (invoice_id,))
-            if not cursor.fetchone():
-                return jsonify({'error': '发票不存在'}), 404
-            
-            # 构建更新语句
-            update_data['updated_at'] = (datetime.utcnow() + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S')
-            
-            set_clause = ', '.join([f'{k} = ?' for k in update_data.keys()])
-            values = list(update_data.values()) + [invoice_id]
-            
-            cursor.execute(f'UPDATE invoices SET {set_clause} WHERE id = ?', values)
-            conn.commit()
-            
-            logger.info(f'发票 {invoice_id} 已更新')
+        if not invoice_repo.update(invoice_id, update_data):
+            return jsonify({'error': '发票不存在'}), 404
         
+        logger.info(f'发票 {invoice_id} 已更新')
         return jsonify({'success': True, 'message': '更新成功'})
     
     except Exception as e:
@@ -664,15 +1292,11 @@ def update_invoice(invoice_id):
 def get_invoice_detail(invoice_id):
     """获取单个发票详情"""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT * FROM invoices WHERE id = ?', (invoice_id,))
-            row = cursor.fetchone()
-            
-            if not row:
-                return jsonify({'error': '发票不存在'}), 404
-            
-            return jsonify({'success': True, 'data': dict(row)})
+        invoice = invoice_repo.get(invoice_id)
+        if not invoice:
+            return jsonify({'error': '发票不存在'}), 404
+        
+        return jsonify({'success': True, 'data': invoice})
     
     except Exception as e:
         return jsonify({'error': f'查询失败: {str(e)}'}), 500
@@ -681,60 +1305,10 @@ def get_invoice_detail(invoice_id):
 def search_invoices():
     """搜索发票"""
     try:
-        keyword = request.args.get('keyword', '').strip()
-        invoice_type = request.args.get('type', '')
-        start_date = request.args.get('start_date', '')
-        end_date = request.args.get('end_date', '')
-        min_amount = request.args.get('min_amount', '')
-        max_amount = request.args.get('max_amount', '')
-        
-        conditions = []
-        params = []
-        
-        if keyword:
-            conditions.append('''
-                (invoice_number LIKE ? OR buyer_name LIKE ? OR 
-                 seller_name LIKE ? OR invoice_content LIKE ?)
-            ''')
-            keyword_param = f'%{keyword}%'
-            params.extend([keyword_param] * 4)
-        
-        if invoice_type:
-            conditions.append('type = ?')
-            params.append(invoice_type)
-        
-        if start_date:
-            conditions.append('invoice_date >= ?')
-            params.append(start_date.replace('-', ''))
-        
-        if end_date:
-            conditions.append('invoice_date <= ?')
-            params.append(end_date.replace('-', ''))
-        
-        if min_amount:
-            conditions.append('CAST(total_amount AS REAL) >= ?')
-            params.append(float(min_amount))
-        
-        if max_amount:
-            conditions.append('CAST(total_amount AS REAL) <= ?')
-            params.append(float(max_amount))
-        
-        where_clause = ' AND '.join(conditions) if conditions else '1=1'
-        
-        query = f'''
-            SELECT id, type, buyer_name, invoice_number, invoice_date, total_amount,
-                   invoice_content, seller_name, bank_name, bank_account, pdf_path, created_at
-            FROM invoices
-            WHERE {where_clause}
-            ORDER BY created_at DESC
-            LIMIT 100
-        '''
-        
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            rows = cursor.fetchall()
-            invoices = [dict(row) for row in rows]
+        try:
+            invoices = invoice_repo.search(request.args)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         
         return jsonify({'success': True, 'data': invoices, 'count': len(invoices)})
     
@@ -746,64 +1320,7 @@ def search_invoices():
 def get_statistics():
     """获取发票统计信息"""
     try:
-        invoice_type = request.args.get('type', '')
-        
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            # 基础统计
-            if invoice_type:
-                cursor.execute('''
-                    SELECT 
-                        COUNT(*) as total_count,
-                        COALESCE(SUM(CAST(total_amount AS REAL)), 0) as total_amount,
-                        COALESCE(AVG(CAST(total_amount AS REAL)), 0) as avg_amount,
-                        COALESCE(MAX(CAST(total_amount AS REAL)), 0) as max_amount,
-                        COALESCE(MIN(CAST(total_amount AS REAL)), 0) as min_amount
-                    FROM invoices
-                    WHERE type = ? AND total_amount != ''
-                ''', (invoice_type,))
-            else:
-                cursor.execute('''
-                    SELECT 
-                        COUNT(*) as total_count,
-                        COALESCE(SUM(CAST(total_amount AS REAL)), 0) as total_amount,
-                        COALESCE(AVG(CAST(total_amount AS REAL)), 0) as avg_amount,
-                        COALESCE(MAX(CAST(total_amount AS REAL)), 0) as max_amount,
-                        COALESCE(MIN(CAST(total_amount AS REAL)), 0) as min_amount
-                    FROM invoices
-                    WHERE total_amount != ''
-                ''')
-            
-            stats = dict(cursor.fetchone())
-            
-            # 按类型分组统计
-            cursor.execute('''
-                SELECT type, COUNT(*) as count, 
-                       COALESCE(SUM(CAST(total_amount AS REAL)), 0) as amount
-                FROM invoices
-                GROUP BY type
-            ''')
-            stats['by_type'] = [dict(row) for row in cursor.fetchall()]
-            
-            # 按月份统计（最近12个月）
-            cursor.execute('''
-                SELECT 
-                    SUBSTR(invoice_date, 1, 6) as month,
-                    COUNT(*) as count,
-                    COALESCE(SUM(CAST(total_amount AS REAL)), 0) as amount
-                FROM invoices
-                WHERE invoice_date != '' AND LENGTH(invoice_date) >= 6
-                GROUP BY SUBSTR(invoice_date, 1, 6)
-                ORDER BY month DESC
-                LIMIT 12
-            ''')
-            stats['by_month'] = [dict(row) for row in cursor.fetchall()]
-            
-            # 回收站统计
-            cursor.execute('SELECT COUNT(*) as count FROM recycle_bin')
-            stats['recycle_bin_count'] = cursor.fetchone()['count']
-        
+        stats = invoice_repo.statistics(request.args.get('type', ''))
         return jsonify({'success': True, 'data': stats})
     
     except Exception as e:
@@ -814,11 +1331,14 @@ def get_statistics():
 def batch_update_invoices():
     """批量更新发票"""
     try:
-        data = request.json
-        invoice_ids = data.get('ids', [])
+        data = request.json or {}
+        try:
+            ids = request_ids(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
         update_data = data.get('data', {})
         
-        if not invoice_ids:
+        if not ids:
             return jsonify({'error': '没有选择要更新的发票'}), 400
         
         # 允许更新的字段白名单
@@ -828,21 +1348,10 @@ def batch_update_invoices():
         if not update_data:
             return jsonify({'error': '没有有效的更新字段'}), 400
         
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            
-            update_data['updated_at'] = (datetime.utcnow() + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S')
-            
-            set_clause = ', '.join([f'{k} = ?' for k in update_data.keys()])
-            
-            for invoice_id in invoice_ids:
-                values = list(update_data.values()) + [invoice_id]
-                cursor.execute(f'UPDATE invoices SET {set_clause} WHERE id = ?', values)
-            
-            conn.commit()
-            logger.info(f'批量更新了 {len(invoice_ids)} 张发票')
+        count = invoice_repo.batch_update(ids, update_data)
+        logger.info(f'批量更新了 {count} 张发票')
         
-        return jsonify({'success': True, 'message': f'成功更新 {len(invoice_ids)} 张发票'})
+        return jsonify({'success': True, 'message': f'成功更新 {count} 张发票', 'count': count})
     
     except Exception as e:
         logger.error(f'批量更新失败: {str(e)}')
@@ -867,10 +1376,7 @@ def download_pdf(filename):
 def health_check():
     """健康检查接口"""
     try:
-        with get_db_connection() as conn:
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM invoices')
-            count = cursor.fetchone()[0]
+        count = invoice_repo.live_count()
         
         return jsonify({
             'status': 'healthy',
@@ -884,10 +1390,55 @@ def health_check():
             'error': str(e)
         }), 500
 
+@app.cli.command('check-query-plans')
+def check_query_plans():
+    """对各接口的查询执行 EXPLAIN QUERY PLAN，出现临时 B 树排序或全表扫描时以非零状态退出"""
+    failures = 0
+    with get_db_connection(readonly=True) as conn:
+        for name, sql, params, allow_sort in invoice_repo.query_plan_checks():
+            details = [row['detail'] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params)]
+            bad = bad_plan_steps(details, allow_sort)
+            failures += bool(bad)
+            print(f"{'FAIL' if bad else 'ok  '} {name}: {' | '.join(details)}")
+    if failures:
+        raise SystemExit(f'{failures} 个查询的执行计划不符合要求')
+
+@app.cli.command('purge-recycle-bin')
+def purge_recycle_bin_command():
+    """立即执行一次回收站过期清理"""
+    result = retention_task.run_now()
+    print(f"删除 {result['purged']} 张发票（删除时间早于 {result['cutoff']}）、{result['files_removed']} 个文件，"
+          f"共 {result['batches']} 批")
+
+@app.cli.command('rebuild-stats')
+def rebuild_stats_command():
+    """按 invoices 全量重算统计汇总表"""
+    invoice_repo.rebuild_stats()
+    print('统计汇总表已重算')
+
+@app.cli.command('check-stats')
+def check_stats_command():
+    """对比统计汇总表与全量重算的结果，不一致时列出差异并以非零状态退出"""
+    mismatches = invoice_repo.stats_mismatches()
+    for table, key, stored, expected in mismatches:
+        print(f'{table} {key}: 汇总表 {stored}，重算 {expected}')
+    if mismatches:
+        raise SystemExit(f'{len(mismatches)} 个分组不一致，可执行 flask --app app rebuild-stats 重算')
+    print('统计汇总表与明细一致')
+
+def start_background_tasks():
+    """启动回收站过期清理和导出文件过期清理"""
+    retention_task.start()
+    export_expiry_task.start()
+
+if IS_MAIN_PROCESS:
+    start_background_tasks()
+
 # 错误处理器
 @app.errorhandler(413)
 def request_entity_too_large(error):
-    return jsonify({'error': '文件太大，最大允许 16MB'}), 413
+    max_mb = app.config['MAX_CONTENT_LENGTH'] / (1024 * 1024)
+    return jsonify({'error': f'文件太大，单次请求最大允许 {max_mb:g}MB'}), 413
 
 @app.errorhandler(404)
 def not_found(error):
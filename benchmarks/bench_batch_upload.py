@@ -0,0 +1,112 @@
+"""逐张上传 vs 批量上传的吞吐对比
+
+用法：
+    python benchmarks/bench_batch_upload.py --samples path/to/pdfs --count 50
+
+在临时目录中启动应用（独立的 invoices.db 和 uploads/），先用 /api/upload
+逐张上传 count 个文件，再用 /api/upload/batch 上传同样的文件，输出 files/sec。
+样本不足 count 个时循环使用；两轮都带 force=true，避免查重短路，并关闭识别缓存，两轮都实际识别。
+批量请求按与前端相同的规则拆分：每个请求最多 chunk-size 个文件，且累计大小不超过服务端的 MAX_CONTENT_LENGTH。
+"""
+import argparse
+import io
+import itertools
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# 与前端 static/index.html 一致的 multipart 额外开销估计
+BATCH_REQUEST_OVERHEAD = 64 * 1024
+BATCH_FILE_OVERHEAD = 1024
+
+
+def load_samples(sample_dir, count):
+    paths = sorted(os.path.join(sample_dir, name) for name in os.listdir(sample_dir)
+                   if name.lower().endswith('.pdf'))
+    if not paths:
+        sys.exit(f'{sample_dir} 中没有 PDF 文件')
+    samples = []
+    for i, path in enumerate(itertools.islice(itertools.cycle(paths), count)):
+        with open(path, 'rb') as f:
+            samples.append((f'{i:03d}_{os.path.basename(path)}', f.read()))
+    return samples
+
+
+def run_serial(client, samples):
+    start = time.perf_counter()
+    for name, data in samples:
+        response = client.post('/api/upload', data={
+            'file': (io.BytesIO(data), name), 'type': '自费', 'force': 'true'})
+        if response.status_code != 200:
+            print(f'  {name}: {response.status_code} {response.get_json()}')
+    return time.perf_counter() - start
+
+
+def split_batches(samples, chunk_size, max_request_bytes):
+    budget = max_request_bytes - BATCH_REQUEST_OVERHEAD if max_request_bytes else float('inf')
+    chunks, chunk, chunk_bytes = [], [], 0
+    for name, data in samples:
+        file_bytes = len(data) + BATCH_FILE_OVERHEAD
+        if file_bytes > budget:
+            print(f'  {name}: 超过单次请求大小上限，跳过')
+            continue
+        if len(chunk) >= chunk_size or chunk_bytes + file_bytes > budget:
+            chunks.append(chunk)
+            chunk, chunk_bytes = [], 0
+        chunk.append((name, data))
+        chunk_bytes += file_bytes
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def run_batch(client, samples, chunk_size, max_request_bytes):
+    chunks = split_batches(samples, chunk_size, max_request_bytes)
+    start = time.perf_counter()
+    for chunk in chunks:
+        response = client.post('/api/upload/batch', data={
+            'files': [(io.BytesIO(data), name) for name, data in chunk],
+            'type': '自费', 'force': 'true'})
+        if response.status_code != 200:
+            print(f'  {len(chunk)} 个文件: {response.status_code} {response.get_json()}')
+            continue
+        for item in response.get_json()['results']['error']:
+            print(f"  {item['name']}: {item['msg']}")
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', required=True, help='样本 PDF 目录')
+    parser.add_argument('--count', type=int, default=50)
+    parser.add_argument('--chunk-size', type=int, default=20, help='每个批量请求的文件数（与前端一致）')
+    args = parser.parse_args()
+
+    samples = load_samples(args.samples, args.count)
+    workdir = tempfile.mkdtemp(prefix='bench_batch_')
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    try:
+        import app
+        # 两轮上传同样的文件，关闭识别缓存，避免批量一轮只测到缓存命中
+        app.app.config['OCR_CACHE_ENABLED'] = False
+        app.init_ocr()  # 模型加载不计入耗时
+        client = app.app.test_client()
+
+        serial = run_serial(client, samples)
+        batch = run_batch(client, samples, args.chunk_size, app.app.config['MAX_CONTENT_LENGTH'])
+
+        print(f'文件数: {len(samples)}')
+        print(f'逐张上传: {serial:.2f}s, {len(samples) / serial:.2f} files/sec')
+        print(f'批量上传: {batch:.2f}s, {len(samples) / batch:.2f} files/sec')
+        print(f'加速比: {serial / batch:.2f}x')
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
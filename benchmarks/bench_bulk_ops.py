@@ -0,0 +1,110 @@
+"""批量操作：逐条执行 vs 一条语句处理全部 id
+
+用法：
+    python benchmarks/bench_bulk_ops.py [--rows 50000] [--ids 10000]
+
+在临时目录中由应用建库（含全文索引和统计汇总表触发器），写入 rows 条发票，
+然后对两组不相交的 ids 条发票分别用两种方式依次执行删除到回收站、恢复、批量修改购买人、
+再次删除和彻底删除，输出每一步的耗时（即持有写锁的时间），并检查统计汇总表与明细一致。
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        cents = rng.randint(100, 500000)
+        yield (rng.choice(['自费', '对公']), f'用户{rng.randint(1, 500)}', f'{i:020d}', f'{cents / 100:.2f}',
+               '*餐饮服务*餐费', f'{i}.pdf', f'{i:032x}', cents, 20240000 + rng.randint(1, 12) * 100 + rng.randint(1, 28),
+               '2024-01-01 10:00:00')
+
+
+def per_id_steps():
+    """每个 id 执行一条语句（原接口的做法）"""
+    deleted_at = '2024-06-01 00:00:00'
+    return [
+        ('删除', 'UPDATE invoices SET deleted_at = ? WHERE id = ? AND deleted_at IS NULL', lambda i: (deleted_at, i)),
+        ('恢复', 'UPDATE invoices SET deleted_at = NULL WHERE id = ? AND deleted_at IS NOT NULL', lambda i: (i,)),
+        ('批量修改', 'UPDATE invoices SET buyer_name = ? WHERE id = ? AND deleted_at IS NULL', lambda i: ('批量', i)),
+        ('再次删除', 'UPDATE invoices SET deleted_at = ? WHERE id = ? AND deleted_at IS NULL', lambda i: (deleted_at, i)),
+        ('彻底删除', 'DELETE FROM invoices WHERE id = ? AND deleted_at IS NOT NULL', lambda i: (i,)),
+    ]
+
+
+def set_steps(repository):
+    """与当前接口相同的语句"""
+    deleted_at = '2024-06-01 00:00:00'
+    return [
+        ('删除', repository.SOFT_DELETE_QUERY, lambda ids: (deleted_at, ids)),
+        ('恢复', repository.RESTORE_QUERY, lambda ids: (ids,)),
+        ('批量修改', f'UPDATE invoices SET buyer_name = ? WHERE {repository.LIVE_IDS_CONDITION}', lambda ids: ('批量', ids)),
+        ('再次删除', repository.SOFT_DELETE_QUERY, lambda ids: (deleted_at, ids)),
+        ('彻底删除', repository.PERMANENT_DELETE_QUERY, lambda ids: (ids,)),
+    ]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=50000)
+    parser.add_argument('--ids', type=int, default=10000)
+    args = parser.parse_args()
+    if args.ids * 2 > args.rows:
+        sys.exit('--rows 至少为 --ids 的两倍')
+
+    workdir = tempfile.mkdtemp(prefix='bench_bulk_')
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    try:
+        import app
+        import repository
+
+        with app.get_db_connection() as conn:
+            conn.executemany('''
+                INSERT INTO invoices (type, buyer_name, invoice_number, total_amount, invoice_content, pdf_path,
+                                      file_hash, amount_cents, invoice_ymd, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', make_rows(args.rows))
+            conn.commit()
+            all_ids = [row[0] for row in conn.execute('SELECT id FROM invoices')]
+        random.Random(1).shuffle(all_ids)
+        groups = {'逐条': all_ids[:args.ids], '单条语句': all_ids[args.ids:args.ids * 2]}
+
+        results = {}
+        for mode, ids in groups.items():
+            for name, sql, params in (per_id_steps() if mode == '逐条' else set_steps(repository)):
+                with app.get_db_connection() as conn:
+                    start = time.perf_counter()
+                    if mode == '逐条':
+                        affected = 0
+                        for invoice_id in ids:
+                            affected += conn.execute(sql, params(invoice_id)).rowcount
+                    else:
+                        affected = conn.execute(sql, params(json.dumps(ids))).rowcount
+                    conn.commit()
+                    results[(mode, name)] = ((time.perf_counter() - start) * 1000, affected)
+
+        print(f"{'操作':<8} {'逐条 ms':>10} {'单条语句 ms':>12} {'影响行数':>10}")
+        for name, *_ in set_steps(repository):
+            (legacy_ms, legacy_rows), (set_ms, set_rows) = results[('逐条', name)], results[('单条语句', name)]
+            print(f'{name:<8} {legacy_ms:>10.1f} {set_ms:>12.1f} {legacy_rows:>5}/{set_rows:<5}')
+
+        mismatches = app.invoice_repo.stats_mismatches()
+        print(f'统计汇总表不一致的分组: {len(mismatches)}')
+        if mismatches:
+            sys.exit(1)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,164 @@
+"""SQLite 并发延迟：每次新建连接（回滚日志） vs 连接池 + WAL
+
+用法：
+    python benchmarks/bench_db_concurrency.py [--rows 5000] [--writers 2] [--readers 8] [--duration 10]
+
+在临时数据库中预先写入 rows 条发票，然后 writers 个线程模拟上传入库（单条插入并提交），
+readers 个线程模拟列表查询（与 get_invoices 相同的 SQL），分别输出两种模式下
+写入和查询的 p50 / p95 / p99 延迟。
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db import ConnectionPool  # noqa: E402
+
+SCHEMA = '''
+    CREATE TABLE invoices (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        type TEXT NOT NULL,
+        buyer_name TEXT NOT NULL,
+        invoice_number TEXT,
+        invoice_date TEXT,
+        total_amount TEXT,
+        invoice_content TEXT,
+        seller_name TEXT,
+        bank_name TEXT,
+        bank_account TEXT,
+        pdf_path TEXT,
+        file_hash TEXT,
+        extract_method TEXT,
+        created_at TEXT,
+        updated_at TEXT
+    );
+    CREATE INDEX idx_invoices_type ON invoices(type);
+'''
+
+INSERT = '''
+    INSERT INTO invoices (type, buyer_name, invoice_number, invoice_date, total_amount, invoice_content,
+                          seller_name, bank_name, bank_account, pdf_path, file_hash, extract_method,
+                          created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+LIST = '''SELECT id, type, buyer_name, invoice_number, invoice_date, total_amount, invoice_content, seller_name,
+          bank_name, bank_account, pdf_path, created_at FROM invoices WHERE type = ? ORDER BY created_at DESC'''
+
+
+def make_row(rng, i):
+    created = f'2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 10:00:{i % 60:02d}'
+    return (rng.choice(['自费', '对公']), f'用户{rng.randint(1, 50)}', f'{rng.randint(10**11, 10**12)}',
+            f'2024{rng.randint(1, 12):02d}{rng.randint(1, 28):02d}', f'{rng.uniform(1, 5000):.2f}',
+            '*餐饮服务*餐费', '上海某某餐饮管理有限公司', '中国银行上海分行', '1001234567890123456',
+            f'{i}.pdf', f'{i:032x}', 'ocr', created, created)
+
+
+@contextmanager
+def legacy_connection(path):
+    """原 get_db_connection：每次新建连接，默认回滚日志模式"""
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    try:
+        yield conn
+    finally:
+        conn.close()
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else 0.0
+
+
+def run(mode, path, args):
+    if mode == 'pool':
+        pool = ConnectionPool(path)
+        pool.init_database()
+        connect = pool.connection
+    else:
+        pool = None
+        connect = lambda readonly=False: legacy_connection(path)  # noqa: E731
+
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    rng = random.Random(0)
+    conn.executemany(INSERT, [make_row(rng, i) for i in range(args.rows)])
+    conn.commit()
+    conn.close()
+
+    latencies = {'write': [], 'read': []}
+    errors = []
+    stop = time.perf_counter() + args.duration
+
+    def writer(seed):
+        rng = random.Random(seed)
+        i = args.rows + seed * 10**6
+        while time.perf_counter() < stop:
+            i += 1
+            start = time.perf_counter()
+            try:
+                with connect() as conn:
+                    conn.execute(INSERT, make_row(rng, i))
+                    conn.commit()
+            except sqlite3.Error as e:
+                errors.append(str(e))
+                continue
+            latencies['write'].append(time.perf_counter() - start)
+            time.sleep(args.write_interval)
+
+    def reader(seed):
+        rng = random.Random(seed)
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            try:
+                with connect(readonly=True) as conn:
+                    conn.execute(LIST, (rng.choice(['自费', '对公']),)).fetchall()
+            except sqlite3.Error as e:
+                errors.append(str(e))
+                continue
+            latencies['read'].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=writer, args=(n,)) for n in range(args.writers)]
+    threads += [threading.Thread(target=reader, args=(n,)) for n in range(args.readers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if pool:
+        pool.close_all()
+    return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--readers', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=10)
+    parser.add_argument('--write-interval', type=float, default=0.01, help='每次写入后的间隔秒数')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_db_')
+    try:
+        print(f"{'模式':<8} {'操作':<6} {'次数':>7} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'错误':>5}")
+        for mode in ('legacy', 'pool'):
+            latencies, errors = run(mode, os.path.join(workdir, f'{mode}.db'), args)
+            for op in ('write', 'read'):
+                values = latencies[op]
+                print(f'{mode:<8} {op:<6} {len(values):>7} {percentile(values, 0.5):>8.1f} '
+                      f'{percentile(values, 0.95):>8.1f} {percentile(values, 0.99):>8.1f} {len(errors):>5}')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""导出：pandas 在内存中生成整个文件 vs 从游标逐批流式生成
+
+用法：
+    python benchmarks/bench_export.py [--rows 1000000] [--batch-size 1000] [--modes stream-csv,writeonly-xlsx]
+
+在临时数据库中写入 rows 条同一类型的模拟发票，然后每种方式在单独的子进程中导出一次，
+输出总耗时、首字节时间（流式为产出第一块的时间，内存方式须等整个文件生成完）、
+导出行数、吞吐（行/秒）、输出字节数和进程峰值 RSS（ru_maxrss，及导出前的基线）：
+    pandas-csv      pd.read_sql_query + DataFrame.to_csv 写入 BytesIO（原导出接口的内存模型）
+    stream-csv      SqliteInvoiceRepository.iter_export + exporter.csv_chunks（/api/export?format=csv）
+    pandas-xlsx     pd.read_sql_query + DataFrame.to_excel（openpyxl 普通模式）写入 BytesIO（原 xlsx 导出）
+    writeonly-xlsx  iter_export + exporter.write_xlsx（openpyxl 只写模式，写入临时文件，/api/export）
+    filtered-csv    同 stream-csv，但带筛选条件（默认只导出 6 月的发票，约 1/12），在 SQL 中筛选
+pandas-xlsx 在百万行时需要数分钟和数 GB 内存，可用 --modes 跳过。
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db import ConnectionPool  # noqa: E402
+from repository import SqliteInvoiceRepository, INSERT_QUERY, EXPORT_COLUMNS  # noqa: E402
+from exporter import csv_chunks, export_headers, write_xlsx  # noqa: E402
+
+MODES = ('pandas-csv', 'stream-csv', 'pandas-xlsx', 'writeonly-xlsx', 'filtered-csv')
+FILTERS = {'type': '自费'}
+FILTERED = {'type': '自费', 'start_date': '2024-06-01', 'end_date': '2024-06-30'}
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        month, day = rng.randint(1, 12), rng.randint(1, 28)
+        cents = rng.randint(100, 500000)
+        created = f'2024-{month:02d}-{day:02d} 10:00:00'
+        yield ('自费', f'用户{rng.randint(1, 500)}', f'{i:020d}', f'2024{month:02d}{day:02d}', f'{cents / 100:.2f}',
+               '*信息技术服务*软件服务费', '深圳某某科技有限公司', '中国银行深圳分行', '6222000000000000',
+               f'{i}.pdf', f'{i:032x}', 'text_layer', cents, 20240000 + month * 100 + day, created, created)
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(mode, database, batch_size, workdir):
+    """在当前进程中导出一次，结果以 JSON 打印到 stdout"""
+    # 关闭 mmap，避免把映射的数据库文件页计入 RSS；页缓存仍为默认的 64MB
+    pool = ConnectionPool(database, mmap_size=0)
+    repo = SqliteInvoiceRepository(pool.connection)
+    if mode.startswith('pandas'):
+        import pandas as pd
+    baseline = max_rss_mb()
+    start = time.perf_counter()
+    first_byte = None
+    size = 0
+    rows = 0
+    if mode.startswith('pandas'):
+        with repo.connection(readonly=True) as conn:
+            sql, params = repo.build_export_query(FILTERS)
+            df = pd.read_sql_query(sql, conn, params=params)
+        df.columns = export_headers(df.columns)
+        output = io.BytesIO()
+        if mode == 'pandas-csv':
+            output.write(df.to_csv(index=False).encode('utf-8-sig'))
+        else:
+            with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                df.to_excel(writer, index=False, sheet_name='Invoices')
+        first_byte = time.perf_counter() - start
+        size = output.tell()
+        rows = len(df)
+    elif mode.endswith('-csv'):
+        sizes = []
+        batches = repo.iter_export(FILTERED if mode == 'filtered-csv' else FILTERS, batch_size)
+        for chunk in csv_chunks(EXPORT_COLUMNS, (sizes.append(len(batch)) or batch for batch in batches)):
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            size += len(chunk)
+        rows = sum(sizes)
+    else:
+        path = os.path.join(workdir, 'export.xlsx')
+        rows = write_xlsx(path, EXPORT_COLUMNS, repo.iter_export(FILTERS, batch_size))
+        first_byte = time.perf_counter() - start
+        size = os.path.getsize(path)
+        os.remove(path)
+    elapsed = time.perf_counter() - start
+    pool.close_all()
+    print(json.dumps({'elapsed': elapsed, 'first_byte': first_byte, 'rows': rows, 'size': size,
+                      'baseline_mb': baseline, 'peak_mb': max_rss_mb()}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    parser.add_argument('--modes', default=','.join(MODES), help='逗号分隔，可选: ' + ', '.join(MODES))
+    parser.add_argument('--run', help=argparse.SUPPRESS)
+    parser.add_argument('--database', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.run:
+        run_mode(args.run, args.database, args.batch_size, os.path.dirname(args.database))
+        return
+
+    workdir = tempfile.mkdtemp(prefix='bench_export_')
+    database = os.path.join(workdir, 'invoices.db')
+    try:
+        pool = ConnectionPool(database)
+        pool.init_database()
+        repo = SqliteInvoiceRepository(pool.connection, fts=False)
+        repo.init_schema()
+        start = time.perf_counter()
+        with repo.connection() as conn:
+            conn.executemany(INSERT_QUERY, make_rows(args.rows))
+            conn.commit()
+        pool.close_all()
+        print(f'写入 {args.rows} 行: {time.perf_counter() - start:.1f}s')
+
+        print(f"{'方式':<16} {'总耗时 s':>9} {'首字节 s':>9} {'导出行数':>9} {'行/秒':>9} {'大小 MB':>9} {'基线 RSS MB':>12} "
+              f"{'峰值 RSS MB':>12}")
+        for mode in args.modes.split(','):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', mode, '--database', database,
+                                     '--batch-size', str(args.batch_size)],
+                                    check=True, capture_output=True, text=True).stdout
+            result = json.loads(output.strip().splitlines()[-1])
+            print(f"{mode:<16} {result['elapsed']:>9.2f} {result['first_byte']:>9.3f} {result['rows']:>9} "
+                  f"{result['rows'] / result['elapsed']:>9.0f} {result['size'] / 1024 / 1024:>9.1f} "
+                  f"{result['baseline_mb']:>12.0f} {result['peak_mb']:>12.0f}")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
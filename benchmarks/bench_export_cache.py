@@ -0,0 +1,84 @@
+"""导出缓存：首次生成 vs 缓存命中 vs 条件请求 304
+
+用法：
+    python benchmarks/bench_export_cache.py [--rows 100000] [--repeat 5]
+
+在临时目录中由应用建库并写入 rows 条同一类型的发票，然后通过 Flask 测试客户端对 csv 和 xlsx
+分别请求：修改一条发票（数据版本递增）后的首次导出（生成文件并放入缓存）、再次导出（从缓存发送）、
+带 If-None-Match 的条件请求（304），输出各自的中位耗时和响应字节数。
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        month, day = rng.randint(1, 12), rng.randint(1, 28)
+        cents = rng.randint(100, 500000)
+        created = f'2024-{month:02d}-{day:02d} 10:00:00'
+        yield ('自费', f'用户{rng.randint(1, 500)}', f'{i:020d}', f'2024{month:02d}{day:02d}', f'{cents / 100:.2f}',
+               '*信息技术服务*软件服务费', '深圳某某科技有限公司', '中国银行深圳分行', '6222000000000000',
+               f'{i}.pdf', f'{i:032x}', 'text_layer', cents, 20240000 + month * 100 + day, created, created)
+
+
+def timed(func, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        size = func()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_export_cache_')
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    try:
+        import app
+        from repository import INSERT_QUERY
+
+        with app.get_db_connection() as conn:
+            conn.executemany(INSERT_QUERY, make_rows(args.rows))
+            conn.commit()
+        client = app.app.test_client()
+
+        def export(export_format, headers=None):
+            response = client.get(f'/api/export/自费?format={export_format}', headers=headers or {})
+            size = len(response.get_data())
+            response.close()
+            return response, size
+
+        print(f"{'格式':<6} {'请求':<16} {'中位 ms':>10} {'状态':>6} {'字节':>12}")
+        for export_format in ('csv', 'xlsx'):
+            # 修改一条发票使数据版本递增，之后的首次导出不会命中缓存
+            app.invoice_repo.batch_update([1], {'buyer_name': f'基准 {export_format}'})
+            results = [('首次生成', *timed(lambda: export(export_format), 1))]
+            results.append(('缓存命中', *timed(lambda: export(export_format), args.repeat)))
+            etag = export(export_format)[0].headers['ETag']
+            results.append(('条件请求', *timed(lambda: export(export_format, {'If-None-Match': etag}), args.repeat)))
+            for name, elapsed, (response, size) in results:
+                print(f'{export_format:<6} {name:<16} {elapsed:>10.1f} {response.status_code:>6} {size:>12}')
+
+        print('导出缓存:', app.export_cache.stats() if app.export_cache else '未启用')
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""后台导出任务：提交请求的耗时 vs 同步导出，以及任务进度
+
+用法：
+    python benchmarks/bench_export_jobs.py [--rows 200000] [--format xlsx]
+
+在临时目录中由应用建库并写入 rows 条同一类型的发票，然后通过 Flask 测试客户端：
+同步请求 /api/export 一次（请求线程被占用到文件生成完）；再提交 /api/export-jobs，
+记录提交请求的耗时，每 0.5 秒轮询一次进度直到完成，最后下载生成的文件。
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        month, day = rng.randint(1, 12), rng.randint(1, 28)
+        cents = rng.randint(100, 500000)
+        created = f'2024-{month:02d}-{day:02d} 10:00:00'
+        yield ('自费', f'用户{rng.randint(1, 500)}', f'{i:020d}', f'2024{month:02d}{day:02d}', f'{cents / 100:.2f}',
+               '*信息技术服务*软件服务费', '深圳某某科技有限公司', '中国银行深圳分行', '6222000000000000',
+               f'{i}.pdf', f'{i:032x}', 'text_layer', cents, 20240000 + month * 100 + day, created, created)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--format', default='xlsx', choices=('xlsx', 'csv'))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_export_jobs_')
+    os.chdir(workdir)
+    os.environ['EXPORT_CACHE_MAX_MB'] = '0'
+    sys.path.insert(0, ROOT)
+    try:
+        import app
+        from repository import INSERT_QUERY
+
+        with app.get_db_connection() as conn:
+            conn.executemany(INSERT_QUERY, make_rows(args.rows))
+            conn.commit()
+        client = app.app.test_client()
+
+        start = time.perf_counter()
+        response = client.get(f'/api/export/自费?format={args.format}')
+        size = len(response.get_data())
+        response.close()
+        print(f'同步导出: 请求耗时 {time.perf_counter() - start:.2f}s，{size} 字节')
+
+        start = time.perf_counter()
+        response = client.post('/api/export-jobs', json={'type': '自费', 'format': args.format})
+        submitted = time.perf_counter() - start
+        status_url = response.get_json()['status_url']
+        print(f'后台任务: 提交请求耗时 {submitted * 1000:.1f}ms（{response.status_code}）')
+        while True:
+            job = client.get(status_url).get_json()['data']
+            progress = job['progress'] or {}
+            print(f"  {time.perf_counter() - start:>7.1f}s  {job['status']:<8} {progress.get('done')}/{progress.get('total')}")
+            if job['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.5)
+        if job['status'] == 'failed':
+            sys.exit(job['error'])
+
+        download_start = time.perf_counter()
+        response = client.get(job['download_url'])
+        size = len(response.get_data())
+        response.close()
+        print(f"后台任务: 总耗时 {job['finished_at'] - job['created_at']:.2f}s，"
+              f'下载请求耗时 {(time.perf_counter() - download_start) * 1000:.1f}ms，{size} 字节')
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
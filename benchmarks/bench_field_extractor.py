@@ -0,0 +1,235 @@
+"""字段提取：原逐条 re.search 实现 vs field_extractor 的耗时对比与结果一致性检查
+
+用法：
+    python benchmarks/bench_field_extractor.py [--db invoices.db] [--corpus path/to/texts] [--synthetic 2000]
+
+语料来源（可叠加）：
+  --db      从 ocr_cache 表读取保存的 OCR 文本行
+  --corpus  目录下的 .json（文本行列表）或 .txt（每行一个文本行）
+  --synthetic  按常见发票文本随机生成的样本数（打乱、删减行，覆盖各字段的回退规则）
+
+对每个样本比较两种实现的输出，有任何不一致时打印差异并以非零状态退出。
+"""
+import argparse
+import json
+import os
+import random
+import re
+import sqlite3
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from field_extractor import invoice_extractor  # noqa: E402
+
+
+# 重构前 app.parse_invoice_text 的实现，作为一致性检查的基准
+def legacy_parse_invoice_text(all_text):
+    """从文本行中提取发票字段（原实现）"""
+    full_text = ' '.join(all_text)
+
+    invoice_data = {
+        'invoice_number': '', 'invoice_date': '', 'total_amount': '',
+        'invoice_content': '', 'seller_name': '', 'bank_name': '', 'bank_account': ''
+    }
+
+    # --- 1. 发票号码 (8-20位) ---
+    invoice_num_match = re.search(r'发票号码.*?(\d{8,20})', full_text)
+    if invoice_num_match:
+        invoice_data['invoice_number'] = invoice_num_match.group(1)
+
+    # --- 2. 开票日期 ---
+    date_patterns = [
+        r'(\d{4}年\d{1,2}月\d{1,2}日)', r'(\d{8})',
+        r'开票日期.*?(\d{4}年\d{1,2}月\d{1,2}日)', r'开票日期.*?(\d{8})'
+    ]
+    for pattern in date_patterns:
+        date_match = re.search(pattern, full_text)
+        if date_match:
+            date_str = date_match.group(1).replace('年', '').replace('月', '').replace('日', '')
+            if len(date_str) == 7:
+                parts = re.findall(r'\d+', date_match.group(1))
+                if len(parts) == 3:
+                    date_str = f"{parts[0]}{parts[1].zfill(2)}{parts[2].zfill(2)}"
+            invoice_data['invoice_date'] = date_str
+            break
+
+    # --- 3. 总金额 ---
+    amount_patterns = [
+        r'价税合计.*?¥\s*([\d,]+\.?\d*)', r'价税合计.*?([\d,]+\.?\d*)',
+        r'合计.*?¥\s*([\d,]+\.?\d*)', r'总金额.*?¥\s*([\d,]+\.?\d*)'
+    ]
+    for pattern in amount_patterns:
+        amount_match = re.search(pattern, full_text)
+        if amount_match:
+            invoice_data['total_amount'] = amount_match.group(1).replace(',', '')
+            break
+
+    # --- 4. 发票内容 (修复：只取*号中间的内容及紧跟的文字) ---
+    # 逻辑：寻找 *xxx*yyyy 格式，或者 "名称" 后面紧跟的非表头文字
+    content_patterns = [
+        r'(\*[\u4e00-\u9fa5]+\*[^\s\d¥*]+)', # 优先匹配 *分类*商品名，例如 *生物化学制品*试剂
+        r'(\*[\u4e00-\u9fa5]+\*)',         # 如果没有商品名，至少匹配 *生物化学制品*
+        r'货物或应税劳务名称.*?[:：]?\s*([^\d¥\s]+)(?=\s)',
+        r'项目名称.*?[:：]?\s*([^\d¥\s]+)(?=\s)'
+    ]
+    for pattern in content_patterns:
+        content_match = re.search(pattern, full_text)
+        if content_match:
+            content = content_match.group(1).strip()
+            # 再次检查，如果抓到了“规格”、“单位”等表头，说明抓错了，跳过
+            if "规格" not in content and "单价" not in content and "单位" not in content and "数量" not in content:
+                invoice_data['invoice_content'] = content
+                break
+
+    # --- 5. 销售方名称 (修复：更严格的截止词) ---
+    # 逻辑：先定位到“销售方”，然后找“名称”，然后抓取公司名，遇到“买方”、“统一”、“纳税人”等立刻停止
+    seller_patterns = [
+        # 尝试匹配：销售方...名称：xxx公司
+        r'销售方.*?名称[:：]?\s*([\u4e00-\u9fa5]+(?:公司|中心|厂|店|行))',
+        # 尝试匹配：销售方...名称：xxx (直到遇到干扰词)
+        r'销售方.*?名称[:：]?\s*([^\s]+)(?=\s+(?:买方|名称|纳税人|统一|地址|电话|注|开户|银行)|$)'
+    ]
+    for pattern in seller_patterns:
+        seller_match = re.search(pattern, full_text)
+        if seller_match:
+            name = seller_match.group(1).strip()
+            # 清洗前面的干扰词 (比如 OCR 把 "信" 字也识别进来了)
+            name = re.sub(r'^[^\u4e00-\u9fa5]+', '', name) # 去掉开头非汉字字符
+            if len(name) > 4: # 公司名通常大于4个字
+                invoice_data['seller_name'] = name
+                break
+
+    # --- 6. 银行信息 (修复：遇到分号或“账号”立即停止) ---
+    bank_patterns = [
+        # 匹配 开户行... 之后的文字，直到遇到 ; ； 账号 银行账号 或行尾
+        r'开户(?:银行|行)[:：]?\s*([^\s;；]+)(?=\s*[;；]|\s+(?:银行)?账号|$)',
+    ]
+    for pattern in bank_patterns:
+        bank_match = re.search(pattern, full_text)
+        if bank_match:
+            bank = bank_match.group(1).strip()
+            # 清理可能残留的尾部标点
+            bank = re.sub(r'[;；:：]+$', '', bank)
+            invoice_data['bank_name'] = bank
+            break
+
+    # --- 7. 银行账号 ---
+    account_patterns = [r'(?:银行)?账号[:：]?\s*(\d{10,30})']
+    for pattern in account_patterns:
+        account_match = re.search(pattern, full_text)
+        if account_match:
+            invoice_data['bank_account'] = account_match.group(1).strip()
+            break
+
+    return invoice_data
+
+
+SYNTHETIC_LINES = [
+    '电子发票（普通发票）', '发票号码：24112000000123456789', '发票号码: 12345678', '开票日期：2024年01月05日',
+    '开票日期: 2024年1月5日', '开票日期 20240105', '购买方信息', '名称：北京某某科技有限公司',
+    '统一社会信用代码/纳税人识别号：91110108MA01XXXXXX', '销售方信息', '销售方', '名称：上海某某生物技术有限公司',
+    '名称: 某某', '名 称：杭州某某贸易中心', '项目名称', '货物或应税劳务名称', '规格型号', '单位', '数量', '单价',
+    '*生物化学制品*试剂盒', '*经纪代理服务*', '*餐饮服务*餐费 1 100.00', '合计', '¥100.00', '¥ 1,234.50',
+    '价税合计（大写）', '壹佰元整', '（小写）¥123.45', '价税合计 456.70', '总金额 ¥ 88', '备注',
+    '开户银行：中国工商银行上海分行；银行账号：1001234567890123456', '开户行:招商银行北京分行 账号:6225880112345678',
+    '开户银行: 建设银行; 账号 622700123456', '收款人：张三', '复核：李四', '开票人：王五', '地址、电话：上海市',
+    '买方', '注', '名称', '\n', '价税合计\n¥10.00', '销售方 名称\n某某公司',
+]
+
+
+# 明细行、表头等与字段无关的文本，使样本长度接近真实发票（约 60 行）
+FILLER_LINES = [
+    '*餐饮服务*餐费', '1', '100.00', '6%', '6.00', '规格型号', '单位', '数量', '单价', '金额', '税率/征收率',
+    '税额', '北京市海淀区某某路1号 010-12345678', '中国银行北京分行 1234',
+]
+
+
+def synthetic_corpus(count, seed=0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        lines = rng.sample(SYNTHETIC_LINES, rng.randint(3, len(SYNTHETIC_LINES)))
+        if rng.random() < 0.5:
+            lines.sort(key=SYNTHETIC_LINES.index)  # 保持阅读顺序
+        lines += rng.choices(FILLER_LINES, k=rng.randint(0, 60))
+        if rng.random() < 0.2:
+            # 模拟识别不完整：去掉所有含数字的行，覆盖各字段的回退规则
+            lines = [line for line in lines if not re.search(r'\d', line)]
+        corpus.append(lines)
+    return corpus
+
+
+def db_corpus(path):
+    conn = sqlite3.connect(path)
+    try:
+        return [json.loads(row[0]) for row in conn.execute('SELECT lines FROM ocr_cache')]
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.close()
+
+
+def dir_corpus(path):
+    corpus = []
+    for name in sorted(os.listdir(path)):
+        with open(os.path.join(path, name), encoding='utf-8') as f:
+            if name.endswith('.json'):
+                corpus.append(json.load(f))
+            elif name.endswith('.txt'):
+                corpus.append(f.read().splitlines())
+    return corpus
+
+
+def timed(func, corpus, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for lines in corpus:
+            func(lines)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', help='包含 ocr_cache 表的数据库')
+    parser.add_argument('--corpus', help='OCR 文本目录')
+    parser.add_argument('--synthetic', type=int, default=2000, help='随机生成的样本数')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    corpus = synthetic_corpus(args.synthetic)
+    if args.db:
+        corpus += db_corpus(args.db)
+    if args.corpus:
+        corpus += dir_corpus(args.corpus)
+    if not corpus:
+        sys.exit('没有样本')
+
+    def new_parse(lines):
+        return invoice_extractor.extract(' '.join(lines))
+
+    mismatches = 0
+    for lines in corpus:
+        expected, actual = legacy_parse_invoice_text(lines), new_parse(lines)
+        if expected != actual:
+            mismatches += 1
+            if mismatches <= 5:
+                diff = {k: (expected[k], actual[k]) for k in expected if expected[k] != actual[k]}
+                print(f'不一致: {lines}\n  {diff}')
+
+    legacy = timed(legacy_parse_invoice_text, corpus, args.repeat)
+    current = timed(new_parse, corpus, args.repeat)
+    print(f'样本数: {len(corpus)}  不一致: {mismatches}')
+    print(f'原实现: {legacy * 1e6 / len(corpus):.1f} µs/样本')
+    print(f'field_extractor: {current * 1e6 / len(corpus):.1f} µs/样本')
+    print(f'加速比: {legacy / current:.2f}x')
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,98 @@
+"""不同栅格化分辨率 / 灰度设置下的耗时与字段召回率
+
+用法：
+    python benchmarks/bench_raster_dpi.py --samples path/to/pdfs [--dpis 100,150,200,300] [--labels labels.json]
+
+labels.json 为 {"文件名.pdf": {"invoice_number": ..., "invoice_date": ..., "total_amount": ...}}；
+不提供时以最高分辨率 RGB 的识别结果作为参照。每个设置输出平均渲染耗时、OCR 耗时、
+必填字段（号码 / 日期 / 金额）召回率和全部字段召回率。
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def recall(results, reference, fields):
+    hit = total = 0
+    for name, data in results.items():
+        for field in fields:
+            expected = reference.get(name, {}).get(field)
+            if not expected:
+                continue
+            total += 1
+            hit += data.get(field) == expected
+    return hit / total if total else 0.0
+
+
+def run(app, pdfs, dpi, grayscale):
+    results, render_ms, ocr_ms = {}, 0.0, 0.0
+    for name, pdf_bytes in pdfs:
+        start = time.perf_counter()
+        image = app.to_ocr_array(app.render_page(pdf_bytes, dpi=dpi, grayscale=grayscale))
+        render_ms += (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        results[name] = app.ocr_pages([image])[0][0]
+        ocr_ms += (time.perf_counter() - start) * 1000
+    return results, render_ms / len(pdfs), ocr_ms / len(pdfs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--samples', required=True, help='样本 PDF 目录')
+    parser.add_argument('--dpis', default='100,150,200,300')
+    parser.add_argument('--labels', help='人工标注的字段 JSON')
+    parser.add_argument('--no-roi', action='store_true', help='关闭按版式区域识别')
+    args = parser.parse_args()
+
+    dpis = sorted(int(dpi) for dpi in args.dpis.split(','))
+    pdfs = []
+    for name in sorted(os.listdir(args.samples)):
+        if name.lower().endswith('.pdf'):
+            with open(os.path.join(args.samples, name), 'rb') as f:
+                pdfs.append((name, f.read()))
+    if not pdfs:
+        sys.exit(f'{args.samples} 中没有 PDF 文件')
+
+    # 在 Web 进程内单实例识别，只测量渲染和 OCR 本身
+    os.environ['OCR_WORKER_PROCESSES'] = '0'
+    workdir = tempfile.mkdtemp(prefix='bench_dpi_')
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    try:
+        import app
+        app.app.config['OCR_ROI_ENABLED'] = not args.no_roi
+        app.init_ocr()
+
+        runs = {}
+        for dpi in reversed(dpis):
+            for grayscale in (False, True):
+                runs[(dpi, grayscale)] = run(app, pdfs, dpi, grayscale)
+
+        if args.labels:
+            with open(args.labels, encoding='utf-8') as f:
+                reference = json.load(f)
+        else:
+            reference = runs[(dpis[-1], False)][0]
+
+        all_fields = list(next(iter(reference.values())).keys())
+        print(f'样本数: {len(pdfs)}  参照: {"标注" if args.labels else f"{dpis[-1]} DPI RGB"}')
+        print(f"{'DPI':>5} {'模式':<6} {'渲染ms':>8} {'OCRms':>8} {'合计ms':>8} {'必填召回':>8} {'全部召回':>8}")
+        for dpi in dpis:
+            for grayscale in (False, True):
+                results, render_ms, ocr_ms = runs[(dpi, grayscale)]
+                print(f"{dpi:>5} {'gray' if grayscale else 'rgb':<6} {render_ms:>8.1f} {ocr_ms:>8.1f} "
+                      f"{render_ms + ocr_ms:>8.1f} {recall(results, reference, app.REQUIRED_FIELDS):>8.1%} "
+                      f"{recall(results, reference, all_fields):>8.1%}")
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
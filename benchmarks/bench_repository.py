@@ -0,0 +1,138 @@
+"""数据访问层基准：不经过 Flask，直接调用 SqliteInvoiceRepository 的各个方法
+
+用法：
+    python benchmarks/bench_repository.py [--rows 1000000] [--database :memory:] [--repeat 20] [--ids 1000]
+
+用连接池打开 database（默认 ':memory:'，也可以传文件路径以包含磁盘 I/O），由仓库建表
+（含全文索引和统计汇总表触发器），批量写入 rows 条模拟发票，然后对列表翻页、详情、查重、
+搜索、统计、单条写入以及批量删除 / 恢复 / 修改 / 彻底删除逐个计时，输出中位数和 p95 耗时。
+优化某个查询前后各跑一次，对比同一行即可；最后检查统计汇总表与明细一致。
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from db import ConnectionPool  # noqa: E402
+from repository import SqliteInvoiceRepository, INSERT_QUERY  # noqa: E402
+
+SELLERS = ['上海{}生物技术有限公司', '北京{}餐饮管理有限公司', '杭州{}贸易中心', '深圳{}科技有限公司']
+CONTENTS = ['*生物化学制品*试剂', '*餐饮服务*餐费', '*住宿服务*住宿费', '*信息技术服务*软件服务费']
+WORDS = ['华东', '正泰', '恒源', '新世纪', '鼎盛', '安康']
+TYPES = ['自费', '对公']
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        month, day = rng.randint(1, 12), rng.randint(1, 28)
+        cents = rng.randint(100, 500000)
+        created = f'2024-{month:02d}-{day:02d} {i // 3600 % 24:02d}:{i // 60 % 60:02d}:{i % 60:02d}'
+        yield (rng.choice(TYPES), f'用户{rng.randint(1, 500)}', f'{i:020d}', f'2024{month:02d}{day:02d}',
+               f'{cents / 100:.2f}', rng.choice(CONTENTS), rng.choice(SELLERS).format(rng.choice(WORDS)),
+               '中国银行', '6222000000000000', f'{i}.pdf', f'{i:032x}', 'text_layer',
+               cents, 20240000 + month * 100 + day, created, created)
+
+
+def invoice_data(i):
+    return {'invoice_number': f'new{i:017d}', 'invoice_date': '2024年6月1日', 'total_amount': '¥128.50',
+            'invoice_content': '*餐饮服务*餐费', 'seller_name': '北京恒源餐饮管理有限公司',
+            'bank_name': '中国银行', 'bank_account': '6222000000000000'}
+
+
+def timed(func, repeat):
+    samples = []
+    for n in range(repeat):
+        start = time.perf_counter()
+        func(n)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[max(0, int(len(samples) * 0.95) - 1)]
+
+
+def walk_pages(repo, pages, sort_by, order):
+    after = None
+    for _ in range(pages):
+        _, after = repo.list_page('自费', sort_by, order, 50, after)
+        if after is None:
+            break
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--database', default=':memory:', help="SQLite 文件路径，或 ':memory:'")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--ids', type=int, default=1000, help='批量操作每次处理的 id 个数')
+    args = parser.parse_args()
+
+    workdir = None
+    database = args.database
+    if database != ':memory:' and not os.path.dirname(database):
+        workdir = tempfile.mkdtemp(prefix='bench_repo_')
+        database = os.path.join(workdir, database)
+    pool = ConnectionPool(database)
+    try:
+        pool.init_database()
+        repo = SqliteInvoiceRepository(pool.connection)
+        repo.init_schema()
+
+        start = time.perf_counter()
+        with repo.connection() as conn:
+            conn.executemany(INSERT_QUERY, make_rows(args.rows))
+            conn.commit()
+            conn.execute('ANALYZE')
+        print(f'{database}: 写入 {args.rows} 行 {time.perf_counter() - start:.1f}s，全文索引: {repo.fts_enabled}')
+
+        rng = random.Random(1)
+        ids = list(range(1, args.rows + 1))
+        rng.shuffle(ids)
+        batches = [ids[n * args.ids:(n + 1) * args.ids] for n in range(args.repeat)]
+        cases = [
+            ('list 第一页 created_at', lambda n: repo.list_page('自费', 'created_at', 'DESC', 50)),
+            ('list 第一页 total_amount', lambda n: repo.list_page('自费', 'total_amount', 'ASC', 50)),
+            ('list 连续翻 20 页', lambda n: walk_pages(repo, 20, 'invoice_date', 'DESC')),
+            ('list 总数 / 总金额', lambda n: repo.type_totals('自费')),
+            ('detail', lambda n: repo.get(rng.randint(1, args.rows))),
+            ('duplicate hash', lambda n: repo.has_file_hash(f'{rng.randint(0, args.rows):032x}')),
+            ('duplicate number', lambda n: repo.has_invoice_number(f'{rng.randint(0, args.rows):020d}')),
+            ('search 无条件', lambda n: repo.search({})),
+            ('search 关键词（稀有）', lambda n: repo.search({'keyword': '00000012345'})),
+            ('search 关键词（高频）', lambda n: repo.search({'keyword': '餐饮服务'})),
+            ('search 类型 + 日期范围', lambda n: repo.search({'type': '对公', 'start_date': '2024-06-01',
+                                                             'end_date': '2024-06-30'})),
+            ('search 金额范围', lambda n: repo.search({'min_amount': '100', 'max_amount': '105'})),
+            ('statistics', lambda n: repo.statistics()),
+            ('insert 单条', lambda n: repo.insert('自费', '基准', invoice_data(n), f'new{n}.pdf',
+                                                f'new{n:029x}', 'text_layer')),
+            (f'soft_delete {args.ids} 条', lambda n: repo.soft_delete(batches[n])),
+            (f'restore {args.ids} 条', lambda n: repo.restore(batches[n])),
+            (f'batch_update {args.ids} 条', lambda n: repo.batch_update(batches[n], {'buyer_name': '批量'})),
+            (f'soft_delete + purge {args.ids} 条',
+             lambda n: (repo.soft_delete(batches[n]), repo.purge(batches[n]))),
+        ]
+
+        print(f"{'操作':<32} {'中位 ms':>10} {'p95 ms':>10}")
+        for name, func in cases:
+            median, p95 = timed(func, args.repeat)
+            print(f'{name:<32} {median:>10.2f} {p95:>10.2f}')
+
+        mismatches = repo.stats_mismatches()
+        print(f'统计汇总表不一致的分组: {len(mismatches)}')
+        if mismatches:
+            sys.exit(1)
+    finally:
+        pool.close_all()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""关键词搜索：LIKE '%关键词%' vs FTS5 trigram 全文索引
+
+用法：
+    python benchmarks/bench_search_fts.py [--rows 1000000] [--repeat 20]
+
+在临时目录中由应用建库（含 invoices_fts 和同步触发器），批量写入 rows 条模拟发票，
+然后用仓库的 build_search_query 分别生成 LIKE 和 FTS 两种查询，对若干关键词（可叠加类型 / 日期筛选）
+输出中位数和 p95 耗时，以及两种查询的命中条数（最多 100）。
+命中很少或没有命中的关键词是 LIKE 的最坏情况（扫描整张表）；
+命中大量记录的高频词 FTS 需要对全部命中按 bm25 排序。
+"自动"一列与 /api/search 相同：先用 fts_match_is_broad 探测命中数，再选择其中一种查询。
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SELLERS = ['上海{}生物技术有限公司', '北京{}餐饮管理有限公司', '杭州{}贸易中心', '深圳{}科技有限公司',
+           '广州{}酒店管理有限公司', '成都{}医药连锁有限公司']
+CONTENTS = ['*生物化学制品*试剂', '*餐饮服务*餐费', '*经纪代理服务*代订车票', '*住宿服务*住宿费',
+            '*信息技术服务*软件服务费', '*医疗仪器器械*离心管', '*运输服务*客运服务费']
+WORDS = ['华东', '正泰', '恒源', '新世纪', '鼎盛', '安康', '博远', '瑞丰', '宏达', '金桥']
+
+QUERIES = [
+    {'keyword': '生物化学'},
+    {'keyword': '恒源餐饮'},
+    {'keyword': '000000123'},  # 发票号码片段，只命中少量记录
+    {'keyword': '不存在的销售方'},
+    {'keyword': '软件服务费', 'type': '对公'},
+    {'keyword': '住宿服务', 'type': '自费', 'start_date': '2024-06-01', 'end_date': '2024-06-30'},
+]
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        month, day = rng.randint(1, 12), rng.randint(1, 28)
+        cents = rng.randint(100, 500000)
+        yield (rng.choice(['自费', '对公']), f'用户{rng.randint(1, 500)}', f'{rng.randint(10**7, 10**8 - 1)}{i:012d}',
+               f'2024{month:02d}{day:02d}', f'{cents / 100:.2f}', rng.choice(CONTENTS),
+               rng.choice(SELLERS).format(rng.choice(WORDS)), f'{i}.pdf', f'{i:032x}', 'ocr', cents,
+               20240000 + month * 100 + day, f'2024-{month:02d}-{day:02d} 10:00:00')
+
+
+def timed(conn, sql, params, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        rows = conn.execute(sql, params).fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[int(len(samples) * 0.95) - 1], len(rows)
+
+
+def timed_auto(repo, conn, query_args, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        keyword = query_args['keyword']
+        use_fts = len(keyword) >= 3 and not repo.fts_match_is_broad(conn, keyword)
+        conn.execute(*repo.build_search_query(query_args, use_fts=use_fts)).fetchall()
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), 'FTS' if use_fts else 'LIKE'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_fts_')
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    try:
+        import app
+        repo = app.invoice_repo
+        if not repo.fts_enabled:
+            sys.exit('当前 SQLite 不支持 FTS5 trigram')
+
+        start = time.perf_counter()
+        with app.get_db_connection() as conn:
+            conn.executemany('''
+                INSERT INTO invoices (type, buyer_name, invoice_number, invoice_date, total_amount,
+                                      invoice_content, seller_name, pdf_path, file_hash, extract_method,
+                                      amount_cents, invoice_ymd, created_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', make_rows(args.rows))
+            conn.commit()
+            conn.execute('ANALYZE')
+        print(f'写入 {args.rows} 行（含全文索引）: {time.perf_counter() - start:.1f}s')
+
+        print(f"{'查询':<48} {'LIKE 中位':>9} {'LIKE p95':>9} {'FTS 中位':>9} {'FTS p95':>9} {'命中':>9} {'自动':>12}")
+        with app.get_db_connection(readonly=True) as conn:
+            for query_args in QUERIES:
+                like = timed(conn, *repo.build_search_query(query_args, use_fts=False), args.repeat)
+                fts = timed(conn, *repo.build_search_query(query_args, use_fts=True), args.repeat)
+                label = ' '.join(f'{k}={v}' for k, v in query_args.items())
+                auto, chosen = timed_auto(repo, conn, query_args, args.repeat)
+                hits = f'{like[2]}/{fts[2]}'
+                print(f'{label:<48} {like[0]:>9.1f} {like[1]:>9.1f} {fts[0]:>9.1f} {fts[1]:>9.1f} {hits:>9} '
+                      f'{auto:>7.1f} {chosen:<4}')
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
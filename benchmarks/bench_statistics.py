@@ -0,0 +1,99 @@
+"""统计接口：直接聚合 invoices vs 读取触发器维护的汇总表
+
+用法：
+    python benchmarks/bench_statistics.py [--rows 200000] [--repeat 20]
+
+在临时目录中由应用建库，批量写入 rows 条模拟发票（同时记录汇总表触发器带来的写入耗时），
+然后分别执行原来的三条全表聚合和 /api/statistics 当前使用的汇总表查询，输出中位数耗时，
+并检查两者结果一致、汇总表与全量重算一致。
+"""
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 原 get_statistics 直接在 invoices 上聚合的查询
+LEGACY_QUERIES = [
+    '''SELECT COUNT(*), COALESCE(SUM(amount_cents), 0) / 100.0, COALESCE(AVG(amount_cents), 0) / 100.0,
+              COALESCE(MAX(amount_cents), 0) / 100.0, COALESCE(MIN(amount_cents), 0) / 100.0
+       FROM invoices WHERE amount_cents IS NOT NULL''',
+    'SELECT type, COUNT(*), COALESCE(SUM(amount_cents), 0) / 100.0 FROM invoices GROUP BY type',
+    '''SELECT CAST(invoice_ymd / 100 AS TEXT), COUNT(*), COALESCE(SUM(amount_cents), 0) / 100.0
+       FROM invoices WHERE invoice_ymd / 100 IS NOT NULL
+       GROUP BY invoice_ymd / 100 ORDER BY invoice_ymd / 100 DESC LIMIT 12''',
+]
+
+
+def make_rows(count, seed=0):
+    rng = random.Random(seed)
+    for i in range(count):
+        year, month, day = rng.choice([2023, 2024]), rng.randint(1, 12), rng.randint(1, 28)
+        cents = rng.randint(100, 500000) if rng.random() > 0.01 else None
+        yield (rng.choice(['自费', '对公']), f'用户{rng.randint(1, 500)}', f'{i:020d}', f'{i:032x}',
+               cents, year * 10000 + month * 100 + day, f'{year}-{month:02d}-{day:02d} 10:00:00')
+
+
+def timed(conn, queries, repeat):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [[tuple(row) for row in conn.execute(sql)] for sql in queries]
+        samples.append((time.perf_counter() - start) * 1000)
+    return statistics.median(samples), results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rows', type=int, default=200000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench_stats_')
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    try:
+        import app
+        import repository
+
+        insert = '''
+            INSERT INTO invoices (type, buyer_name, invoice_number, file_hash, amount_cents, invoice_ymd, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        '''
+        with app.get_db_connection() as conn:
+            for label, drop in (('无汇总触发器', True), ('有汇总触发器', False)):
+                conn.execute('DELETE FROM invoices')
+                triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE name LIKE 'invoices_stats_%'").fetchall()
+                for name, _ in triggers if drop else []:
+                    conn.execute(f'DROP TRIGGER {name}')
+                start = time.perf_counter()
+                conn.executemany(insert, make_rows(args.rows))
+                conn.commit()
+                print(f'写入 {args.rows} 行（{label}）: {time.perf_counter() - start:.1f}s')
+                for _, sql in triggers if drop else []:
+                    conn.execute(sql)
+            repository.rebuild_stats(conn.cursor())
+            conn.commit()
+            conn.execute('ANALYZE')
+
+        with app.get_db_connection(readonly=True) as conn:
+            current = [repository.STATS_SUMMARY_QUERY, repository.STATS_BY_TYPE_QUERY, repository.STATS_BY_MONTH_QUERY]
+            legacy_ms, legacy = timed(conn, LEGACY_QUERIES, args.repeat)
+            current_ms, result = timed(conn, current, args.repeat)
+            print(f'直接聚合: {legacy_ms:.2f}ms  汇总表: {current_ms:.3f}ms  结果一致: {legacy == result}')
+            mismatches = repository.stats_mismatches(conn.cursor())
+            print(f'汇总表与全量重算不一致的分组: {len(mismatches)}')
+        if legacy != result or mismatches:
+            sys.exit(1)
+    finally:
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+import os
+import uuid
+import queue
+import sqlite3
+import threading
+import logging
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionPool:
+    """SQLite 连接池
+
+    连接用完后放回池中复用，不再每个请求都重新打开数据库。读写连接和只读连接
+    分开存放：只读连接以 mode=ro 打开并设置 query_only，供 GET 接口使用。
+    同一线程嵌套使用时会拿到不同的连接，互不影响彼此的事务；归还时回滚
+    未提交的事务，行为与原来关闭连接一致。
+
+    path 为 ':memory:' 时使用共享缓存的内存数据库，池中所有连接看到同一个库，
+    由一个常驻连接保持其存在，close_all 时释放（用于基准测试和临时环境）。
+    内存库没有 WAL，读写并发时可能出现 database table is locked，不适合生产使用。
+    """
+
+    def __init__(self, path, pool_size=8, journal_mode='WAL', synchronous='NORMAL',
+                 cache_size_kb=65536, mmap_size=256 * 1024 * 1024, temp_store='MEMORY',
+                 busy_timeout_ms=5000):
+        self.path = path
+        self.pool_size = pool_size
+        self.journal_mode = journal_mode
+        self.pragmas = [
+            ('synchronous', synchronous),
+            ('cache_size', -cache_size_kb),  # 负数表示 KB
+            ('mmap_size', mmap_size),
+            ('temp_store', temp_store),
+            ('busy_timeout', busy_timeout_ms),
+        ]
+        self._lock = threading.Lock()
+        self._memory_uri = None
+        self._keeper = None
+        if path == ':memory:':
+            self._memory_uri = f'file:memdb-{uuid.uuid4().hex}?mode=memory&cache=shared'
+            self._keeper = sqlite3.connect(self._memory_uri, uri=True, check_same_thread=False)
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = {False: queue.LifoQueue(), True: queue.LifoQueue()}
+        self.opened = 0
+        self.reused = 0
+
+    def _open(self, readonly):
+        if self._memory_uri:
+            conn = sqlite3.connect(self._memory_uri, uri=True, check_same_thread=False)
+        elif readonly:
+            conn = sqlite3.connect(f'file:{os.path.abspath(self.path)}?mode=ro', uri=True,
+                                   check_same_thread=False)
+        else:
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas:
+            conn.execute(f'PRAGMA {name} = {value}')
+        if readonly:
+            conn.execute('PRAGMA query_only = ON')
+        with self._lock:
+            self.opened += 1
+        return conn
+
+    def init_database(self):
+        """设置持久化在数据库文件中的日志模式（WAL），需在建表前调用一次"""
+        if self._memory_uri:
+            return
+        conn = sqlite3.connect(self.path)
+        try:
+            mode = conn.execute(f'PRAGMA journal_mode = {self.journal_mode}').fetchone()[0]
+            logger.info(f'SQLite 日志模式: {mode}')
+        finally:
+            conn.close()
+
+    @contextmanager
+    def connection(self, readonly=False):
+        # 连接不能跨 fork 使用，子进程中重新建池
+        if os.getpid() != self._pid:
+            with self._lock:
+                if os.getpid() != self._pid:
+                    self._reset()
+
+        idle = self._idle[readonly]
+        try:
+            conn = idle.get_nowait()
+            with self._lock:
+                self.reused += 1
+        except queue.Empty:
+            conn = self._open(readonly)
+
+        try:
+            yield conn
+        except BaseException:
+            self._discard(conn)
+            raise
+        else:
+            self._release(conn, idle)
+
+    def _release(self, conn, idle):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            self._discard(conn)
+            return
+        if idle.qsize() < self.pool_size:
+            idle.put(conn)
+        else:
+            conn.close()
+
+    @staticmethod
+    def _discard(conn):
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+
+    def close_all(self):
+        for idle in self._idle.values():
+            while True:
+                try:
+                    self._discard(idle.get_nowait())
+                except queue.Empty:
+                    break
+        if self._keeper:
+            self._discard(self._keeper)
+            self._keeper = None
+
+    def stats(self):
+        return {
+            'pool_size': self.pool_size,
+            'idle': self._idle[False].qsize(),
+            'idle_readonly': self._idle[True].qsize(),
+            'opened': self.opened,
+            'reused': self.reused,
+        }
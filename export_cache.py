@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import shutil
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 导出文件的列、表头或行序变化时递增，使按旧格式生成的缓存文件和 ETag 失效
+LAYOUT_VERSION = 2
+
+
+class ExportCache:
+    """导出文件的磁盘缓存，按 (类型, 筛选条件, 格式, 数据版本) 命中，总大小超过 max_bytes 时按最近使用时间淘汰
+
+    数据版本随该类型的每次写入变化（见 repository.init_data_versions），数据变化后旧键不会再被请求，
+    旧文件留在目录中等待淘汰。文件先写入同目录的 .part 临时文件，完成后原子改名放入缓存，
+    生成失败或客户端中途断开不会留下半个文件。最近使用时间记录在文件的 mtime 上，多个进程可以共用一个目录。
+
+    get / write 返回已打开的文件对象：文件被其他请求淘汰时，已打开的句柄仍可读完。
+    """
+
+    def __init__(self, directory, max_bytes, part_max_age=3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.part_max_age = part_max_age
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(filters, export_format, version):
+        """缓存键，同时用作响应的 ETag"""
+        payload = json.dumps([LAYOUT_VERSION, filters, export_format, version], sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def _part_path(self, key):
+        return os.path.join(self.directory, f'{key}.{uuid.uuid4().hex}.part')
+
+    def get(self, key):
+        """命中时返回以二进制只读方式打开的文件并刷新其最近使用时间，未命中返回 None"""
+        try:
+            output = open(self._path(key), 'rb')
+        except FileNotFoundError:
+            self._count('misses')
+            return None
+        try:
+            os.utime(output.fileno())
+        except OSError:
+            pass
+        self._count('hits')
+        return output
+
+    def write(self, key, build):
+        """调用 build(临时文件路径) 生成文件并放入缓存，返回打开的文件"""
+        part = self._part_path(key)
+        try:
+            build(part)
+            output = open(part, 'rb')
+        except BaseException:
+            self._discard(part)
+            raise
+        self._commit(part, key)
+        return output
+
+    def copy_to(self, key, dest):
+        """命中时把缓存文件硬链接（跨文件系统时复制）到 dest 并返回 True，未命中返回 False"""
+        output = self.get(key)
+        if output is None:
+            return False
+        with output:
+            try:
+                os.link(self._path(key), dest)
+            except FileNotFoundError:
+                # 打开之后被淘汰，已打开的句柄仍可读完
+                with open(dest, 'wb') as target:
+                    shutil.copyfileobj(output, target)
+            except OSError:
+                shutil.copyfile(self._path(key), dest)
+        return True
+
+    def add(self, key, source):
+        """把已生成好的文件 source 放入缓存（硬链接，跨文件系统时复制），source 保持不变"""
+        part = self._part_path(key)
+        try:
+            try:
+                os.link(source, part)
+            except OSError:
+                shutil.copyfile(source, part)
+        except BaseException:
+            self._discard(part)
+            raise
+        self._commit(part, key)
+
+    def tee(self, key, chunks):
+        """原样产出 chunks，同时写入临时文件；全部产出后才放入缓存，生成器被提前关闭时丢弃"""
+        part = self._part_path(key)
+        try:
+            with open(part, 'wb') as output:
+                for chunk in chunks:
+                    output.write(chunk)
+                    yield chunk
+        except BaseException:
+            self._discard(part)
+            raise
+        self._commit(part, key)
+
+    def _commit(self, part, key):
+        """把生成完的临时文件放入缓存并淘汰旧文件；单个文件超过 max_bytes 时不缓存，以免挤掉其他文件"""
+        if os.path.getsize(part) > self.max_bytes:
+            self._discard(part)
+            return
+        os.replace(part, self._path(key))
+        self.evict()
+
+    def _discard(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """按最近使用时间从旧到新删除，直到总大小不超过 max_bytes；同时清理进程异常退出时遗留的临时文件"""
+        entries = []
+        stale_before = time.time() - self.part_max_age
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            if entry.name.endswith('.part'):
+                if stat.st_mtime < stale_before:
+                    self._discard(entry.path)
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._discard(path)
+            total -= size
+            removed += 1
+
+        if removed:
+            self._count('evictions', removed)
+            logger.info(f'导出缓存淘汰了 {removed} 个文件')
+        return removed
+
+    def stats(self):
+        entries = 0
+        size_bytes = 0
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.part'):
+                continue
+            try:
+                size_bytes += entry.stat().st_size
+            except FileNotFoundError:
+                continue
+            entries += 1
+
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'size_bytes': size_bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,97 @@
+import io
+import csv
+from datetime import date, datetime
+from decimal import Decimal
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+
+from repository import parse_amount_cents, parse_date_ymd
+
+# 导出格式 -> Content-Type
+EXPORT_MIMETYPES = {
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'csv': 'text/csv',
+}
+
+# 导出文件的中文表头（列名 -> 表头），未列出的列沿用列名
+EXPORT_HEADERS = {
+    'type': '类型', 'buyer_name': '购买人', 'invoice_number': '发票号码',
+    'invoice_date': '开票日期', 'total_amount': '总金额', 'invoice_content': '内容',
+    'seller_name': '销售方', 'bank_name': '开户行', 'bank_account': '账号',
+    'file_hash': '文件哈希', 'created_at': '上传时间', 'updated_at': '更新时间', 'extract_method': '识别方式'
+}
+
+
+def export_headers(columns):
+    return [EXPORT_HEADERS.get(column, column) for column in columns]
+
+
+def _drain(buffer):
+    text = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate(0)
+    return text
+
+
+def csv_chunks(columns, batches):
+    """把逐批读取的行转为 CSV 字节块，每批一块；开头带 UTF-8 BOM，Excel 打开时不会乱码
+
+    batches 为行列表的迭代器（如 SqliteInvoiceRepository.iter_export），内存中只保留当前一批。
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(export_headers(columns))
+    yield ('\ufeff' + _drain(buffer)).encode('utf-8')
+    for rows in batches:
+        writer.writerows(rows)
+        yield _drain(buffer).encode('utf-8')
+
+
+def _amount_cell(value):
+    cents = parse_amount_cents(value)
+    return None if cents is None else Decimal(cents) / 100
+
+def _date_cell(value):
+    ymd = parse_date_ymd(value)
+    return None if ymd is None else date(ymd // 10000, ymd // 100 % 100, ymd % 100)
+
+def _datetime_cell(value):
+    try:
+        return datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+
+# Excel 中按数字 / 日期写入的列：列名 -> (转换函数, 数字格式)；无法转换的值仍按原文本写入
+XLSX_TYPED_COLUMNS = {
+    'total_amount': (_amount_cell, '0.00'),
+    'invoice_date': (_date_cell, 'yyyy-mm-dd'),
+    'created_at': (_datetime_cell, 'yyyy-mm-dd hh:mm:ss'),
+    'updated_at': (_datetime_cell, 'yyyy-mm-dd hh:mm:ss'),
+}
+
+
+def write_xlsx(path, columns, batches):
+    """以 openpyxl 只写模式（write_only）把逐批读取的行写入 path（路径或可写的二进制文件对象），返回写入的行数
+
+    只写模式下单元格直接序列化到临时文件，不在内存中保留整张表；金额、日期写为数字 / 日期单元格。
+    """
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet('Invoices')
+    sheet.append(export_headers(columns))
+    typed = [(index, *XLSX_TYPED_COLUMNS[column]) for index, column in enumerate(columns)
+             if column in XLSX_TYPED_COLUMNS]
+    written = 0
+    for rows in batches:
+        for row in rows:
+            row = list(row)
+            for index, convert, number_format in typed:
+                value = convert(row[index])
+                if value is not None:
+                    cell = WriteOnlyCell(sheet, value=value)
+                    cell.number_format = number_format
+                    row[index] = cell
+            sheet.append(row)
+        written += len(rows)
+    workbook.save(path)
+    return written
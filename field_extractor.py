@@ -0,0 +1,117 @@
+"""发票字段提取规则
+
+每个字段按顺序尝试若干条规则，第一条命中且通过校验的结果生效。规则写成
+(anchor, via, pattern)，对应正则 anchor pattern，给出 via 时为 anchor.*?via pattern。
+规则在模块加载时预编译；文本中缺少规则的关键字时直接跳过该规则，
+不再对整段文本回溯 .*?。
+"""
+import re
+from collections import namedtuple
+
+Rule = namedtuple('Rule', ['anchor', 'via', 'pattern'])
+Field = namedtuple('Field', ['name', 'rules', 'clean', 'accept'])
+
+HEADER_WORDS = ('规格', '单价', '单位', '数量')
+
+
+def _date(match):
+    date_str = match.group(1).replace('年', '').replace('月', '').replace('日', '')
+    if len(date_str) == 7:
+        parts = re.findall(r'\d+', match.group(1))
+        if len(parts) == 3:
+            date_str = f"{parts[0]}{parts[1].zfill(2)}{parts[2].zfill(2)}"
+    return date_str
+
+
+def _seller(match):
+    # 去掉开头非汉字字符（比如 OCR 把 "信" 字也识别进来了）
+    return re.sub(r'^[^\u4e00-\u9fa5]+', '', match.group(1).strip())
+
+
+def _bank(match):
+    return re.sub(r'[;；:：]+$', '', match.group(1).strip())
+
+
+INVOICE_FIELDS = [
+    # 发票号码 (8-20位)
+    Field('invoice_number', [
+        Rule('发票号码', None, r'.*?(\d{8,20})'),
+    ], None, None),
+    # 开票日期；原来的 开票日期.*?(日期) 两条规则能命中时前两条必然先命中，已去掉
+    Field('invoice_date', [
+        Rule(None, None, r'(\d{4}年\d{1,2}月\d{1,2}日)'),
+        Rule(None, None, r'(\d{8})'),
+    ], _date, None),
+    # 总金额
+    Field('total_amount', [
+        Rule('价税合计', '¥', r'\s*([\d,]+\.?\d*)'),
+        Rule('价税合计', None, r'.*?([\d,]+\.?\d*)'),
+        Rule('合计', '¥', r'\s*([\d,]+\.?\d*)'),
+        Rule('总金额', '¥', r'\s*([\d,]+\.?\d*)'),
+    ], lambda m: m.group(1).replace(',', ''), None),
+    # 发票内容：优先 *分类*商品名，其次 *分类*，再次"名称"后紧跟的非表头文字
+    Field('invoice_content', [
+        Rule(None, None, r'(\*[\u4e00-\u9fa5]+\*[^\s\d¥*]+)'),
+        Rule(None, None, r'(\*[\u4e00-\u9fa5]+\*)'),
+        Rule('货物或应税劳务名称', None, r'.*?[:：]?\s*([^\d¥\s]+)(?=\s)'),
+        Rule('项目名称', None, r'.*?[:：]?\s*([^\d¥\s]+)(?=\s)'),
+    ], lambda m: m.group(1).strip(), lambda v: not any(word in v for word in HEADER_WORDS)),
+    # 销售方名称：定位"销售方"后的"名称"，遇到"买方"、"统一"、"纳税人"等立刻停止
+    Field('seller_name', [
+        Rule('销售方', '名称', r'[:：]?\s*([\u4e00-\u9fa5]+(?:公司|中心|厂|店|行))'),
+        Rule('销售方', '名称', r'[:：]?\s*([^\s]+)(?=\s+(?:买方|名称|纳税人|统一|地址|电话|注|开户|银行)|$)'),
+    ], _seller, lambda v: len(v) > 4),  # 公司名通常大于4个字
+    # 开户行：遇到分号或"账号"立即停止
+    Field('bank_name', [
+        Rule('开户', None, r'(?:银行|行)[:：]?\s*([^\s;；]+)(?=\s*[;；]|\s+(?:银行)?账号|$)'),
+    ], _bank, None),
+    # 银行账号（可选的"银行"前缀不影响取到的账号）
+    Field('bank_account', [
+        Rule('账号', None, r'[:：]?\s*(\d{10,30})'),
+    ], lambda m: m.group(1).strip(), None),
+]
+
+
+class FieldExtractor:
+    """按字段声明预编译规则，逐字段提取"""
+
+    def __init__(self, fields):
+        self.fields = [field._replace(rules=[self._compile(rule) for rule in field.rules]) for field in fields]
+
+    @staticmethod
+    def _compile(rule):
+        """返回 (正则, 必须出现的关键字)"""
+        prefix = ''
+        if rule.anchor:
+            prefix = re.escape(rule.anchor)
+            if rule.via:
+                prefix += '.*?' + re.escape(rule.via)
+        keywords = tuple(k for k in (rule.anchor, rule.via) if k)
+        return re.compile(prefix + rule.pattern), keywords
+
+    @staticmethod
+    def _match(rule, text):
+        pattern, keywords = rule
+        # 关键字不在文本中时整条规则不可能命中，省去一次失败的回溯
+        for keyword in keywords:
+            if keyword not in text:
+                return None
+        return pattern.search(text)
+
+    def extract(self, text):
+        result = {}
+        for field in self.fields:
+            value = ''
+            for rule in field.rules:
+                match = self._match(rule, text)
+                if not match:
+                    continue
+                candidate = field.clean(match) if field.clean else match.group(1)
+                if field.accept is None or field.accept(candidate):
+                    value = candidate
+                    break
+            result[field.name] = value
+        return result
+
+
+invoice_extractor = FieldExtractor(INVOICE_FIELDS)
@@ -0,0 +1,72 @@
+"""发票版式模板：按固定版式裁剪需要识别的区域（ROI）
+
+坐标为相对页面宽高的比例 (left, top, right, bottom)。label 是该区域所属栏目的
+关键字，裁剪后 OCR 往往识别不到竖排的栏目标题（如"销售方"），拼接文本时补上，
+使 parse_invoice_text 中以关键字定位的规则仍然适用。
+"""
+from collections import namedtuple
+
+import numpy as np
+
+Region = namedtuple('Region', ['name', 'box', 'label'])
+
+TEMPLATES = [
+    {
+        # 增值税专用 / 普通发票（纸质版式，含旧版增值税电子普通发票），240mm x 140mm
+        'name': 'vat_paper',
+        'aspect_ratio': 240 / 140,
+        'regions': [
+            Region('header', (0.62, 0.00, 1.00, 0.20), None),       # 发票代码、发票号码、开票日期
+            Region('items', (0.00, 0.30, 0.40, 0.55), None),        # 货物或应税劳务名称列
+            Region('total', (0.00, 0.63, 1.00, 0.74), None),        # 价税合计
+            Region('seller', (0.00, 0.73, 0.64, 0.93), '销售方'),   # 名称、纳税人识别号、开户行及账号
+        ],
+    },
+    {
+        # 全电发票（电子发票（普通发票）/ 电子发票（增值税专用发票）），210mm x 140mm
+        'name': 'fully_digital',
+        'aspect_ratio': 210 / 140,
+        'regions': [
+            Region('header', (0.62, 0.02, 1.00, 0.16), None),       # 发票号码、开票日期
+            Region('seller', (0.50, 0.14, 1.00, 0.32), '销售方'),   # 销售方信息
+            Region('items', (0.00, 0.30, 0.40, 0.55), None),        # 项目名称列
+            Region('total', (0.00, 0.66, 1.00, 0.78), None),        # 价税合计
+            Region('remarks', (0.05, 0.78, 0.70, 0.94), None),      # 备注：销方开户银行、银行账号
+        ],
+    },
+]
+
+# 单页最多裁剪出的区域数，即一页最多提交的 OCR 图片数
+MAX_REGIONS = max(len(template['regions']) for template in TEMPLATES)
+
+# 页面宽高比与模板相差超过该比例时认为版式不匹配
+ASPECT_TOLERANCE = 0.04
+
+
+def match_template(width, height):
+    """按页面宽高比选择模板，都不匹配时返回 None"""
+    if not width or not height:
+        return None
+    ratio = width / height
+    best = min(TEMPLATES, key=lambda t: abs(ratio - t['aspect_ratio']))
+    if abs(ratio - best['aspect_ratio']) / best['aspect_ratio'] > ASPECT_TOLERANCE:
+        return None
+    return best
+
+
+def crop_regions(image, template):
+    """按模板裁剪 ndarray 图片，返回 [(Region, 裁剪图)]"""
+    height, width = image.shape[:2]
+    crops = []
+    for region in template['regions']:
+        left, top, right, bottom = region.box
+        crop = image[int(top * height):int(bottom * height), int(left * width):int(right * width)]
+        crops.append((region, np.ascontiguousarray(crop)))
+    return crops
+
+
+def region_lines(region, lines):
+    """给区域文本补上栏目关键字"""
+    if region.label and not any(region.label in line for line in lines):
+        return [region.label] + lines
+    return lines
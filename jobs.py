@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+import uuid
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """任务队列已满"""
+
+
+class Job:
+    """单个后台任务的状态记录"""
+
+    def __init__(self, kind):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.status = 'queued'
+        self.result = None
+        self.error = None
+        self.progress = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def set_progress(self, done, total=None):
+        """更新任务进度（已处理数 / 总数）"""
+        self.progress = {'done': done, 'total': total}
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'progress': self.progress,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobQueue:
+    """有界任务队列 + 工作线程池
+
+    submit() 在队列满时抛出 QueueFullError，由调用方决定如何提示用户；
+    已结束的任务保留 ttl 秒供查询，之后自动清理。
+    """
+
+    def __init__(self, name, workers=2, maxsize=100, ttl=3600):
+        self.name = name
+        self.workers = max(1, workers)
+        self.ttl = ttl
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._threads = []
+
+    def _ensure_workers(self):
+        # 工作线程在第一次提交任务时才启动，避免导入模块时就创建线程
+        with self._lock:
+            if self._threads:
+                return
+            for i in range(self.workers):
+                t = threading.Thread(target=self._worker, name=f'{self.name}-{i}', daemon=True)
+                t.start()
+                self._threads.append(t)
+
+    def submit(self, kind, func, *args, **kwargs):
+        """提交任务，func 的第一个参数为 Job 对象，返回值作为任务结果"""
+        self._ensure_workers()
+        self._prune()
+        job = Job(kind)
+        with self._lock:
+            self._jobs[job.id] = job
+        try:
+            self._queue.put_nowait((job, func, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self._jobs.pop(job.id, None)
+            raise QueueFullError(f'{self.name} 队列已满')
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def _prune(self):
+        now = time.time()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at and now - job.finished_at > self.ttl]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def _worker(self):
+        while True:
+            job, func, args, kwargs = self._queue.get()
+            job.status = 'running'
+            job.started_at = time.time()
+            try:
+                job.result = func(job, *args, **kwargs)
+                if job.status == 'running':
+                    job.status = 'done'
+            except Exception as e:
+                logger.error(f'任务 {job.kind}/{job.id} 失败: {str(e)}')
+                job.status = 'failed'
+                job.error = str(e)
+            finally:
+                job.finished_at = time.time()
+                self._queue.task_done()
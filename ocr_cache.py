@@ -0,0 +1,139 @@
+import json
+import time
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 单条缓存占用的字节数（TEXT 的 LENGTH 按字符计，转为 BLOB 后按 UTF-8 字节计）
+_ENTRY_BYTES = 'LENGTH(CAST(lines AS BLOB)) + LENGTH(CAST(invoice_data AS BLOB))'
+
+
+class OcrCache:
+    """以文件哈希为键的识别结果缓存（持久化在 ocr_cache 表中）
+
+    同时保存原始文本行和解析后的 invoice_data。字段提取规则升级
+    （extractor_version 变化）时直接用缓存的文本行重新解析，
+    相同内容的文件永远不会再次进入 OCR。每条记录保存的文本行长短不一，
+    因此除条数上限 max_entries 外还按 max_bytes 限制总字节数（0 表示不限制）。
+    """
+
+    def __init__(self, connect, parse, extractor_version, max_entries=10000, max_age_days=90,
+                 max_bytes=0, evict_every=100):
+        self._connect = connect
+        self._parse = parse
+        self.extractor_version = extractor_version
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age_days * 86400
+        self.evict_every = evict_every
+        self._lock = threading.Lock()
+        self._puts = 0
+        self.hits = 0
+        self.misses = 0
+        self.reparses = 0
+        self.evictions = 0
+
+    def _count(self, name, n=1):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+    def get(self, file_hash):
+        """返回 {'invoice_data', 'extract_method', 'lines'}，未命中返回 None"""
+        with self._connect() as conn:
+            row = conn.execute('''
+                SELECT lines, invoice_data, extract_method, extractor_version
+                FROM ocr_cache WHERE file_hash = ?
+            ''', (file_hash,)).fetchone()
+            if not row:
+                self._count('misses')
+                return None
+
+            lines = json.loads(row['lines'])
+            if row['extractor_version'] == self.extractor_version:
+                invoice_data = json.loads(row['invoice_data'])
+            else:
+                invoice_data = self._parse(lines)
+                self._count('reparses')
+
+            conn.execute('''
+                UPDATE ocr_cache SET invoice_data = ?, extractor_version = ?, last_used_at = ?
+                WHERE file_hash = ?
+            ''', (json.dumps(invoice_data, ensure_ascii=False), self.extractor_version, time.time(), file_hash))
+            conn.commit()
+
+        self._count('hits')
+        return {'invoice_data': invoice_data, 'extract_method': row['extract_method'], 'lines': lines}
+
+    def put(self, file_hash, lines, invoice_data, extract_method):
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('''
+                INSERT OR REPLACE INTO ocr_cache (file_hash, lines, invoice_data, extract_method,
+                                                  extractor_version, created_at, last_used_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', (file_hash, json.dumps(lines, ensure_ascii=False),
+                  json.dumps(invoice_data, ensure_ascii=False), extract_method,
+                  self.extractor_version, now, now))
+            conn.commit()
+
+        with self._lock:
+            self._puts += 1
+            due = self._puts % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def evict(self):
+        """清理超过有效期的条目，并按最近使用时间裁剪到 max_entries 条、max_bytes 字节以内"""
+        with self._connect() as conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM ocr_cache WHERE last_used_at < ?', (time.time() - self.max_age,))
+            removed = cursor.rowcount
+            cursor.execute('''
+                DELETE FROM ocr_cache WHERE file_hash IN (
+                    SELECT file_hash FROM ocr_cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                )
+            ''', (self.max_entries,))
+            removed += cursor.rowcount
+            if self.max_bytes:
+                # 按最近使用时间从新到旧累加大小，超出预算的较旧条目全部删除
+                cursor.execute(f'''
+                    DELETE FROM ocr_cache WHERE file_hash IN (
+                        SELECT file_hash FROM (
+                            SELECT file_hash, SUM({_ENTRY_BYTES}) OVER (
+                                ORDER BY last_used_at DESC, file_hash ROWS UNBOUNDED PRECEDING
+                            ) AS running_bytes
+                            FROM ocr_cache
+                        ) WHERE running_bytes > ?
+                    )
+                ''', (self.max_bytes,))
+                removed += cursor.rowcount
+            conn.commit()
+
+        if removed:
+            self._count('evictions', removed)
+            logger.info(f'OCR 缓存清理了 {removed} 条记录')
+        return removed
+
+    def stats(self):
+        with self._connect() as conn:
+            row = conn.execute(f'''
+                SELECT COUNT(*) AS entries,
+                       COALESCE(SUM({_ENTRY_BYTES}), 0) AS size_bytes
+                FROM ocr_cache
+            ''').fetchone()
+
+        lookups = self.hits + self.misses
+        return {
+            'entries': row['entries'],
+            'size_bytes': row['size_bytes'],
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'max_age_days': self.max_age / 86400,
+            'extractor_version': self.extractor_version,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0,
+            'reparses': self.reparses,
+            'evictions': self.evictions,
+        }
@@ -0,0 +1,272 @@
+import os
+import threading
+import time
+import itertools
+import logging
+import multiprocessing
+import multiprocessing.connection
+from collections import deque
+from concurrent.futures import Future
+
+from jobs import QueueFullError
+
+logger = logging.getLogger(__name__)
+
+
+def scored_lines(result):
+    """从 PaddleOCR 的返回结果中取出 (文本, 置信度)"""
+    lines = []
+    if result and result[0]:
+        for line in result[0]:
+            lines.append((line[1][0], float(line[1][1])))
+    return lines
+
+
+def _rss_mb():
+    """当前进程常驻内存（MB）"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _worker_main(worker_id, conn, ocr_kwargs, cpu_threads, max_jobs, max_rss_mb):
+    """OCR 工作进程：启动时加载一次模型，然后循环处理任务
+
+    conn 是本进程与主进程之间独占的管道，任务和结果都经由它收发；每处理完一个任务发送 idle，
+    主进程收到后才发下一个，因此主进程始终知道每个进程手上是哪个任务。
+    不与其他进程共用队列，进程在任意时刻崩溃都不会让共享队列的锁无人释放。
+    cpu_threads 限制每个进程内推理使用的线程数，避免多个进程各自按核数开线程互相争抢。
+    """
+    from paddleocr import PaddleOCR
+
+    engine = PaddleOCR(cpu_threads=cpu_threads, **ocr_kwargs)
+    conn.send(('ready', worker_id, os.getpid()))
+
+    jobs_done = 0
+    while True:
+        try:
+            item = conn.recv()
+        except EOFError:
+            break
+        if item is None:
+            break
+        task_id, image = item
+        try:
+            conn.send(('done', task_id, scored_lines(engine.ocr(image, cls=True))))
+        except Exception as e:
+            conn.send(('error', task_id, str(e)))
+
+        jobs_done += 1
+        if max_jobs and jobs_done >= max_jobs:
+            conn.send(('recycle', worker_id, f'已处理 {jobs_done} 个任务'))
+            break
+        if max_rss_mb and _rss_mb() > max_rss_mb:
+            conn.send(('recycle', worker_id, f'内存 {_rss_mb():.0f}MB 超过上限'))
+            break
+        conn.send(('idle', worker_id, None))
+
+
+class OcrPool:
+    """多进程 OCR 池
+
+    每个进程启动时预加载 PaddleOCR，图片（ndarray 或路径）先在主进程排队，
+    再经由各进程独占的管道逐个发给空闲进程，每个进程同时只持有一个任务。
+    排队中和处理中的任务总数受 max_queue 限制，超出时 submit 抛出
+    QueueFullError；进程处理 max_jobs 个任务或内存超过 max_rss_mb 后退出，
+    由监控线程补充新进程，异常退出时发给它的任务失败并释放名额。
+    """
+
+    def __init__(self, processes, max_queue=64, max_jobs=500, max_rss_mb=0, cpu_threads=1, ocr_kwargs=None):
+        self.processes = max(1, processes)
+        self.cpu_threads = max(1, cpu_threads)
+        self.max_queue = max_queue
+        self.max_jobs = max_jobs
+        self.max_rss_mb = max_rss_mb
+        self.ocr_kwargs = ocr_kwargs or {}
+        # paddle 不支持 fork 后继续使用，统一用 spawn
+        self._ctx = multiprocessing.get_context('spawn')
+        self._slots = threading.BoundedSemaphore(self.processes + max_queue)
+        self._lock = threading.Lock()
+        self._task_ids = itertools.count()
+        self._worker_ids = itertools.count()
+        self._futures = {}
+        self._workers = {}    # worker_id -> Process
+        self._conns = {}      # worker_id -> 与该进程之间的管道
+        self._in_flight = {}  # worker_id -> 最近发给它的 task_id
+        self._pending = deque()  # 等待空闲进程的 (task_id, image)
+        self._idle = deque()     # 等待任务的 worker_id
+        self._started = False
+        self._closing = False
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.recycled = 0
+
+    @property
+    def capacity(self):
+        """同时排队和处理中的任务数上限"""
+        return self.processes + self.max_queue
+
+    def start(self):
+        with self._lock:
+            if self._started:
+                return
+            for _ in range(self.processes):
+                self._spawn()
+            self._monitor = threading.Thread(target=self._monitor_loop, name='ocr-pool-monitor', daemon=True)
+            self._monitor.start()
+            self._started = True
+        logger.info(f'OCR 进程池已启动: {self.processes} 个进程')
+
+    def _spawn(self):
+        worker_id = next(self._worker_ids)
+        conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(
+            target=_worker_main, name=f'OcrWorker-{worker_id}', daemon=True,
+            args=(worker_id, child_conn, self.ocr_kwargs, self.cpu_threads, self.max_jobs, self.max_rss_mb))
+        proc.start()
+        # 主进程关闭子进程一端，子进程退出后读端才会收到 EOF
+        child_conn.close()
+        self._conns[worker_id] = conn
+        self._workers[worker_id] = proc
+
+    def submit(self, image, block=False, timeout=None):
+        """提交一张图片，返回 Future，结果为 [(文本, 置信度)]"""
+        self.start()
+        if not self._slots.acquire(blocking=block, timeout=timeout if block else None):
+            with self._lock:
+                self.rejected += 1
+            raise QueueFullError('OCR 队列已满')
+
+        future = Future()
+        future.add_done_callback(lambda _: self._slots.release())
+        task_id = next(self._task_ids)
+        with self._lock:
+            self._futures[task_id] = future
+            self._pending.append((task_id, image))
+        self._dispatch()
+        return future
+
+    def ocr(self, image, block=False, timeout=None):
+        """识别一张图片；timeout 同时限制等待排队名额和等待结果的总时间"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        future = self.submit(image, block=block, timeout=timeout)
+        return future.result(timeout=None if deadline is None else max(0, deadline - time.monotonic()))
+
+    def _dispatch(self):
+        """把排队的任务发给空闲进程"""
+        with self._lock:
+            while self._pending and self._idle:
+                worker_id = self._idle.popleft()
+                conn = self._conns.get(worker_id)
+                if conn is None:
+                    continue  # 进程已退出
+                task_id, image = self._pending.popleft()
+                self._in_flight[worker_id] = task_id
+                try:
+                    conn.send((task_id, image))
+                except OSError:
+                    pass  # 进程刚刚退出，由 _reap 让该任务失败
+
+    def _finish(self, task_id, result=None, error=None):
+        with self._lock:
+            future = self._futures.pop(task_id, None)
+            if error is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+        if future is None:
+            return
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(RuntimeError(error))
+
+    def _monitor_loop(self):
+        while not self._closing:
+            with self._lock:
+                conns = list(self._conns.values())
+            for conn in multiprocessing.connection.wait(conns, timeout=1):
+                self._receive(conn)
+            self._reap()
+
+    def _receive(self, conn):
+        """处理管道中已到达的一条消息；进程已退出（EOF）时返回 False"""
+        try:
+            message = conn.recv()
+        except (EOFError, OSError):
+            return False
+        self._handle(*message)
+        return True
+
+    def _handle(self, kind, key, value):
+        if kind == 'ready':
+            logger.info(f'OCR 进程 {key} (pid {value}) 模型加载完成')
+        elif kind == 'done':
+            self._finish(key, result=value)
+        elif kind == 'error':
+            self._finish(key, error=value)
+        elif kind == 'recycle':
+            logger.info(f'OCR 进程 {key} 回收: {value}')
+        if kind in ('ready', 'idle'):
+            with self._lock:
+                self._idle.append(key)
+            self._dispatch()
+
+    def _reap(self):
+        """回收已退出的进程并补充新进程；异常退出时让发给它、尚未完成的任务失败"""
+        dead = [(worker_id, proc) for worker_id, proc in list(self._workers.items()) if not proc.is_alive()]
+        if not dead:
+            return
+        for worker_id, proc in dead:
+            proc.join()
+            # 先处理进程退出前发出、尚未读取的消息，已完成的任务不误判为失败
+            conn = self._conns[worker_id]
+            while conn.poll() and self._receive(conn):
+                pass
+            with self._lock:
+                del self._workers[worker_id]
+                self._conns.pop(worker_id).close()
+                task_id = self._in_flight.pop(worker_id, None)
+            if task_id is not None and task_id in self._futures:
+                logger.error(f'OCR 进程 {worker_id} 异常退出 (exitcode {proc.exitcode})')
+                self._finish(task_id, error=f'OCR 进程异常退出 (exitcode {proc.exitcode})')
+            with self._lock:
+                self.recycled += 1
+                if not self._closing:
+                    self._spawn()
+
+    def stats(self):
+        with self._lock:
+            pending = len(self._futures)
+        return {
+            'processes': self.processes,
+            'cpu_threads': self.cpu_threads,
+            'alive': sum(1 for proc in list(self._workers.values()) if proc.is_alive()),
+            'pending': pending,
+            'capacity': self.capacity,
+            'completed': self.completed,
+            'failed': self.failed,
+            'rejected': self.rejected,
+            'recycled': self.recycled,
+            'max_jobs_per_worker': self.max_jobs,
+            'max_rss_mb': self.max_rss_mb,
+        }
+
+    def shutdown(self, timeout=5):
+        if not self._started:
+            return
+        self._closing = True
+        for conn in list(self._conns.values()):
+            try:
+                conn.send(None)
+            except OSError:
+                pass
+        deadline = time.time() + timeout
+        for proc in self._workers.values():
+            proc.join(max(0, deadline - time.time()))
+            if proc.is_alive():
+                proc.terminate()
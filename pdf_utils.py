@@ -0,0 +1,88 @@
+import io
+import subprocess
+import logging
+import xml.etree.ElementTree as ET
+
+import numpy as np
+from PIL import Image
+from pdf2image import convert_from_path
+
+logger = logging.getLogger(__name__)
+
+
+def _local_name(tag):
+    return tag.rsplit('}', 1)[-1]
+
+
+def _source_args(pdf):
+    """pdf 可以是文件路径或 PDF 字节；字节通过 stdin 传给 poppler（"-"），不落盘"""
+    if isinstance(pdf, (bytes, bytearray)):
+        return '-', bytes(pdf)
+    return str(pdf), None
+
+
+def extract_text_lines(pdf, page=1, timeout=10):
+    """读取 PDF 指定页的文本层
+
+    使用 poppler 自带的 pdftotext -bbox-layout（pdf2image 已依赖 poppler），
+    返回按阅读顺序（从上到下、从左到右）排列的文本行：
+    [{'text': ..., 'bbox': (x_min, y_min, x_max, y_max)}, ...]
+    没有文本层（扫描件）或 pdftotext 不可用时返回空列表。
+    """
+    source, stdin = _source_args(pdf)
+    cmd = ['pdftotext', '-f', str(page), '-l', str(page), '-bbox-layout', source, '-']
+    try:
+        proc = subprocess.run(cmd, input=stdin, capture_output=True, timeout=timeout, check=True)
+        root = ET.fromstring(proc.stdout)
+    except (OSError, subprocess.SubprocessError, ET.ParseError) as e:
+        logger.warning(f'读取 PDF 文本层失败: {str(e)}')
+        return []
+
+    lines = []
+    for element in root.iter():
+        if _local_name(element.tag) != 'line':
+            continue
+        words = [w.text.strip() for w in element if _local_name(w.tag) == 'word' and w.text and w.text.strip()]
+        if not words:
+            continue
+        bbox = tuple(float(element.get(k, 0)) for k in ('xMin', 'yMin', 'xMax', 'yMax'))
+        lines.append({'text': ' '.join(words), 'bbox': bbox})
+
+    # 与 OCR 结果保持一致的顺序：同一行高度内按 x 排序
+    lines.sort(key=lambda line: (round(line['bbox'][1] / 4), line['bbox'][0]))
+    return lines
+
+
+def render_page(pdf, page=1, dpi=200, grayscale=False, thread_count=1, timeout=60):
+    """将 PDF 指定页渲染为 PIL 图片，全程在内存中完成
+
+    路径输入走 pdf2image（读取 pdftoppm 的 stdout）；字节输入直接通过
+    stdin 交给 pdftoppm，避免 convert_from_bytes 写临时文件。grayscale 时
+    输出单通道灰度图，数据量只有 RGB 的三分之一。thread_count 传给 pdf2image，
+    只在一次渲染多页时生效（poppler 按页拆分到多个进程）。
+    """
+    source, stdin = _source_args(pdf)
+    if stdin is None:
+        images = convert_from_path(source, dpi=dpi, first_page=page, last_page=page, grayscale=grayscale,
+                                   thread_count=thread_count, timeout=timeout)
+        if not images:
+            raise ValueError('PDF 转换图片失败')
+        return images[0]
+
+    cmd = ['pdftoppm', '-f', str(page), '-l', str(page), '-r', str(dpi)]
+    if grayscale:
+        cmd.append('-gray')
+    cmd.append(source)
+    proc = subprocess.run(cmd, input=stdin, capture_output=True, timeout=timeout)
+    if proc.returncode != 0 or not proc.stdout:
+        raise ValueError(f"PDF 转换图片失败: {proc.stderr.decode('utf-8', 'ignore').strip()}")
+    image = Image.open(io.BytesIO(proc.stdout))
+    image.load()
+    return image
+
+
+def to_ocr_array(image):
+    """PIL 图片转为 PaddleOCR 直接接受的 BGR ndarray（与 cv2.imread 的结果一致）"""
+    if image.mode == 'L':
+        return np.asarray(image)
+    return np.ascontiguousarray(np.asarray(image.convert('RGB'))[:, :, ::-1])
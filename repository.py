@@ -0,0 +1,947 @@
+import re
+import json
+import sqlite3
+import logging
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+logger = logging.getLogger(__name__)
+
+def china_now():
+    """当前北京时间字符串"""
+    return (datetime.utcnow() + timedelta(hours=8)).strftime('%Y-%m-%d %H:%M:%S')
+
+def parse_amount_cents(amount):
+    """金额字符串转为整数分，无法解析时返回 None"""
+    text = str(amount or '').strip().replace(',', '').lstrip('¥￥').strip()
+    if not text:
+        return None
+    try:
+        value = Decimal(text)
+    except InvalidOperation:
+        return None
+    if not value.is_finite():
+        return None
+    return int(value.quantize(Decimal('0.01'), rounding=ROUND_HALF_UP) * 100)
+
+def parse_date_ymd(date_str):
+    """日期字符串（20240105、2024-01-05、2024年1月5日）转为整数 yyyymmdd，无法解析时返回 None"""
+    match = re.fullmatch(r'(\d{4})\D?(\d{1,2})\D?(\d{1,2})\D?', str(date_str or '').strip())
+    if not match:
+        return None
+    year, month, day = (int(part) for part in match.groups())
+    try:
+        datetime(year, month, day)
+    except ValueError:
+        return None
+    return year * 10000 + month * 100 + day
+
+def typed_columns(data):
+    """由 total_amount / invoice_date 计算用于排序、筛选和统计的 amount_cents / invoice_ymd"""
+    columns = {}
+    if 'total_amount' in data:
+        columns['amount_cents'] = parse_amount_cents(data['total_amount'])
+    if 'invoice_date' in data:
+        columns['invoice_ymd'] = parse_date_ymd(data['invoice_date'])
+    return columns
+
+def init_invoice_tables(cursor):
+    """创建 invoices 表和索引，并补齐旧版本缺少的列"""
+    # 创建主表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS invoices (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            buyer_name TEXT NOT NULL,
+            invoice_number TEXT,
+            invoice_date TEXT,
+            total_amount TEXT,
+            invoice_content TEXT,
+            seller_name TEXT,
+            bank_name TEXT,
+            bank_account TEXT,
+            pdf_path TEXT,
+            file_hash TEXT,
+            created_at TEXT,
+            updated_at TEXT
+        )
+    ''')
+    
+    # 自动修复补丁 - 添加可能缺失的列
+    try: cursor.execute('ALTER TABLE invoices ADD COLUMN file_hash TEXT')
+    except sqlite3.OperationalError: pass
+    try: cursor.execute('ALTER TABLE invoices ADD COLUMN created_at TEXT')
+    except sqlite3.OperationalError: pass
+    try: cursor.execute('ALTER TABLE invoices ADD COLUMN updated_at TEXT')
+    except sqlite3.OperationalError: pass
+    # 记录识别方式：text_layer（PDF 文本层）、ocr_roi（按版式区域 OCR）或 ocr（整页 OCR）
+    try: cursor.execute('ALTER TABLE invoices ADD COLUMN extract_method TEXT')
+    except sqlite3.OperationalError: pass
+    
+    # 金额（整数分）和开票日期（整数 yyyymmdd）的类型化列，原 TEXT 列保留用于接口返回
+    added = False
+    try:
+        cursor.execute('ALTER TABLE invoices ADD COLUMN amount_cents INTEGER')
+        added = True
+    except sqlite3.OperationalError: pass
+    try:
+        cursor.execute('ALTER TABLE invoices ADD COLUMN invoice_ymd INTEGER')
+        added = True
+    except sqlite3.OperationalError: pass
+    if added:
+        rows = cursor.execute('SELECT id, total_amount, invoice_date FROM invoices').fetchall()
+        cursor.executemany('UPDATE invoices SET amount_cents = ?, invoice_ymd = ? WHERE id = ?', [
+            (parse_amount_cents(amount), parse_date_ymd(date), row_id) for row_id, amount, date in rows
+        ])
+        logger.info(f'invoices 已回填 {len(rows)} 行金额 / 日期类型化列')
+    
+    # 回收站：删除时只写入 deleted_at，不再在两张表之间复制行
+    try: cursor.execute('ALTER TABLE invoices ADD COLUMN deleted_at TEXT')
+    except sqlite3.OperationalError: pass
+    
+    # 创建索引以提高查询性能
+    try: cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_invoice_number ON invoices(invoice_number)')
+    except sqlite3.OperationalError: pass
+    try: cursor.execute('CREATE INDEX IF NOT EXISTS idx_invoices_file_hash ON invoices(file_hash)')
+    except sqlite3.OperationalError: pass
+    # 列表、搜索只查未删除的发票，回收站只查已删除的，两边的索引都只包含各自的行（部分索引），
+    # 查询条件中须带上 deleted_at IS NULL / deleted_at IS NOT NULL（或对 deleted_at 的比较）才会用到
+    # 列表按类型筛选后排序：每种排序列一个 (type, 列) 复合索引，避免临时 B 树排序
+    for column in ('created_at', 'invoice_ymd', 'invoice_number', 'buyer_name', 'amount_cents'):
+        try: cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_live_type_{column} ON invoices(type, {column}) '
+                            'WHERE deleted_at IS NULL')
+        except sqlite3.OperationalError: pass
+    # 搜索的金额 / 日期范围，以及不限类型时按上传时间倒序取前 100 条
+    for column in ('created_at', 'invoice_ymd', 'amount_cents'):
+        try: cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_live_{column} ON invoices({column}) '
+                            'WHERE deleted_at IS NULL')
+        except sqlite3.OperationalError: pass
+    try: cursor.execute('CREATE INDEX IF NOT EXISTS idx_deleted_type_deleted_at ON invoices(type, deleted_at) '
+                        'WHERE deleted_at IS NOT NULL')
+    except sqlite3.OperationalError: pass
+    try: cursor.execute('CREATE INDEX IF NOT EXISTS idx_deleted_deleted_at ON invoices(deleted_at) '
+                        'WHERE deleted_at IS NOT NULL')
+    except sqlite3.OperationalError: pass
+    # 被上面的部分索引取代的全表索引；按月统计已改读汇总表
+    for index in ('idx_invoices_type', 'idx_invoices_created_at', 'idx_invoices_invoice_ymd',
+                  'idx_invoices_amount_cents', 'idx_invoices_month'):
+        cursor.execute(f'DROP INDEX IF EXISTS {index}')
+    for column in ('created_at', 'invoice_ymd', 'invoice_number', 'buyer_name', 'amount_cents'):
+        cursor.execute(f'DROP INDEX IF EXISTS idx_invoices_type_{column}')
+
+
+def migrate_recycle_bin(cursor):
+    """把旧版 recycle_bin 表中的行并入 invoices（带上 deleted_at），然后删除该表"""
+    if not cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'recycle_bin'").fetchone():
+        return
+    invoice_columns = [row[1] for row in cursor.execute('PRAGMA table_info(invoices)')]
+    recycle_columns = [row[1] for row in cursor.execute('PRAGMA table_info(recycle_bin)')]
+    # 旧行在 invoices 中重新编号，与之前从回收站恢复时一样
+    columns = [c for c in recycle_columns if c in invoice_columns and c != 'id']
+    rows = cursor.execute(f'SELECT {", ".join(columns)} FROM recycle_bin').fetchall()
+    if 'amount_cents' not in columns:
+        columns += ['amount_cents', 'invoice_ymd']
+        rows = [tuple(row) + (parse_amount_cents(row[columns.index('total_amount')]),
+                              parse_date_ymd(row[columns.index('invoice_date')])) for row in rows]
+    cursor.executemany(f'INSERT INTO invoices ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})', rows)
+    cursor.execute('DROP TABLE recycle_bin')
+    logger.info(f'回收站 {len(rows)} 行已迁移到 invoices.deleted_at')
+
+def ensure_triggers(cursor, triggers):
+    """按 {触发器名: CREATE TRIGGER 语句} 创建或更新触发器，已存在且定义相同的不做任何改动
+
+    应用每次导入（含每个 Web 进程和 flask 命令）都会执行 init_schema。sqlite3 默认的事务处理下
+    DROP / CREATE 各自提交，两者之间落下的写入会跳过触发器，汇总表从此与明细不一致；
+    因此只在定义有变化时重建，并把删除和重建放在同一个 BEGIN IMMEDIATE 事务中。
+    """
+    def changed():
+        stored = dict(cursor.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall())
+        return {name: sql for name, sql in triggers.items() if (stored.get(name) or '').strip() != sql.strip()}
+
+    if not changed():
+        return
+    conn = cursor.connection
+    if conn.in_transaction:
+        conn.commit()
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        # 拿到写锁后重新比较，其他进程可能已经完成重建
+        for name, sql in changed().items():
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+            cursor.execute(sql)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+
+# 全文检索覆盖的列（与原 LIKE 搜索相同）
+FTS_COLUMNS = ('invoice_number', 'buyer_name', 'seller_name', 'invoice_content')
+
+def init_fts(cursor):
+    """创建 trigram 分词的 FTS5 外部内容表及同步触发器，返回是否可用；SQLite 不支持时保留 LIKE 搜索"""
+    columns = ', '.join(FTS_COLUMNS)
+    new_values = ', '.join(f'new.{c}' for c in FTS_COLUMNS)
+    old_values = ', '.join(f'old.{c}' for c in FTS_COLUMNS)
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'invoices_fts'").fetchone()
+    try:
+        cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS invoices_fts USING fts5(
+                {columns}, content='invoices', content_rowid='id', tokenize='trigram'
+            )
+        ''')
+    except sqlite3.OperationalError as e:
+        logger.warning(f'SQLite 不支持 FTS5 trigram，搜索使用 LIKE: {str(e)}')
+        return False
+    
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS invoices_fts_insert AFTER INSERT ON invoices BEGIN
+            INSERT INTO invoices_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS invoices_fts_delete AFTER DELETE ON invoices BEGIN
+            INSERT INTO invoices_fts (invoices_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+        END
+    ''')
+    cursor.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS invoices_fts_update AFTER UPDATE OF {columns} ON invoices BEGIN
+            INSERT INTO invoices_fts (invoices_fts, rowid, {columns}) VALUES ('delete', old.id, {old_values});
+            INSERT INTO invoices_fts (rowid, {columns}) VALUES (new.id, {new_values});
+        END
+    ''')
+    if not exists:
+        cursor.execute("INSERT INTO invoices_fts (invoices_fts) VALUES ('rebuild')")
+        logger.info('已为现有发票建立全文索引')
+    return True
+
+# 统计汇总表：按类型、按 (类型, 月份) 保存未删除发票的条数和金额的 count / sum / min / max，
+# 由 invoices 上的触发器在插入、修改、删除（含移入 / 移出回收站）时同步更新，统计接口只读这几行
+STATS_TABLES = ('invoice_stats_type', 'invoice_stats_month')
+# (汇总表, 分组列, 由 new / old 行得到分组值的表达式, 分组条件, 重新求 min / max 时在 invoices 中的范围条件)
+STATS_GROUPS = (
+    ('invoice_stats_type', 'type', '{row}.type', '{row}.deleted_at IS NULL',
+     'deleted_at IS NULL AND type = {row}.type'),
+    ('invoice_stats_month', 'type, month', '{row}.type, {row}.invoice_ymd / 100',
+     '{row}.deleted_at IS NULL AND {row}.invoice_ymd IS NOT NULL',
+     'deleted_at IS NULL AND type = {row}.type '
+     'AND invoice_ymd BETWEEN {row}.invoice_ymd / 100 * 100 AND {row}.invoice_ymd / 100 * 100 + 99'),
+)
+STATS_COLUMNS = 'invoice_count, amount_count, amount_sum, amount_min, amount_max'
+# 全量重算汇总表的 SELECT，也用于一致性检查
+STATS_RECOMPUTE_QUERIES = {
+    'invoice_stats_type': '''
+        SELECT type, COUNT(*), COUNT(amount_cents), COALESCE(SUM(amount_cents), 0), MIN(amount_cents), MAX(amount_cents)
+        FROM invoices WHERE deleted_at IS NULL GROUP BY type
+    ''',
+    'invoice_stats_month': '''
+        SELECT type, invoice_ymd / 100, COUNT(*), COUNT(amount_cents), COALESCE(SUM(amount_cents), 0),
+               MIN(amount_cents), MAX(amount_cents)
+        FROM invoices WHERE deleted_at IS NULL AND invoice_ymd IS NOT NULL GROUP BY type, invoice_ymd / 100
+    ''',
+}
+
+def _stats_add_sql(table, keys, values, guard):
+    row_values = values.format(row='new')
+    return f'''
+        INSERT INTO {table} ({keys}, {STATS_COLUMNS})
+        SELECT {row_values}, 1, new.amount_cents IS NOT NULL, COALESCE(new.amount_cents, 0),
+               new.amount_cents, new.amount_cents
+        WHERE {guard.format(row='new')}
+        ON CONFLICT ({keys}) DO UPDATE SET
+            invoice_count = invoice_count + 1,
+            amount_count = amount_count + excluded.amount_count,
+            amount_sum = amount_sum + excluded.amount_sum,
+            amount_min = COALESCE(MIN(amount_min, excluded.amount_min), amount_min, excluded.amount_min),
+            amount_max = COALESCE(MAX(amount_max, excluded.amount_max), amount_max, excluded.amount_max);
+    '''
+
+def _stats_remove_sql(table, keys, values, guard, scope):
+    match = ' AND '.join(f'{key} = {value}' for key, value in
+                         zip(keys.split(', '), values.format(row='old').split(', ')))
+    match += ' AND ' + guard.format(row='old')
+    scope = scope.format(row='old')
+    # 删掉的正好是最小 / 最大值时，从 (type, ...) 索引上重新取一次
+    return f'''
+        UPDATE {table} SET
+            invoice_count = invoice_count - 1,
+            amount_count = amount_count - (old.amount_cents IS NOT NULL),
+            amount_sum = amount_sum - COALESCE(old.amount_cents, 0)
+        WHERE {match};
+        UPDATE {table} SET
+            amount_min = (SELECT MIN(amount_cents) FROM invoices WHERE {scope}),
+            amount_max = (SELECT MAX(amount_cents) FROM invoices WHERE {scope})
+        WHERE {match} AND old.amount_cents IN (amount_min, amount_max);
+        DELETE FROM {table} WHERE {match} AND invoice_count = 0;
+    '''
+
+def init_stats(cursor):
+    """创建统计汇总表及触发器；汇总表是新建的（升级或首次启动）时按现有数据重算
+
+    触发器定义与数据库中的不同时才重建（见 ensure_triggers），修改触发器后不需要单独迁移。
+    """
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'invoice_stats_month'").fetchone()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS invoice_stats_type (
+            type TEXT PRIMARY KEY,
+            invoice_count INTEGER NOT NULL,
+            amount_count INTEGER NOT NULL,
+            amount_sum INTEGER NOT NULL,
+            amount_min INTEGER,
+            amount_max INTEGER
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS invoice_stats_month (
+            type TEXT NOT NULL,
+            month INTEGER NOT NULL,
+            invoice_count INTEGER NOT NULL,
+            amount_count INTEGER NOT NULL,
+            amount_sum INTEGER NOT NULL,
+            amount_min INTEGER,
+            amount_max INTEGER,
+            PRIMARY KEY (month, type)
+        )
+    ''')
+    adds = ''.join(_stats_add_sql(table, keys, values, guard) for table, keys, values, guard, _ in STATS_GROUPS)
+    removes = ''.join(_stats_remove_sql(table, keys, values, guard, scope)
+                      for table, keys, values, guard, scope in STATS_GROUPS)
+    ensure_triggers(cursor, {
+        'invoices_stats_insert': f'CREATE TRIGGER invoices_stats_insert AFTER INSERT ON invoices BEGIN {adds} END',
+        'invoices_stats_delete': f'CREATE TRIGGER invoices_stats_delete AFTER DELETE ON invoices BEGIN {removes} END',
+        'invoices_stats_update': f'''
+            CREATE TRIGGER invoices_stats_update
+            AFTER UPDATE OF type, amount_cents, invoice_ymd, deleted_at ON invoices
+            BEGIN {removes} {adds} END
+        ''',
+    })
+    # 触发器就位后再重算，建表与建触发器之间的写入也会被计入
+    if not exists:
+        rebuild_stats(cursor)
+
+def rebuild_stats(cursor):
+    """按 invoices 全量重算统计汇总表"""
+    for table in STATS_TABLES:
+        cursor.execute(f'DELETE FROM {table}')
+        cursor.execute(f'INSERT INTO {table} {STATS_RECOMPUTE_QUERIES[table]}')
+
+def stats_mismatches(cursor):
+    """对比汇总表和全量重算的结果，返回 [(汇总表, 分组, 汇总表中的值, 重算的值)]，一致时为空"""
+    mismatches = []
+    for table, keys, *_ in STATS_GROUPS:
+        stored = {tuple(row[:-5]): tuple(row[-5:])
+                  for row in cursor.execute(f'SELECT {keys}, {STATS_COLUMNS} FROM {table}')}
+        expected = {tuple(row[:-5]): tuple(row[-5:]) for row in cursor.execute(STATS_RECOMPUTE_QUERIES[table])}
+        for key in sorted(stored.keys() | expected.keys(), key=str):
+            if stored.get(key) != expected.get(key):
+                mismatches.append((table, key, stored.get(key), expected.get(key)))
+    return mismatches
+
+# 数据版本：每个类型一行，该类型的发票每次插入、修改、删除（含移入 / 移出回收站、过期清理）都由触发器
+# 递增 version 并记下时间（UTC）。导出缓存以 (version, changed_at) 作为数据版本，数据变化后旧缓存自然失效
+def _version_bump_sql(row):
+    return f"""
+        INSERT INTO invoice_versions (type, version, changed_at)
+        VALUES ({row}.type, 1, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+        ON CONFLICT (type) DO UPDATE SET version = version + 1, changed_at = excluded.changed_at;
+    """
+
+def init_data_versions(cursor):
+    """创建数据版本表及触发器（定义有变化时才重建，见 ensure_triggers）；
+    表是新建的（升级或首次启动）时为已有发票的类型补上版本
+    """
+    exists = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'invoice_versions'").fetchone()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS invoice_versions (
+            type TEXT PRIMARY KEY,
+            version INTEGER NOT NULL,
+            changed_at TEXT NOT NULL
+        )
+    ''')
+    ensure_triggers(cursor, {
+        'invoices_version_insert':
+            f'CREATE TRIGGER invoices_version_insert AFTER INSERT ON invoices BEGIN {_version_bump_sql("NEW")} END',
+        'invoices_version_delete':
+            f'CREATE TRIGGER invoices_version_delete AFTER DELETE ON invoices BEGIN {_version_bump_sql("OLD")} END',
+        'invoices_version_update':
+            f'CREATE TRIGGER invoices_version_update AFTER UPDATE ON invoices BEGIN {_version_bump_sql("OLD")} END',
+        # 修改类型时新旧两个类型的数据都变了
+        'invoices_version_retype': f'''
+            CREATE TRIGGER invoices_version_retype AFTER UPDATE OF type ON invoices WHEN NEW.type IS NOT OLD.type
+            BEGIN {_version_bump_sql("NEW")} END
+        ''',
+    })
+    # 触发器就位后再补版本；期间的写入可能已由触发器建好该类型的行，跳过即可
+    if not exists:
+        cursor.execute('''
+            INSERT OR IGNORE INTO invoice_versions (type, version, changed_at)
+            SELECT DISTINCT type, 1, strftime('%Y-%m-%d %H:%M:%f', 'now') FROM invoices
+        ''')
+
+DATA_VERSION_QUERY = 'SELECT version, changed_at FROM invoice_versions WHERE type = ?'
+
+DUPLICATE_HASH_QUERY = 'SELECT id FROM invoices WHERE file_hash = ? AND deleted_at IS NULL'
+DUPLICATE_NUMBER_QUERY = 'SELECT id FROM invoices WHERE invoice_number = ? AND deleted_at IS NULL'
+INSERT_QUERY = '''
+    INSERT INTO invoices (type, buyer_name, invoice_number, invoice_date, 
+                        total_amount, invoice_content, seller_name, 
+                        bank_name, bank_account, pdf_path, file_hash, extract_method,
+                        amount_cents, invoice_ymd, created_at, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+DETAIL_QUERY = 'SELECT * FROM invoices WHERE id = ? AND deleted_at IS NULL'
+
+# 列表排序字段 -> 排序列（白名单，防止 SQL 注入）；每种排序都有对应的 (type, 排序列) 复合索引，
+# 索引末尾隐含 id，ORDER BY 排序列, id 和游标范围条件都能直接走索引
+INVOICE_SORT_COLUMNS = {
+    'invoice_date': 'invoice_ymd',
+    'created_at': 'created_at',
+    'invoice_number': 'invoice_number',
+    'buyer_name': 'buyer_name',
+    'total_amount': 'amount_cents',
+}
+# 建表时声明为 NOT NULL 的排序列，没有 NULL 段
+INVOICE_NOT_NULL_SORT_COLUMNS = {'buyer_name'}
+INVOICE_LIST_COLUMNS = ('id, type, buyer_name, invoice_number, invoice_date, total_amount, invoice_content, '
+                        'seller_name, bank_name, bank_account, pdf_path, created_at')
+INVOICE_LIST_TOTAL_QUERY = '''
+    SELECT invoice_count as total, amount_sum / 100.0 as total_amount
+    FROM invoice_stats_type
+    WHERE type = ?
+'''
+
+def invoice_page_queries(sort_by, order, after=None):
+    """键集分页：返回依次执行的 [(SQL, 参数)]，参数前后还需补上 type 和本次取的条数
+
+    after 为上一页最后一行的 (排序列的值, id)。SQLite 中 NULL 升序时排最前、降序时排最后，
+    排序列为 NULL 的行单独成一段：游标落在某段中时先取该段剩下的行，不足一页再从下一段开头补齐。
+    每条查询都是 (type, 排序列) 索引上的一段范围扫描，与翻到第几页无关。
+    """
+    column = INVOICE_SORT_COLUMNS[sort_by]
+    nullable = column not in INVOICE_NOT_NULL_SORT_COLUMNS
+    op = '>' if order == 'ASC' else '<'
+    if after is None:
+        segments = [('', [])]
+    else:
+        value, last_id = after
+        if value is None:
+            segments = [(f'AND {column} IS NULL AND id {op} ?', [last_id])]
+            if order == 'ASC':
+                segments.append((f'AND {column} IS NOT NULL', []))
+        else:
+            segments = [(f'AND ({column}, id) {op} (?, ?)', [value, last_id])]
+            if order == 'DESC' and nullable:
+                segments.append((f'AND {column} IS NULL', []))
+    return [(f'SELECT {INVOICE_LIST_COLUMNS}, {column} AS sort_key FROM invoices WHERE type = ? AND deleted_at IS NULL {condition} '
+             f'ORDER BY {column} {order}, id {order} LIMIT ?', params)
+            for condition, params in segments]
+
+# 导出的列及顺序；id、pdf_path、file_hash 和类型化列不导出
+EXPORT_COLUMNS = ('type', 'buyer_name', 'invoice_number', 'invoice_date', 'total_amount', 'invoice_content',
+                  'seller_name', 'bank_name', 'bank_account', 'created_at', 'updated_at', 'extract_method')
+
+# 回收站中的发票即 deleted_at 不为空的行。批量操作的 id 列表以 JSON 数组作为一个参数传入，
+# 经 json_each 展开，每个操作都是一条语句处理全部 id，不受 SQLite 参数个数上限影响
+LIVE_IDS_CONDITION = 'deleted_at IS NULL AND id IN (SELECT value FROM json_each(?))'
+RECYCLED_IDS_CONDITION = 'deleted_at IS NOT NULL AND id IN (SELECT value FROM json_each(?))'
+SOFT_DELETE_QUERY = f'UPDATE invoices SET deleted_at = ? WHERE {LIVE_IDS_CONDITION}'
+RESTORE_QUERY = f'UPDATE invoices SET deleted_at = NULL WHERE {RECYCLED_IDS_CONDITION}'
+PERMANENT_DELETE_FILES_QUERY = f'SELECT pdf_path FROM invoices WHERE {RECYCLED_IDS_CONDITION}'
+PERMANENT_DELETE_QUERY = f'DELETE FROM invoices WHERE {RECYCLED_IDS_CONDITION}'
+
+RECYCLE_BIN_LIST_QUERY = '''
+    SELECT *
+    FROM invoices
+    WHERE type = ? AND deleted_at IS NOT NULL
+    ORDER BY deleted_at DESC
+'''
+# 过期清理按删除时间从早到晚分批进行
+RETENTION_BATCH_QUERY = '''
+    SELECT id, pdf_path
+    FROM invoices
+    WHERE deleted_at < ?
+    ORDER BY deleted_at
+    LIMIT ?
+'''
+RETENTION_DELETE_QUERY = 'DELETE FROM invoices WHERE id IN (SELECT value FROM json_each(?))'
+
+# 统计查询读取触发器维护的汇总表（金额以整数分累加，返回时换算为元）
+STATS_SUMMARY_QUERY = '''
+    SELECT 
+        COALESCE(SUM(amount_count), 0) as total_count,
+        COALESCE(SUM(amount_sum), 0) / 100.0 as total_amount,
+        COALESCE(SUM(amount_sum) * 1.0 / NULLIF(SUM(amount_count), 0), 0) / 100.0 as avg_amount,
+        COALESCE(MAX(amount_max), 0) / 100.0 as max_amount,
+        COALESCE(MIN(amount_min), 0) / 100.0 as min_amount
+    FROM invoice_stats_type
+'''
+STATS_SUMMARY_BY_TYPE_QUERY = STATS_SUMMARY_QUERY + ' WHERE type = ?'
+STATS_BY_TYPE_QUERY = '''
+    SELECT type, invoice_count as count, amount_sum / 100.0 as amount
+    FROM invoice_stats_type
+    ORDER BY type
+'''
+# 最近12个月，month 仍为 yyyymm 字符串
+STATS_BY_MONTH_QUERY = '''
+    SELECT 
+        CAST(month AS TEXT) as month,
+        SUM(invoice_count) as count,
+        SUM(amount_sum) / 100.0 as amount
+    FROM invoice_stats_month
+    GROUP BY month
+    ORDER BY month DESC
+    LIMIT 12
+'''
+RECYCLE_BIN_COUNT_QUERY = 'SELECT COUNT(*) as count FROM invoices WHERE deleted_at IS NOT NULL'
+LIVE_COUNT_QUERY = 'SELECT COALESCE(SUM(invoice_count), 0) FROM invoice_stats_type'
+
+def fts_phrase(keyword):
+    """整个关键词作为一个短语，与 LIKE '%关键词%' 的子串语义一致"""
+    return '"' + keyword.replace('"', '""') + '"'
+
+def bad_plan_steps(plan_details, allow_sort=False):
+    """执行计划中不走索引的全表扫描，以及（不允许排序时的）临时 B 树排序
+
+    统计汇总表每个类型 / 月份只有一行，整表读取是预期行为，不算全表扫描。
+    """
+    bad = []
+    for detail in plan_details:
+        scan = re.fullmatch(r'SCAN (TABLE )?(\w+)', detail)
+        if ('USE TEMP B-TREE' in detail and not allow_sort) or (scan and scan.group(2) not in STATS_TABLES):
+            bad.append(detail)
+    return bad
+
+
+class SqliteInvoiceRepository:
+    """发票和回收站的数据访问层（SQLite 实现）
+
+    所有读写 invoices 及其全文索引、统计汇总表的 SQL 都在这里，接口层只调用下面的方法，
+    不直接拼 SQL。connect 与 ConnectionPool.connection 相同：connect(readonly) 返回
+    用完自动归还的连接；数据库可以是文件，也可以是 ':memory:'（见 ConnectionPool）。
+
+    读方法各自取只读连接；写方法取读写连接并在结束时提交。需要把查重和插入放在
+    同一个事务中时，用 connection() 取连接并作为 conn 传入，由调用方提交。
+    id 列表参数均为整数列表。
+    """
+
+    def __init__(self, connect, fts=True, fts_rank_limit=5000, clock=china_now):
+        self.connect = connect
+        self.fts = fts
+        self.fts_rank_limit = fts_rank_limit
+        self.clock = clock
+        self.fts_enabled = False
+
+    def connection(self, readonly=False):
+        return self.connect(readonly=readonly)
+
+    @contextmanager
+    def _use(self, conn, readonly=False):
+        """传入 conn 时在调用方的事务中执行，否则取一个新连接，写操作结束时提交"""
+        if conn is not None:
+            yield conn
+            return
+        with self.connect(readonly=readonly) as conn:
+            yield conn
+            if not readonly:
+                conn.commit()
+
+    def init_schema(self):
+        """建表、建索引并执行各版本的迁移，可重复调用"""
+        with self._use(None) as conn:
+            cursor = conn.cursor()
+            init_invoice_tables(cursor)
+            if self.fts:
+                self.fts_enabled = init_fts(cursor)
+            init_stats(cursor)
+            init_data_versions(cursor)
+            migrate_recycle_bin(cursor)
+
+    # 上传
+
+    def has_file_hash(self, file_hash, conn=None):
+        with self._use(conn, readonly=True) as conn:
+            return conn.execute(DUPLICATE_HASH_QUERY, (file_hash,)).fetchone() is not None
+
+    def has_invoice_number(self, invoice_number, conn=None):
+        if not invoice_number:
+            return False
+        with self._use(conn, readonly=True) as conn:
+            return conn.execute(DUPLICATE_NUMBER_QUERY, (invoice_number,)).fetchone() is not None
+
+    def insert(self, invoice_type, buyer_name, invoice_data, filename, file_hash, extract_method, conn=None):
+        """写入一张发票，返回新 id"""
+        now = self.clock()
+        typed = typed_columns(invoice_data)
+        with self._use(conn) as conn:
+            cursor = conn.execute(INSERT_QUERY, (
+                invoice_type, buyer_name, invoice_data['invoice_number'],
+                invoice_data['invoice_date'], invoice_data['total_amount'],
+                invoice_data['invoice_content'], invoice_data['seller_name'],
+                invoice_data['bank_name'], invoice_data['bank_account'],
+                filename, file_hash, extract_method, typed['amount_cents'], typed['invoice_ymd'],
+                now, now))
+            return cursor.lastrowid
+
+    # 查询
+
+    def list_page(self, invoice_type, sort_by, order, limit, after=None):
+        """返回 (本页发票, 下一页的 after)；没有更多数据时 after 为 None"""
+        rows = []
+        with self._use(None, readonly=True) as conn:
+            for sql, params in invoice_page_queries(sort_by, order, after):
+                # 多取一条用于判断是否还有下一页
+                rows += conn.execute(sql, [invoice_type, *params, limit + 1 - len(rows)]).fetchall()
+                if len(rows) > limit:
+                    break
+        next_after = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_after = (rows[-1]['sort_key'], rows[-1]['id'])
+        invoices = []
+        for row in rows:
+            invoice = dict(row)
+            del invoice['sort_key']
+            invoices.append(invoice)
+        return invoices, next_after
+
+    def type_totals(self, invoice_type):
+        """该类型未删除发票的总条数和总金额（元）"""
+        with self._use(None, readonly=True) as conn:
+            row = conn.execute(INVOICE_LIST_TOTAL_QUERY, (invoice_type,)).fetchone()
+        return {'total': row['total'] if row else 0, 'total_amount': row['total_amount'] if row else 0.0}
+
+    def get(self, invoice_id):
+        """未删除的发票详情，不存在时返回 None"""
+        with self._use(None, readonly=True) as conn:
+            row = conn.execute(DETAIL_QUERY, (invoice_id,)).fetchone()
+        return dict(row) if row else None
+
+    def iter_export(self, filters, batch_size=1000):
+        """按筛选条件（见 build_export_query）逐批读取导出行（列见 EXPORT_COLUMNS），每次产出至多 batch_size 行；
+        日期或金额格式错误时在第一次取值时抛出 ValueError
+
+        只读连接一直占用到读完或生成器被关闭（如客户端断开下载）为止，内存中只保留一批。
+        """
+        query, params = self.build_export_query(filters)
+        with self._use(None, readonly=True) as conn:
+            cursor = conn.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield [tuple(row) for row in rows]
+
+    def data_version(self, invoice_type):
+        """该类型的数据版本 (version, changed_at)，changed_at 为最后一次写入的 UTC 时间；从未写入过时为 (0, None)"""
+        with self._use(None, readonly=True) as conn:
+            row = conn.execute(DATA_VERSION_QUERY, (invoice_type,)).fetchone()
+        return (row[0], row[1]) if row else (0, None)
+
+    def export_count(self, filters):
+        """按导出筛选条件命中的发票条数（用于后台导出任务的进度）"""
+        query, params = self.build_export_query(filters, ordered=False)
+        with self._use(None, readonly=True) as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM ({query})', params).fetchone()[0]
+
+    def fts_match_is_broad(self, conn, keyword):
+        """关键词在全文索引中的命中是否超过 fts_rank_limit
+
+        高频词命中成千上万行时，bm25 需要给全部命中打分排序，反而比 LIKE 慢：
+        LIKE 沿 created_at 索引扫描，命中密集时很快就能凑满 100 条。探测查询最多只读取
+        fts_rank_limit + 1 个 rowid，不涉及 invoices 表。
+        """
+        row = conn.execute(
+            'SELECT COUNT(*) FROM (SELECT 1 FROM invoices_fts WHERE invoices_fts MATCH ? LIMIT ?)',
+            (fts_phrase(keyword), self.fts_rank_limit + 1),
+        ).fetchone()
+        return row[0] > self.fts_rank_limit
+
+    def search_filters(self, args, use_fts=None):
+        """由搜索参数生成 (FROM 子句, WHERE 条件, 参数)；日期或金额格式错误时抛出 ValueError
+
+        关键词不少于 3 个字符（trigram 的最小长度）时走 invoices_fts 全文索引，否则用 LIKE 匹配；
+        use_fts=False 时总是用 LIKE。
+        """
+        keyword = args.get('keyword', '').strip()
+        invoice_type = args.get('type', '')
+        start_date = args.get('start_date', '')
+        end_date = args.get('end_date', '')
+        min_amount = args.get('min_amount', '')
+        max_amount = args.get('max_amount', '')
+        
+        conditions = ['i.deleted_at IS NULL']
+        params = []
+        if use_fts is None:
+            use_fts = self.fts_enabled
+        use_fts = use_fts and len(keyword) >= 3
+        
+        if use_fts:
+            conditions.append('invoices_fts MATCH ?')
+            params.append(fts_phrase(keyword))
+        elif keyword:
+            conditions.append('''
+                (i.invoice_number LIKE ? OR i.buyer_name LIKE ? OR 
+                 i.seller_name LIKE ? OR i.invoice_content LIKE ?)
+            ''')
+            keyword_param = f'%{keyword}%'
+            params.extend([keyword_param] * 4)
+        
+        if invoice_type:
+            conditions.append('i.type = ?')
+            params.append(invoice_type)
+        
+        for value, op in ((start_date, '>='), (end_date, '<=')):
+            if value:
+                ymd = parse_date_ymd(value)
+                if ymd is None:
+                    raise ValueError(f'日期格式错误: {value}')
+                conditions.append(f'i.invoice_ymd {op} ?')
+                params.append(ymd)
+        
+        for value, op in ((min_amount, '>='), (max_amount, '<=')):
+            if value:
+                cents = parse_amount_cents(value)
+                if cents is None:
+                    raise ValueError(f'金额格式错误: {value}')
+                conditions.append(f'i.amount_cents {op} ?')
+                params.append(cents)
+        
+        if use_fts:
+            # CROSS JOIN 固定以全文索引为外层循环，按命中的 rowid 取行，不会退化为逐行探测 MATCH
+            source = 'invoices_fts CROSS JOIN invoices i ON i.id = invoices_fts.rowid'
+        else:
+            source = 'invoices i'
+        return source, ' AND '.join(conditions), params
+
+    def build_search_query(self, args, use_fts=None):
+        """由搜索参数生成 (SQL, 参数)；日期或金额格式错误时抛出 ValueError
+
+        走全文索引时按 bm25 排序，否则按上传时间倒序；use_fts=False 用于高频词（见 fts_match_is_broad）。
+        """
+        source, where_clause, params = self.search_filters(args, use_fts)
+        if 'invoices_fts' in source:
+            order_by = 'bm25(invoices_fts), i.created_at DESC'
+        else:
+            order_by = 'i.created_at DESC'
+        
+        query = f'''
+            SELECT i.id, i.type, i.buyer_name, i.invoice_number, i.invoice_date, i.total_amount,
+                   i.invoice_content, i.seller_name, i.bank_name, i.bank_account, i.pdf_path, i.created_at
+            FROM {source}
+            WHERE {where_clause}
+            ORDER BY {order_by}
+            LIMIT 100
+        '''
+        return query, params
+
+    def build_export_query(self, filters, ordered=True):
+        """由导出筛选条件生成 (SQL, 参数)；日期或金额格式错误时抛出 ValueError
+
+        filters 与搜索参数相同（keyword、type、start_date、end_date、min_amount、max_amount），
+        另可带 ids（整数列表，只导出其中的发票）。导出全部命中，不限条数，关键词总是走全文索引
+        （无需 bm25 打分，高频词也不会变慢）。按 id（主键）排序，同样的数据无论用哪种筛选条件、
+        走哪个索引，导出的行序都一致：命中的 id 先收集到 IN 子查询的临时索引（只有 id，有序），
+        再按主键逐行取出，不需要对整行做临时 B 树排序。ordered=False 时不排序（只用于计数）。
+        """
+        ids = filters.get('ids')
+        if ids is None:
+            source, where_clause, params = self.search_filters(filters)
+        else:
+            # 勾选的发票一般不多：以 id 列表为外层循环按主键取行，关键词用 LIKE 在这些行上匹配
+            _, where_clause, params = self.search_filters(filters, use_fts=False)
+            source = 'json_each(?) AS picked CROSS JOIN invoices i ON i.id = picked.value'
+            params = [json.dumps(sorted(set(ids))), *params]
+        columns = ', '.join(f'i.{column}' for column in EXPORT_COLUMNS)
+        if not ordered:
+            return f'SELECT {columns} FROM {source} WHERE {where_clause}', params
+        return f'''
+            SELECT {columns} FROM invoices i
+            WHERE i.id IN (SELECT i.id FROM {source} WHERE {where_clause})
+            ORDER BY i.id
+        ''', params
+
+    def search(self, args):
+        """按搜索参数查询，最多 100 条；日期或金额格式错误时抛出 ValueError"""
+        with self._use(None, readonly=True) as conn:
+            use_fts = self.fts_enabled
+            keyword = args.get('keyword', '').strip()
+            if use_fts and len(keyword) >= 3 and self.fts_match_is_broad(conn, keyword):
+                use_fts = False
+            query, params = self.build_search_query(args, use_fts=use_fts)
+            return [dict(row) for row in conn.execute(query, params)]
+
+    def statistics(self, invoice_type=''):
+        """汇总统计、按类型、按最近 12 个月统计，以及回收站条数"""
+        with self._use(None, readonly=True) as conn:
+            cursor = conn.cursor()
+            
+            # 基础统计
+            if invoice_type:
+                cursor.execute(STATS_SUMMARY_BY_TYPE_QUERY, (invoice_type,))
+            else:
+                cursor.execute(STATS_SUMMARY_QUERY)
+            
+            stats = dict(cursor.fetchone())
+            
+            # 按类型分组统计
+            cursor.execute(STATS_BY_TYPE_QUERY)
+            stats['by_type'] = [dict(row) for row in cursor.fetchall()]
+            
+            # 按月份统计
+            cursor.execute(STATS_BY_MONTH_QUERY)
+            stats['by_month'] = [dict(row) for row in cursor.fetchall()]
+            
+            # 回收站统计
+            cursor.execute(RECYCLE_BIN_COUNT_QUERY)
+            stats['recycle_bin_count'] = cursor.fetchone()['count']
+        return stats
+
+    def live_count(self):
+        """未删除发票的条数"""
+        with self._use(None, readonly=True) as conn:
+            return conn.execute(LIVE_COUNT_QUERY).fetchone()[0]
+
+    def recycle_bin(self, invoice_type):
+        """回收站中该类型的发票，按删除时间倒序"""
+        with self._use(None, readonly=True) as conn:
+            return [dict(row) for row in conn.execute(RECYCLE_BIN_LIST_QUERY, (invoice_type,))]
+
+    # 修改
+
+    def update(self, invoice_id, fields):
+        """更新一张未删除的发票，金额 / 日期同时更新类型化列；发票不存在时返回 False"""
+        fields = dict(fields)
+        fields.update(typed_columns(fields))
+        fields['updated_at'] = self.clock()
+        set_clause = ', '.join([f'{k} = ?' for k in fields.keys()])
+        with self._use(None) as conn:
+            cursor = conn.execute(f'UPDATE invoices SET {set_clause} WHERE id = ? AND deleted_at IS NULL',
+                                  list(fields.values()) + [invoice_id])
+            return cursor.rowcount > 0
+
+    def batch_update(self, ids, fields):
+        """批量更新未删除的发票，返回实际更新的条数"""
+        fields = dict(fields, updated_at=self.clock())
+        set_clause = ', '.join([f'{k} = ?' for k in fields.keys()])
+        with self._use(None) as conn:
+            cursor = conn.execute(f'UPDATE invoices SET {set_clause} WHERE {LIVE_IDS_CONDITION}',
+                                  list(fields.values()) + [json.dumps(ids)])
+            return cursor.rowcount
+
+    def soft_delete(self, ids):
+        """移入回收站，返回实际移入的条数"""
+        with self._use(None) as conn:
+            return conn.execute(SOFT_DELETE_QUERY, (self.clock(), json.dumps(ids))).rowcount
+
+    def restore(self, ids):
+        """从回收站恢复，id 不变，返回实际恢复的条数"""
+        with self._use(None) as conn:
+            return conn.execute(RESTORE_QUERY, (json.dumps(ids),)).rowcount
+
+    def purge(self, ids):
+        """彻底删除回收站中的发票，返回 (删除条数, 需要删除的 PDF 文件名)"""
+        ids_json = json.dumps(ids)
+        with self._use(None) as conn:
+            # 先拿写锁再查询，查出的文件和删除的行一致，期间不会被恢复或新移入
+            conn.execute('BEGIN IMMEDIATE')
+            pdf_paths = [row['pdf_path'] for row in conn.execute(PERMANENT_DELETE_FILES_QUERY, (ids_json,))]
+            count = conn.execute(PERMANENT_DELETE_QUERY, (ids_json,)).rowcount
+        return count, pdf_paths
+
+    def empty_recycle_bin(self, invoice_type=None):
+        """清空回收站（可按类型），返回 (删除条数, 需要删除的 PDF 文件名)"""
+        condition, params = 'deleted_at IS NOT NULL', ()
+        if invoice_type:
+            condition, params = 'type = ? AND deleted_at IS NOT NULL', (invoice_type,)
+        with self._use(None) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            pdf_paths = [row['pdf_path'] for row in conn.execute(f'SELECT pdf_path FROM invoices WHERE {condition}', params)]
+            count = conn.execute(f'DELETE FROM invoices WHERE {condition}', params).rowcount
+        return count, pdf_paths
+
+    def purge_expired_batch(self, cutoff, batch_size):
+        """彻底删除一批删除时间早于 cutoff 的发票（一个短的写事务），返回被删除行的 [{id, pdf_path}]"""
+        with self.connect() as conn:
+            # 先拿写锁再查询，查出的行在删除前不会被恢复
+            conn.execute('BEGIN IMMEDIATE')
+            rows = [dict(row) for row in conn.execute(RETENTION_BATCH_QUERY, (cutoff, batch_size))]
+            if rows:
+                conn.execute(RETENTION_DELETE_QUERY, (json.dumps([row['id'] for row in rows]),))
+            conn.commit()
+        return rows
+
+    # 维护
+
+    def rebuild_stats(self):
+        with self._use(None) as conn:
+            rebuild_stats(conn.cursor())
+
+    def stats_mismatches(self):
+        with self._use(None, readonly=True) as conn:
+            return stats_mismatches(conn.cursor())
+
+    def query_plan_checks(self):
+        """各接口执行的查询及示例参数，用于检查执行计划：[(名称, SQL, 参数, 是否允许排序)]
+
+        带日期 / 金额范围的搜索先用范围索引缩小结果集，全文检索按 bm25 相关度排序，
+        都只对命中的行排序取前 100 条，这类查询允许出现临时 B 树排序。
+        """
+        checks = []
+        for sort_by, column in INVOICE_SORT_COLUMNS.items():
+            sample = 20240101 if column in ('invoice_ymd', 'amount_cents') else '2024-01-01'
+            for order in ('ASC', 'DESC'):
+                afters = [('', None), (' after value', (sample, 1))]
+                if column not in INVOICE_NOT_NULL_SORT_COLUMNS:
+                    afters.append((' after null', (None, 1)))
+                for label, after in afters:
+                    for sql, params in invoice_page_queries(sort_by, order, after):
+                        checks.append((f'list {sort_by} {order}{label}', sql, ('自费', *params, 50), False))
+        checks += [
+            ('list total', INVOICE_LIST_TOTAL_QUERY, ('自费',), False),
+            ('detail', DETAIL_QUERY, (1,), False),
+            ('duplicate hash', DUPLICATE_HASH_QUERY, ('0' * 32,), False),
+            ('duplicate number', DUPLICATE_NUMBER_QUERY, ('12345678',), False),
+            ('soft delete', SOFT_DELETE_QUERY, ('2024-01-01 00:00:00', '[1, 2]'), False),
+            ('restore', RESTORE_QUERY, ('[1, 2]',), False),
+            ('recycle list', RECYCLE_BIN_LIST_QUERY, ('自费',), False),
+            ('retention batch', RETENTION_BATCH_QUERY, ('2024-01-01 00:00:00', 500), False),
+            ('retention delete', RETENTION_DELETE_QUERY, ('[1, 2]',), False),
+            ('recycle count', RECYCLE_BIN_COUNT_QUERY, (), False),
+            ('live count', LIVE_COUNT_QUERY, (), False),
+            ('data version', DATA_VERSION_QUERY, ('自费',), False),
+            ('stats summary', STATS_SUMMARY_QUERY, (), False),
+            ('stats summary by type', STATS_SUMMARY_BY_TYPE_QUERY, ('自费',), False),
+            ('stats by type', STATS_BY_TYPE_QUERY, (), False),
+            ('stats by month', STATS_BY_MONTH_QUERY, (), True),  # 对汇总后的月份排序，至多几百行
+        ]
+        search_args = [
+            {},
+            {'type': '自费'},
+            {'keyword': '餐饮'},
+            {'keyword': '餐饮', 'type': '自费'},
+            {'keyword': '餐饮服务'},
+            {'keyword': '餐饮服务', 'type': '自费', 'start_date': '2024-01-01'},
+            {'type': '自费', 'start_date': '2024-01-01', 'end_date': '2024-12-31'},
+            {'start_date': '2024-01-01', 'end_date': '2024-12-31'},
+            {'type': '自费', 'min_amount': '100', 'max_amount': '1000'},
+            {'min_amount': '100', 'max_amount': '1000'},
+        ]
+        for args in search_args:
+            sql, params = self.build_search_query(args)
+            allow_sort = 'invoices_fts' in sql or any(
+                key in args for key in ('start_date', 'end_date', 'min_amount', 'max_amount'))
+            name = f"search {'+'.join(args) or 'all'}" + (' (fts)' if 'invoices_fts' in sql else '')
+            checks.append((name, sql, params, allow_sort))
+        export_args = [
+            {'type': '自费'},
+            {'type': '自费', 'keyword': '餐饮'},
+            {'type': '自费', 'keyword': '餐饮服务'},
+            {'type': '自费', 'start_date': '2024-01-01', 'end_date': '2024-01-31'},
+            {'type': '自费', 'min_amount': '100', 'max_amount': '1000'},
+            {'type': '自费', 'ids': [1, 2]},
+        ]
+        for args in export_args:
+            sql, params = self.build_export_query(args)
+            name = f"export {'+'.join(args)}" + (' (fts)' if 'invoices_fts' in sql else '')
+            checks.append((name, sql, params, False))
+        return checks
@@ -0,0 +1,88 @@
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicTask:
+    """在后台线程中按固定间隔执行 func
+
+    start() 之后等待 initial_delay 秒（默认一个间隔）执行第一次；run_now() 在调用线程中立即执行一次，
+    与后台执行互斥。func 的返回值（dict）记录为最近一次运行的结果，可通过 stats() 查询。
+    """
+
+    def __init__(self, name, func, interval, initial_delay=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.initial_delay = interval if initial_delay is None else initial_delay
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self.runs = 0
+        self.failures = 0
+        self.last_started_at = None
+        self.last_finished_at = None
+        self.last_duration_ms = None
+        self.last_result = None
+        self.last_error = None
+        self.next_run_at = None
+
+    def start(self):
+        if self._thread or self.interval <= 0:
+            return
+        self._thread = threading.Thread(target=self._loop, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self.next_run_at = None
+
+    def _loop(self):
+        delay = self.initial_delay
+        while True:
+            self.next_run_at = time.time() + delay
+            if self._stop.wait(delay):
+                break
+            delay = self.interval
+            try:
+                self.run_now()
+            except Exception:
+                # 错误已记录在 last_error 中，下一个间隔继续执行
+                pass
+
+    def run_now(self):
+        with self._run_lock:
+            self.last_started_at = time.time()
+            start = time.perf_counter()
+            try:
+                result = self.func()
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                logger.error(f'定时任务 {self.name} 失败: {str(e)}')
+                raise
+            else:
+                self.last_result = result
+                self.last_error = None
+                return result
+            finally:
+                self.runs += 1
+                self.last_finished_at = time.time()
+                self.last_duration_ms = round((time.perf_counter() - start) * 1000, 1)
+
+    def stats(self):
+        return {
+            'name': self.name,
+            'interval': self.interval,
+            'running': bool(self._thread and self._thread.is_alive()),
+            'runs': self.runs,
+            'failures': self.failures,
+            'last_started_at': self.last_started_at,
+            'last_finished_at': self.last_finished_at,
+            'last_duration_ms': self.last_duration_ms,
+            'last_result': self.last_result,
+            'last_error': self.last_error,
+            'next_run_at': self.next_run_at,
+        }